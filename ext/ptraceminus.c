@@ -22,6 +22,12 @@
 #include <sys/ptrace.h>
 #include <sys/reg.h>
 #include <sys/user.h>
+#include <sys/syscall.h>
+#include <sys/uio.h>
+#include <sys/wait.h>
+#include <signal.h>
+#include <stdlib.h>
+#include <unistd.h>
 
 #ifdef _MSC_VER
 #ifdef _M_X86
@@ -65,6 +71,24 @@ static char *x86_64_reg_names[] = {
 
 #define ARRAY_SIZE(a) (sizeof(a) / sizeof(a[0]))
 
+/* Offset of the instruction pointer in the USER area */
+#if defined(ARCH_X86)
+#define PC_OFFSET (4 * EIP)
+#elif defined(ARCH_X86_64)
+#define PC_OFFSET (8 * RIP)
+#endif
+
+#define INT3 0xcc
+
+/* Reasons for the end of a single-stepping loop */
+enum {
+	STEP_COUNT = 0,
+	STEP_ADDRESS,
+	STEP_SYSCALL,
+	STEP_FULL,
+	STEP_SIGNAL,
+};
+
 typedef struct RegisterStore {
 	PyObject_HEAD
 	PyObject *regs;
@@ -553,7 +577,7 @@ ptrace_wrap2_return(int request, PyObject *self, PyObject *args)
 	if (errno != 0)
 		return PyErr_SetFromErrno(PyExc_OSError);
 
-	return PyLong_FromUnsignedLong(result & 0xffff);
+	return PyLong_FromUnsignedLong(result);
 }
 
 PyDoc_STRVAR(ptrace_peektext__doc__,
@@ -695,6 +719,55 @@ ptrace_getscnr(PyObject *self, PyObject *args)
 	return PyLong_FromLong(result);
 }
 
+PyDoc_STRVAR(ptrace_getscret__doc__,
+             "getscret(pid) -> int\n\n"
+             "Reads the return value of a system call for a child process.");
+
+static PyObject*
+ptrace_getscret(PyObject *self, PyObject *args)
+{
+	pid_t pid = 0;
+	long addr = 0;
+	long result = 0;
+
+	if (!PyArg_ParseTuple(args, "i", &pid))
+		return NULL;
+
+#if defined(ARCH_X86)
+	addr = 4 * EAX;
+#elif defined(ARCH_X86_64)
+	addr = 8 * RAX;
+#endif
+	errno = 0;
+	result = ptrace(PTRACE_PEEKUSER, pid, addr, NULL);
+
+	if (errno != 0)
+		return PyErr_SetFromErrno(PyExc_OSError);
+
+	return PyLong_FromLong(result);
+}
+
+PyDoc_STRVAR(ptrace_tkill__doc__,
+             "tkill(tid, signum) -> None\n\n"
+             "Sends a signal to a single thread, unlike os.kill() which\n"
+             "sends it to the whole thread group.");
+
+static PyObject*
+ptrace_tkill(PyObject *self, PyObject *args)
+{
+	pid_t tid = 0;
+	int signum = 0;
+
+	if (!PyArg_ParseTuple(args, "ii", &tid, &signum))
+		return NULL;
+
+	if (syscall(SYS_tkill, tid, signum) < 0)
+		return PyErr_SetFromErrno(PyExc_OSError);
+
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
 static int
 _ptrace_getdata(pid_t pid, void *addr, void *buffer, size_t size)
 {
@@ -765,6 +838,50 @@ _ptrace_getstr(pid_t pid, void *addr)
 	return obj;
 }
 
+PyDoc_STRVAR(ptrace_getdata__doc__,
+             "getdata(pid, addr, size) -> bytes\n\n"
+             "Reads size bytes stored at given address, with a single\n"
+             "process_vm_readv() call if possible.");
+
+static PyObject*
+ptrace_getdata(PyObject *self, PyObject *args)
+{
+	pid_t pid = 0;
+	long addr = 0;
+	Py_ssize_t size = 0;
+	PyObject *obj = NULL;
+	struct iovec local, remote;
+	ssize_t count;
+
+	if (!PyArg_ParseTuple(args, "ikn", &pid, &addr, &size))
+		return NULL;
+
+	if (size < 0) {
+		PyErr_SetString(PyExc_ValueError, "negative size");
+		return NULL;
+	}
+
+	obj = PyBytes_FromStringAndSize(NULL, size);
+	if (obj == NULL || size == 0)
+		return obj;
+
+	local.iov_base = PyBytes_AS_STRING(obj);
+	local.iov_len = size;
+	remote.iov_base = (void *)addr;
+	remote.iov_len = size;
+
+	count = process_vm_readv(pid, &local, 1, &remote, 1, 0);
+	if (count == size)
+		return obj;
+
+	if (_ptrace_getdata(pid, (void *)addr, local.iov_base, size) != 0) {
+		Py_DECREF(obj);
+		return PyErr_SetFromErrno(PyExc_OSError);
+	}
+
+	return obj;
+}
+
 PyDoc_STRVAR(ptrace_getstr__doc__,
              "getstr(pid, addr) -> str\n\n"
              "Reads a character string stored at given address.");
@@ -839,6 +956,382 @@ ptrace_getstrv(PyObject *self, PyObject *args)
 	return list;
 }
 
+static int
+_compare_addresses(const void *a, const void *b)
+{
+	unsigned long x = *(const unsigned long *)a;
+	unsigned long y = *(const unsigned long *)b;
+
+	return (x > y) - (x < y);
+}
+
+static inline int
+_is_syscall_insn(long text)
+{
+	/* syscall, sysenter and int $0x80, read in little endian */
+	switch (text & 0xffff) {
+	case 0x050f:
+	case 0x340f:
+	case 0x80cd:
+		return 1;
+	default:
+		return 0;
+	}
+}
+
+/*
+ * Single-step a process until n instructions are executed (unlimited if n is
+ * 0), the next instruction is at one of the sorted addresses, a system call
+ * is executed, the buffer of addresses is full or the process is stopped
+ * otherwise.
+ *
+ * Returns the reason (STEP_*), or -1 with errno set.
+ */
+static int
+_ptrace_step(pid_t pid, size_t n, int signum,
+             const unsigned long *stops, size_t n_stops,
+             unsigned long *buffer, size_t capacity,
+             size_t *count, int *status)
+{
+	unsigned long pc;
+	long text;
+	int is_syscall;
+
+	*count = 0;
+	*status = 0;
+
+	errno = 0;
+	pc = ptrace(PTRACE_PEEKUSER, pid, PC_OFFSET, NULL);
+	if (errno != 0)
+		return -1;
+
+	while (1) {
+		if (n && *count == n)
+			return STEP_COUNT;
+		if (buffer != NULL && *count == capacity)
+			return STEP_FULL;
+
+		text = ptrace(PTRACE_PEEKTEXT, pid, pc, NULL);
+		if (errno != 0)
+			return -1;
+		is_syscall = _is_syscall_insn(text);
+
+		if (ptrace(PTRACE_SINGLESTEP, pid, NULL, signum) == -1)
+			return -1;
+		signum = 0;
+		if (waitpid(pid, status, __WALL) == -1)
+			return -1;
+		if (!WIFSTOPPED(*status) || (*status >> 8) != SIGTRAP)
+			return STEP_SIGNAL;
+
+		if (buffer != NULL)
+			buffer[*count] = pc;
+		(*count)++;
+
+		pc = ptrace(PTRACE_PEEKUSER, pid, PC_OFFSET, NULL);
+		if (errno != 0)
+			return -1;
+		if (n_stops && bsearch(&pc, stops, n_stops, sizeof(*stops),
+		                       _compare_addresses) != NULL)
+			return STEP_ADDRESS;
+		if (is_syscall)
+			return STEP_SYSCALL;
+	}
+}
+
+static PyObject*
+ptrace_step_common(pid_t pid, Py_ssize_t n, PyObject *addresses,
+                   PyObject *bufobj, int signum)
+{
+	unsigned long *stops = NULL;
+	size_t n_stops = 0;
+	Py_buffer view = { NULL, };
+	unsigned long *buffer = NULL;
+	size_t capacity = 0;
+	size_t count = 0;
+	int status = 0;
+	int reason;
+	int err;
+	PyObject *seq = NULL;
+	Py_ssize_t i;
+
+	if (n < 0) {
+		PyErr_SetString(PyExc_ValueError, "negative count");
+		return NULL;
+	}
+
+	if (bufobj != NULL && bufobj != Py_None) {
+		if (PyObject_GetBuffer(bufobj, &view, PyBUF_WRITABLE) == -1)
+			return NULL;
+		buffer = (unsigned long *)view.buf;
+		capacity = view.len / sizeof(*buffer);
+		if (capacity == 0) {
+			PyBuffer_Release(&view);
+			PyErr_SetString(PyExc_ValueError, "buffer too small");
+			return NULL;
+		}
+	}
+
+	if (addresses != NULL) {
+		seq = PySequence_Fast(addresses, "addresses must be iterable");
+		if (seq == NULL)
+			goto fail;
+		n_stops = PySequence_Fast_GET_SIZE(seq);
+		stops = (unsigned long *)calloc(n_stops + 1, sizeof(*stops));
+		if (stops == NULL) {
+			Py_DECREF(seq);
+			PyErr_NoMemory();
+			goto fail;
+		}
+		for (i = 0; i < n_stops; i++) {
+			stops[i] = PyLong_AsUnsignedLong(
+			                   PySequence_Fast_GET_ITEM(seq, i));
+			if (PyErr_Occurred()) {
+				Py_DECREF(seq);
+				goto fail;
+			}
+		}
+		Py_DECREF(seq);
+		qsort(stops, n_stops, sizeof(*stops), _compare_addresses);
+	}
+
+	Py_BEGIN_ALLOW_THREADS
+	reason = _ptrace_step(pid, n, signum, stops, n_stops, buffer, capacity,
+	                      &count, &status);
+	err = errno;
+	Py_END_ALLOW_THREADS
+
+	free(stops);
+	if (buffer != NULL)
+		PyBuffer_Release(&view);
+
+	if (reason == -1) {
+		errno = err;
+		return PyErr_SetFromErrno(PyExc_OSError);
+	}
+
+	return Py_BuildValue("(ini)", reason, (Py_ssize_t)count, status);
+
+fail:
+	free(stops);
+	if (buffer != NULL)
+		PyBuffer_Release(&view);
+	return NULL;
+}
+
+PyDoc_STRVAR(ptrace_singlestep_n__doc__,
+             "singlestep_n(pid, n, buffer=None, signum=0) -> tuple\n\n"
+             "Single-steps the stopped child up to n instructions, in a\n"
+             "loop running in the extension. The addresses of the executed\n"
+             "instructions are written as unsigned longs to the writable\n"
+             "buffer, if given. The loop also ends after a system call\n"
+             "instruction, when the buffer is full or when the child is\n"
+             "stopped by a signal or an event, or exits. Returns the reason\n"
+             "(STEP_* constant), the number of instructions executed and the\n"
+             "last status of the child.");
+
+static PyObject*
+ptrace_singlestep_n(PyObject *self, PyObject *args)
+{
+	pid_t pid = 0;
+	Py_ssize_t n = 0;
+	PyObject *buffer = NULL;
+	int signum = 0;
+
+	if (!PyArg_ParseTuple(args, "in|Oi", &pid, &n, &buffer, &signum))
+		return NULL;
+
+	if (n == 0)
+		return Py_BuildValue("(ini)", STEP_COUNT, (Py_ssize_t)0, 0);
+
+	return ptrace_step_common(pid, n, NULL, buffer, signum);
+}
+
+PyDoc_STRVAR(ptrace_step_until__doc__,
+             "step_until(pid, addresses, limit=0, buffer=None, signum=0)\n"
+             "-> tuple\n\n"
+             "Single-steps the stopped child as for singlestep_n(), until\n"
+             "the next instruction is at one of the addresses, or limit\n"
+             "instructions are executed (unlimited if 0).");
+
+static PyObject*
+ptrace_step_until(PyObject *self, PyObject *args)
+{
+	pid_t pid = 0;
+	PyObject *addresses = NULL;
+	Py_ssize_t limit = 0;
+	PyObject *buffer = NULL;
+	int signum = 0;
+
+	if (!PyArg_ParseTuple(args, "iO|nOi", &pid, &addresses, &limit, &buffer,
+	                      &signum))
+		return NULL;
+
+	return ptrace_step_common(pid, limit, addresses, buffer, signum);
+}
+
+static int
+_ptrace_poke_byte(pid_t pid, unsigned long addr, unsigned char byte)
+{
+	long word;
+
+	errno = 0;
+	word = ptrace(PTRACE_PEEKTEXT, pid, addr, NULL);
+	if (errno != 0)
+		return -1;
+	word = (word & ~0xffUL) | byte;
+	if (ptrace(PTRACE_POKETEXT, pid, addr, word) == -1)
+		return -1;
+	return 0;
+}
+
+/*
+ * Execute the instruction replaced by a breakpoint: restore its first byte,
+ * rewind the instruction pointer, single-step, then insert the breakpoint
+ * again if the process is still alive.
+ */
+static int
+_ptrace_stepover(pid_t pid, unsigned long addr, unsigned char original,
+                 int signum, int *status)
+{
+	if (_ptrace_poke_byte(pid, addr, original) == -1)
+		return -1;
+	if (ptrace(PTRACE_POKEUSER, pid, PC_OFFSET, addr) == -1)
+		return -1;
+	if (ptrace(PTRACE_SINGLESTEP, pid, NULL, signum) == -1)
+		return -1;
+	if (waitpid(pid, status, __WALL) == -1)
+		return -1;
+	if (WIFSTOPPED(*status))
+		return _ptrace_poke_byte(pid, addr, INT3);
+	return 0;
+}
+
+PyDoc_STRVAR(ptrace_stepover__doc__,
+             "stepover(pid, addr, original, signum=0) -> int\n\n"
+             "Executes the instruction at addr of the stopped child, whose\n"
+             "first byte is replaced by a breakpoint, and inserts the\n"
+             "breakpoint again. Returns the status of the child after the\n"
+             "step.");
+
+static PyObject*
+ptrace_stepover(PyObject *self, PyObject *args)
+{
+	pid_t pid = 0;
+	unsigned long addr = 0;
+	unsigned char original = 0;
+	int signum = 0;
+	int status = 0;
+	int result;
+
+	if (!PyArg_ParseTuple(args, "ikb|i", &pid, &addr, &original, &signum))
+		return NULL;
+
+	result = _ptrace_stepover(pid, addr, original, signum, &status);
+	if (result == -1)
+		return PyErr_SetFromErrno(PyExc_OSError);
+
+	return PyLong_FromLong(status);
+}
+
+/*
+ * Resume a process until it stops for another reason than one of the
+ * breakpoints, counting their hits. The addresses are sorted.
+ */
+static int
+_ptrace_cont_breakpoints(pid_t pid, int signum, const unsigned long *addrs,
+                         const unsigned char *originals, unsigned long *hits,
+                         size_t n, int *status)
+{
+	unsigned long *found;
+	unsigned long pc;
+	size_t i;
+
+	while (1) {
+		if (ptrace(PTRACE_CONT, pid, NULL, signum) == -1)
+			return -1;
+		if (waitpid(pid, status, __WALL) == -1)
+			return -1;
+		if (!WIFSTOPPED(*status) || (*status >> 8) != SIGTRAP)
+			return 0;
+
+		errno = 0;
+		pc = ptrace(PTRACE_PEEKUSER, pid, PC_OFFSET, NULL);
+		if (errno != 0)
+			return -1;
+		pc--;
+		found = bsearch(&pc, addrs, n, sizeof(*addrs),
+		                _compare_addresses);
+		if (found == NULL)
+			return 0;
+		i = found - addrs;
+		hits[i]++;
+
+		if (_ptrace_stepover(pid, pc, originals[i], 0, status) == -1)
+			return -1;
+		if (!WIFSTOPPED(*status))
+			return 0;
+		/* A signal arrived during the step: let the caller deliver it */
+		if ((*status >> 8) != SIGTRAP)
+			return 0;
+		signum = 0;
+	}
+}
+
+PyDoc_STRVAR(ptrace_cont_breakpoints__doc__,
+             "cont_breakpoints(pid, addrs, originals, hits, signum=0)"
+             " -> int\n\n"
+             "Restarts the stopped child as for cont(), handling the hits\n"
+             "of its counting breakpoints in the extension: addrs is a\n"
+             "buffer of their sorted addresses (unsigned longs), originals\n"
+             "the bytes they replaced and hits a writable buffer of\n"
+             "unsigned longs, incremented on each hit. Returns the status\n"
+             "of the child when it stops for another reason.");
+
+static PyObject*
+ptrace_cont_breakpoints(PyObject *self, PyObject *args)
+{
+	pid_t pid = 0;
+	Py_buffer addrs = { NULL, };
+	Py_buffer originals = { NULL, };
+	Py_buffer hits = { NULL, };
+	int signum = 0;
+	int status = 0;
+	size_t n;
+	int result;
+	int err;
+
+	if (!PyArg_ParseTuple(args, "iy*y*w*|i", &pid, &addrs, &originals,
+	                      &hits, &signum))
+		return NULL;
+
+	n = addrs.len / sizeof(unsigned long);
+	if (originals.len < n || hits.len / sizeof(unsigned long) < n) {
+		PyBuffer_Release(&addrs);
+		PyBuffer_Release(&originals);
+		PyBuffer_Release(&hits);
+		PyErr_SetString(PyExc_ValueError, "buffers too small");
+		return NULL;
+	}
+
+	Py_BEGIN_ALLOW_THREADS
+	result = _ptrace_cont_breakpoints(pid, signum, addrs.buf, originals.buf,
+	                                  hits.buf, n, &status);
+	err = errno;
+	Py_END_ALLOW_THREADS
+
+	PyBuffer_Release(&addrs);
+	PyBuffer_Release(&originals);
+	PyBuffer_Release(&hits);
+
+	if (result == -1) {
+		errno = err;
+		return PyErr_SetFromErrno(PyExc_OSError);
+	}
+
+	return PyLong_FromLong(status);
+}
+
 static PyMethodDef
 ptraceminus_methods[] = {
 	{ "traceme", ptrace_traceme, METH_VARARGS, ptrace_traceme__doc__ },
@@ -858,8 +1351,18 @@ ptraceminus_methods[] = {
 	{ "peekuser", ptrace_peekuser, METH_VARARGS, ptrace_peekuser__doc__ },
 	{ "getregs", ptrace_getregs, METH_VARARGS, ptrace_getregs__doc__ },
 	{ "getscnr", ptrace_getscnr, METH_VARARGS, ptrace_getscnr__doc__ },
+	{ "getscret", ptrace_getscret, METH_VARARGS, ptrace_getscret__doc__ },
+	{ "getdata", ptrace_getdata, METH_VARARGS, ptrace_getdata__doc__ },
 	{ "getstr", ptrace_getstr, METH_VARARGS, ptrace_getstr__doc__ },
 	{ "getstrv", ptrace_getstrv, METH_VARARGS, ptrace_getstrv__doc__ },
+	{ "tkill", ptrace_tkill, METH_VARARGS, ptrace_tkill__doc__ },
+	{ "singlestep_n", ptrace_singlestep_n, METH_VARARGS,
+	  ptrace_singlestep_n__doc__ },
+	{ "step_until", ptrace_step_until, METH_VARARGS,
+	  ptrace_step_until__doc__ },
+	{ "stepover", ptrace_stepover, METH_VARARGS, ptrace_stepover__doc__ },
+	{ "cont_breakpoints", ptrace_cont_breakpoints, METH_VARARGS,
+	  ptrace_cont_breakpoints__doc__ },
 	{ NULL, NULL, 0, NULL },
 };
 
@@ -905,6 +1408,15 @@ PyInit_ptraceminus(void)
 	PyModule_AddIntConstant(m, "EVENT_EXEC", PTRACE_EVENT_EXEC);
 	PyModule_AddIntConstant(m, "EVENT_FORK", PTRACE_EVENT_FORK);
 	PyModule_AddIntConstant(m, "EVENT_VFORK", PTRACE_EVENT_VFORK);
+	PyModule_AddIntConstant(m, "EVENT_CLONE", PTRACE_EVENT_CLONE);
+
+	PyModule_AddIntConstant(m, "STEP_COUNT", STEP_COUNT);
+	PyModule_AddIntConstant(m, "STEP_ADDRESS", STEP_ADDRESS);
+	PyModule_AddIntConstant(m, "STEP_SYSCALL", STEP_SYSCALL);
+	PyModule_AddIntConstant(m, "STEP_FULL", STEP_FULL);
+	PyModule_AddIntConstant(m, "STEP_SIGNAL", STEP_SIGNAL);
+
+	PyModule_AddIntConstant(m, "PC_OFFSET", PC_OFFSET);
 
 	PyModule_AddIntConstant(m, "CPU_TYPE_UNKNOWN", CPU_TYPE_UNKNOWN);
 	PyModule_AddIntConstant(m, "CPU_TYPE_X86", CPU_TYPE_X86);
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Analysis of the process timelines
+
+The processes of a build form a tree: a parent forks its children, then
+usually waits for them. From the start and exit times of the processes, the
+critical path of the tree, the parallelism over time and the exclusive time
+of each process are computed.
+
+A process is active when it is alive and none of its children are: its
+exclusive time is the time it is active, and the parallelism is the number
+of active processes.
+"""
+
+import os
+import bisect
+from gettext import gettext as _
+
+
+class ProcessNode(object):
+    """Node of the process tree.
+
+    The times are given in seconds, relative to the start of the first
+    process.
+    """
+    __slots__ = ['pid', 'ppid', 'name', 'start', 'exec_time', 'end',
+                 'children', 'exclusive']
+
+    def __init__(self, pid, ppid, name, start, exec_time, end):
+        self.pid = pid
+        self.ppid = ppid
+        self.name = name
+        self.start = start
+        self.exec_time = exec_time
+        self.end = end
+        self.children = []
+        self.exclusive = 0.0
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def as_dict(self):
+        return {
+            'pid': self.pid,
+            'ppid': self.ppid,
+            'name': self.name,
+            'start': self.start,
+            'exec': self.exec_time,
+            'end': self.end,
+            'exclusive': self.exclusive,
+        }
+
+
+class ProcessAnalysis(object):
+    """Result of the analysis of the processes.
+
+    `critical_path` is made of (node, start, end) segments, in chronological
+    order, and `parallelism` of (time, number of active processes) steps.
+    `levels` maps a number of active processes to the time spent with it.
+    """
+    __slots__ = ['processes', 'wall_time', 'critical_path', 'parallelism',
+                 'levels']
+
+    def __init__(self):
+        self.processes = []
+        self.wall_time = 0.0
+        self.critical_path = []
+        self.parallelism = []
+        self.levels = {}
+
+    @property
+    def average_parallelism(self):
+        if not self.wall_time:
+            return 0.0
+        return sum(n.exclusive for n in self.processes) / self.wall_time
+
+    def most_exclusive(self, n=None):
+        """Return the processes with the most exclusive time"""
+        nodes = sorted(self.processes, key=lambda p: -p.exclusive)
+        if n is not None:
+            nodes = nodes[:n]
+        return nodes
+
+    def critical_processes(self, n=None):
+        """Return the processes of the critical path, with their time on it.
+
+        :param n: maximum number of processes (or None for all).
+        :type n: int.
+
+        :returns: the (node, time) tuples, the longest first.
+        :rtype: list of tuple.
+        """
+        times = {}
+        for node, start, end in self.critical_path:
+            times[node] = times.get(node, 0.0) + end - start
+        items = sorted(times.items(), key=lambda i: -i[1])
+        if n is not None:
+            items = items[:n]
+        return items
+
+    def as_dict(self):
+        return {
+            'wall_time': self.wall_time,
+            'average_parallelism': self.average_parallelism,
+            'processes': [n.as_dict() for n in self.processes],
+            'critical_path': [{'pid': n.pid, 'name': n.name, 'start': s,
+                               'end': e} for n, s, e in self.critical_path],
+            'parallelism': [list(s) for s in self.parallelism],
+            'levels': dict((str(level), t) for level, t in
+                           sorted(self.levels.items())),
+        }
+
+
+def build_process_tree(infos, end_time):
+    """Build the tree of the processes from their information.
+
+    A process identifier can be reused during a long trace: the parent of a
+    process is the one with its parent identifier which was started last
+    before it.
+
+    :param infos: the processes.
+    :type infos: list of :class:`ptraceplus.extra.ProcessInfo`.
+
+    :param end_time: the end time of the processes which have not exited.
+    :type end_time: float.
+
+    :returns: the nodes, ordered by start time.
+    :rtype: list of :class:`ProcessNode`.
+    """
+    infos = sorted(infos, key=lambda i: i.start_time)
+    if not infos:
+        return []
+    origin = infos[0].start_time
+    nodes = []
+    by_pid = {}
+    for info in infos:
+        parent = None
+        candidates = by_pid.get(info.ppid)
+        if candidates:
+            starts = [c.start for c in candidates]
+            index = bisect.bisect_right(starts, info.start_time - origin)
+            if index:
+                parent = candidates[index - 1]
+        if info.args:
+            name = os.path.basename(info.args[0])
+        elif parent is not None:
+            name = parent.name
+        else:
+            name = '?'
+        end = info.exit_time if info.exit_time is not None else end_time
+        exec_time = info.exec_time
+        if exec_time is not None:
+            exec_time -= origin
+        node = ProcessNode(info.pid, info.ppid, name,
+                           info.start_time - origin, exec_time,
+                           max(end, info.start_time) - origin)
+        if parent is not None:
+            parent.children.append(node)
+        by_pid.setdefault(info.pid, []).append(node)
+        nodes.append(node)
+    return nodes
+
+
+def _get_active_intervals(node):
+    # The intervals of the node where none of its children are alive
+    intervals = []
+    t = node.start
+    for child in sorted(node.children, key=lambda c: c.start):
+        start = min(max(child.start, node.start), node.end)
+        if start > t:
+            intervals.append((t, start))
+        t = max(t, min(child.end, node.end))
+    if node.end > t:
+        intervals.append((t, node.end))
+    return intervals
+
+
+def find_critical_path(root):
+    """Find the critical path of a process tree.
+
+    Walking backwards from the end of the root, each process is waiting for
+    the child which ended last: the path goes through this child, then
+    through the part of the parent before the child started.
+
+    :param root: the root of the tree.
+    :type root: :class:`ProcessNode`.
+
+    :returns: the (node, start, end) segments, in chronological order.
+    :rtype: list of tuple.
+    """
+    path = []
+    # The trees can be deep (shells running shells): no recursion
+    pending = [root]
+    while pending:
+        node = pending.pop()
+        t = node.end
+        for child in sorted(node.children, key=lambda c: -c.end):
+            if child.end > t:
+                continue
+            if t > child.end:
+                path.append((node, child.end, t))
+            pending.append(child)
+            t = child.start
+        if t > node.start:
+            path.append((node, node.start, t))
+    path.sort(key=lambda s: (s[1], s[2]))
+    return path
+
+
+def analyze_processes(infos, end_time):
+    """Analyze the timelines of the processes.
+
+    :param infos: the processes.
+    :type infos: list of :class:`ptraceplus.extra.ProcessInfo`.
+
+    :param end_time: the end time of the processes which have not exited.
+    :type end_time: float.
+
+    :returns: the analysis.
+    :rtype: :class:`ProcessAnalysis`.
+    """
+    analysis = ProcessAnalysis()
+    nodes = build_process_tree(infos, end_time)
+    if not nodes:
+        return analysis
+    analysis.processes = nodes
+    analysis.wall_time = max(n.end for n in nodes)
+
+    changes = []
+    for node in nodes:
+        intervals = _get_active_intervals(node)
+        node.exclusive = sum(e - s for s, e in intervals)
+        for start, end in intervals:
+            changes.append((start, 1))
+            changes.append((end, -1))
+    changes.sort()
+    active = 0
+    last = 0.0
+    for time, delta in changes:
+        if time > last:
+            analysis.levels[active] = analysis.levels.get(active, 0.0) + \
+                time - last
+            if not analysis.parallelism or \
+               analysis.parallelism[-1][1] != active:
+                analysis.parallelism.append((last, active))
+            last = time
+        active += delta
+    analysis.parallelism.append((last, active))
+
+    children = set(c for n in nodes for c in n.children)
+    root = max((n for n in nodes if n not in children), key=lambda n: n.end)
+    analysis.critical_path = find_critical_path(root)
+    return analysis
+
+
+def format_process_analysis(analysis, top=10):
+    """Format the analysis of the processes as a report.
+
+    :param analysis: the analysis.
+    :type analysis: :class:`ProcessAnalysis`.
+
+    :param top: number of processes listed.
+    :type top: int.
+
+    :returns: the report.
+    :rtype: str.
+    """
+    lines = []
+    lines.append(_("Wall time: {:.6f} seconds").format(analysis.wall_time))
+    lines.append(_("Processes: {}").format(len(analysis.processes)))
+    lines.append(_("Average parallelism: {:.2f}").format(
+        analysis.average_parallelism))
+    lines.append('')
+    lines.append(_("Critical path:"))
+    lines.append("{:>11} {:>6} {:>8} {}".format(_('seconds'), '%', _('pid'),
+                                                _('name')))
+    for node, time in analysis.critical_processes(top):
+        percent = 100.0 * time / analysis.wall_time
+        lines.append("{:>11.6f} {:>6.2f} {:>8} {}".format(time, percent,
+                                                          node.pid, node.name))
+    lines.append('')
+    lines.append(_("Most exclusive time:"))
+    lines.append("{:>11} {:>11} {:>8} {}".format(_('exclusive'), _('total'),
+                                                 _('pid'), _('name')))
+    for node in analysis.most_exclusive(top):
+        lines.append("{:>11.6f} {:>11.6f} {:>8} {}".format(
+            node.exclusive, node.duration, node.pid, node.name))
+    lines.append('')
+    lines.append(_("Parallelism:"))
+    lines.append("{:>11} {:>6} {:>8}".format(_('seconds'), '%',
+                                             _('active')))
+    for level, time in sorted(analysis.levels.items()):
+        percent = 100.0 * time / analysis.wall_time
+        lines.append("{:>11.6f} {:>6.2f} {:>8}".format(time, percent, level))
+    return '\n'.join(lines) + '\n'
+
+
+def write_process_analysis_json(analysis, stream):
+    """Write the analysis of the processes as JSON.
+
+    :param analysis: the analysis.
+    :type analysis: :class:`ProcessAnalysis`.
+
+    :param stream: the output stream.
+    :type stream: file-like object.
+    """
+    import json
+    json.dump(analysis.as_dict(), stream, indent=2)
+    stream.write('\n')
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Software breakpoints
+
+A breakpoint replaces the first byte of an instruction with int3: when the
+process executes it, it stops with SIGTRAP, its instruction pointer just
+after the breakpoint. To resume it, the original byte is restored, the
+instruction is single-stepped, and the breakpoint is inserted again.
+
+The hits of the counting breakpoints are counted without stopping in the
+tracer: they are handled by the extension, which only returns on the other
+stops of the process.
+"""
+
+import bisect
+import struct
+from array import array
+import ptraceminus as ptrace
+from gettext import gettext as _
+
+INT3 = 0xcc
+# Size of the words read and written by ptrace
+WORD_BITS = 8 * struct.calcsize('l')
+
+
+class BreakpointError(Exception):
+    """Error raised when a breakpoint can not be inserted or removed"""
+
+
+class BreakpointManager(object):
+    """Breakpoints of an address space.
+
+    The threads of a process share its manager. A forked child gets a copy,
+    as its memory is a copy of the one of its parent, breakpoints included.
+
+    The counting breakpoints are kept in arrays sorted by address, shared
+    with the extension: `_hits` is updated in place, so the counters can be
+    read at any time.
+    """
+    def __init__(self):
+        self._addresses = array('L')
+        self._originals = bytearray()
+        self._hits = array('L')
+        # Address of each stopping breakpoint: original byte and hits
+        self._stopping = {}
+
+    def __len__(self):
+        return len(self._addresses) + len(self._stopping)
+
+    def __contains__(self, address):
+        return address in self._stopping or self._find(address) is not None
+
+    def __iter__(self):
+        return iter(sorted(list(self._addresses) + list(self._stopping)))
+
+    @property
+    def hits(self):
+        """Number of hits of each breakpoint, by address"""
+        hits = dict(zip(self._addresses, self._hits))
+        hits.update((a, h) for a, (o, h) in self._stopping.items())
+        return hits
+
+    def _find(self, address):
+        index = bisect.bisect_left(self._addresses, address)
+        if index < len(self._addresses) and \
+           self._addresses[index] == address:
+            return index
+        return None
+
+    def is_counting(self, address):
+        return self._find(address) is not None
+
+    def get_original(self, address):
+        """Return the byte replaced by a breakpoint"""
+        index = self._find(address)
+        if index is not None:
+            return self._originals[index]
+        return self._stopping[address][0]
+
+    def insert(self, pid, address, counting=False):
+        """Insert a breakpoint.
+
+        :param pid: identifier of a stopped thread of the process.
+        :type pid: int.
+
+        :param address: address of the instruction.
+        :type address: int.
+
+        :param counting: if True, the process is resumed by the extension on
+                         each hit, which is only counted.
+        :type counting: bool.
+        """
+        if address in self:
+            raise BreakpointError(_("Breakpoint already set at {:#x}")
+                                  .format(address))
+        try:
+            original = ptrace.peektext(pid, address) & 0xff
+            self._poke_byte(pid, address, INT3)
+        except OSError as e:
+            msg = _("Can not set breakpoint at {:#x} ({})")
+            raise BreakpointError(msg.format(address, e.strerror))
+        if counting:
+            index = bisect.bisect_left(self._addresses, address)
+            self._addresses.insert(index, address)
+            self._originals.insert(index, original)
+            self._hits.insert(index, 0)
+        else:
+            self._stopping[address] = [original, 0]
+
+    def remove(self, pid, address):
+        """Remove a breakpoint, restoring the original instruction.
+
+        :param pid: identifier of a stopped thread of the process.
+        :type pid: int.
+
+        :param address: address of the breakpoint.
+        :type address: int.
+        """
+        if address not in self:
+            raise BreakpointError(_("No breakpoint at {:#x}").format(address))
+        self._poke_byte(pid, address, self.get_original(address))
+        self._forget(address)
+
+    def _forget(self, address):
+        index = self._find(address)
+        if index is not None:
+            del self._addresses[index]
+            del self._originals[index]
+            del self._hits[index]
+        else:
+            del self._stopping[address]
+
+    def clear(self, pid):
+        """Remove all the breakpoints"""
+        for address in list(self):
+            self.remove(pid, address)
+
+    def copy(self):
+        """Return a copy of the breakpoints, with the hits reset"""
+        other = BreakpointManager()
+        other._addresses = array('L', self._addresses)
+        other._originals = bytearray(self._originals)
+        other._hits = array('L', bytes(len(self._hits) *
+                                       self._hits.itemsize))
+        other._stopping = dict((a, [o, 0]) for a, (o, h) in
+                               self._stopping.items())
+        return other
+
+    def record_hit(self, address):
+        index = self._find(address)
+        if index is not None:
+            self._hits[index] += 1
+        else:
+            self._stopping[address][1] += 1
+
+    def step_over(self, pid, address, signum=0):
+        """Execute the instruction replaced by a breakpoint.
+
+        :returns: the status of the process after the step.
+        :rtype: int.
+        """
+        return ptrace.stepover(pid, address, self.get_original(address),
+                               signum)
+
+    def cont(self, pid, signum=0):
+        """Resume the process, counting the hits of the counting breakpoints.
+
+        :returns: the status of the process when it stops otherwise.
+        :rtype: int.
+        """
+        return ptrace.cont_breakpoints(pid, self._addresses, self._originals,
+                                       self._hits, signum)
+
+    def _poke_byte(self, pid, address, value):
+        word = ptrace.peektext(pid, address)
+        word = (word & ~0xff) | value
+        # The word is signed for ptrace
+        if word >= 1 << (WORD_BITS - 1):
+            word -= 1 << WORD_BITS
+        ptrace.poketext(pid, address, word)
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -18,21 +18,172 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+# The tracers and the syscall tables are only imported for the mode in use,
+# to keep the startup of short-lived traced commands fast.
+
 import sys
 import argparse
-import logging
 from ptraceplus import __version__
-from ptraceplus.common import setup_i18n
-from ptraceplus.extra import SyscallTracer, format_tracer_stats
-from ptraceplus.extra import ExecutionTracer
+from ptraceplus.common import setup_i18n, setup_logging
 from gettext import gettext as _
 
-logging.basicConfig()
 
-setup_i18n()
+def read_commands(filename):
+    import shlex
+    if filename == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(filename) as f:
+            lines = f.readlines()
+    commands = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            commands.append(shlex.split(line))
+    return commands
+
+
+def run_jobs(args, output, quiet):
+    from ptraceplus.jobs import JobRunner, SyscallTracerFactory
+    from ptraceplus.jobs import ExecutionTracerFactory
+    if args.exec_only:
+        factory = ExecutionTracerFactory(args.with_files,
+                                         args.with_args,
+                                         args.programs,
+                                         args.detach_unmatched,
+                                         args.follow_children)
+    else:
+        factory = SyscallTracerFactory(args.full,
+                                       args.syscalls,
+                                       args.programs,
+                                       args.summary_only,
+                                       args.sampling,
+                                       args.detach_unmatched,
+                                       args.follow_children)
+    runner = JobRunner(factory, args.jobs, quiet)
+    report = runner.run(read_commands(args.batch), output)
+    for result in report.failures:
+        msg = _("Error: job {} ({}) failed: {}")
+        print(msg.format(result.index, ' '.join(result.args), result.error),
+              file=sys.stderr)
+    return report
+
+
+# Options running a tracer with its own report
+REPORT_MODES = (
+    ('io_profile', '--io'),
+    ('redundant', '--redundant'),
+    ('futex', '--futex'),
+    ('timeline', '--timeline'),
+    ('flamegraph', '--flamegraph'),
+    ('critical_path', '--critical-path'),
+    ('startup', '--startup'),
+    ('callsites', '--callsites'),
+    ('count_calls', '--count-calls'),
+    ('inject_delay', '--inject-delay'),
+)
+
+# Options tuning the report of a mode, with the option of the mode
+REPORT_OPTIONS = (
+    ('io_sort', '--io-sort', 'io_profile', '--io'),
+    ('io_format', '--io-format', 'io_profile', '--io'),
+    ('flamegraph_weight', '--flamegraph-weight', 'flamegraph', '--flamegraph'),
+    ('critical_path_json', '--critical-path-json', 'critical_path',
+     '--critical-path'),
+    ('callsite_depth', '--callsite-depth', 'callsites', '--callsites'),
+)
+
+
+def get_report_mode(args, parser):
+    modes = [o for d, o in REPORT_MODES if getattr(args, d)]
+    if not modes:
+        return None
+    if len(modes) > 1 or args.exec_only or args.summary_only or \
+       args.sampling or args.programs or args.batch:
+        parser.error(_('Can not mix {} with another report, --execution, '
+                       '--summary-only, --sample, --program or '
+                       '--batch').format(modes[0]))
+    return modes[0]
+
+
+def write_io_report(tracer, args, output):
+    from ptraceplus.extra import sort_io_stats, format_io_profile
+    from ptraceplus.extra import write_io_profile_csv, write_io_profile_json
+    stats = tracer.stats
+    if args.io_sort:
+        stats = sort_io_stats(stats, args.io_sort)
+    if args.io_format == 'csv':
+        write_io_profile_csv(stats, output)
+    elif args.io_format == 'json':
+        write_io_profile_json(stats, output)
+    else:
+        output.write(format_io_profile(stats))
+
+
+def write_process_analysis(tracer, args, output):
+    from ptraceplus.analysis import format_process_analysis
+    from ptraceplus.analysis import write_process_analysis_json
+    analysis = tracer.analysis
+    output.write(format_process_analysis(analysis, args.top))
+    if args.critical_path_json:
+        with open(args.critical_path_json, 'w') as stream:
+            write_process_analysis_json(analysis, stream)
+
+
+def parse_startup_marker(spec, parser):
+    from ptraceplus.syscalls.helpers import get_syscall_names
+    known = get_syscall_names().values()
+    markers = []
+    time_limit = None
+    for item in spec.split(','):
+        if item.endswith('ms') and item[:-2].isdigit():
+            time_limit = int(item[:-2]) / 1000.0
+        elif item in known:
+            markers.append(item)
+        else:
+            parser.error(_("Invalid startup marker '{}'").format(item))
+    return tuple(markers), time_limit
+
+
+# Options selecting and tuning the delays of --inject-delay
+DELAY_OPTIONS = (
+    ('delay_at', '--delay-at'),
+    ('delay_paths', '--delay-path'),
+    ('delay_fd_kinds', '--delay-fd'),
+    ('delay_pids', '--delay-pid'),
+    ('delay_seed', '--delay-seed'),
+)
+
+
+def create_delay_rule(args, parser):
+    from ptraceplus.injection import create_delay, DelayRule, InjectionError
+    try:
+        delay = create_delay(args.inject_delay)
+        return DelayRule(delay, args.syscalls, args.delay_paths,
+                         args.delay_fd_kinds, args.delay_pids,
+                         args.delay_at == 'entry')
+    except InjectionError as e:
+        parser.error(str(e))
+
+
+def list_pids(args, parser):
+    from ptraceplus.utils import list_threads, list_process_tree
+    pids = []
+    for pid in args.pids:
+        if args.tree:
+            tids = list_process_tree(pid)
+        else:
+            tids = list_threads(pid)
+        if not tids:
+            parser.error(_('No such process: {}').format(pid))
+        pids += [t for t in tids if t not in pids]
+    return pids
 
 
 def main():
+    setup_logging()
+    setup_i18n()
+
     parser = argparse.ArgumentParser()
     parser.add_argument('--version',
                         action='version',
@@ -60,6 +211,121 @@ def main():
                         dest='with_stats',
                         default=False,
                         help=_('compute some statistics'))
+    parser.add_argument('--summary-only', '-c',
+                        action='store_true',
+                        dest='summary_only',
+                        default=False,
+                        help=_('only count system calls, time and errors'))
+    parser.add_argument('--sample',
+                        metavar='POLICY',
+                        dest='sampling',
+                        help=_('only trace a sample of the system calls'))
+    parser.add_argument('--profile',
+                        action='store_true',
+                        default=False,
+                        help=_('measure the overhead of the tracer by phase'))
+    parser.add_argument('--io',
+                        action='store_true',
+                        dest='io_profile',
+                        default=False,
+                        help=_('measure the I/O volume by file and socket'))
+    parser.add_argument('--io-sort',
+                        choices=('bytes', 'calls', 'time'),
+                        help=_('sort key of the I/O report'))
+    parser.add_argument('--io-format',
+                        choices=('text', 'csv', 'json'),
+                        help=_('format of the I/O report'))
+    parser.add_argument('--redundant',
+                        action='store_true',
+                        default=False,
+                        help=_('report the repeated and the failing system '
+                               'calls'))
+    parser.add_argument('--futex',
+                        action='store_true',
+                        default=False,
+                        help=_('measure the lock contention of the threads'))
+    parser.add_argument('--timeline',
+                        action='store_true',
+                        default=False,
+                        help=_('write a timeline in the Chrome trace-event '
+                               'format'))
+    parser.add_argument('--flamegraph',
+                        action='store_true',
+                        default=False,
+                        help=_('write the system calls as folded stacks of '
+                               'the process lineage'))
+    parser.add_argument('--flamegraph-weight',
+                        choices=('count', 'time'),
+                        help=_('weight of the folded stacks'))
+    parser.add_argument('--critical-path',
+                        action='store_true',
+                        default=False,
+                        help=_('analyze the critical path and the '
+                               'parallelism of the processes'))
+    parser.add_argument('--critical-path-json',
+                        metavar='FILE',
+                        help=_('also write the analysis of the processes '
+                               'as JSON to file'))
+    parser.add_argument('--startup',
+                        action='store_true',
+                        default=False,
+                        help=_('profile the startup of the program, by '
+                               'file name and directory'))
+    parser.add_argument('--startup-marker',
+                        metavar='MARKER',
+                        help=_('end of the startup: system calls and/or '
+                               'a delay in milliseconds (NNNms)'))
+    parser.add_argument('--callsites',
+                        action='store_true',
+                        default=False,
+                        help=_('attribute the system calls to the code '
+                               'issuing them'))
+    parser.add_argument('--callsite-depth',
+                        metavar='N',
+                        type=int,
+                        help=_('number of callers walked from the stack'))
+    parser.add_argument('--count-calls',
+                        metavar='FUNCTIONS',
+                        help=_('count the calls of functions of the program '
+                               '(comma-separated names)'))
+    parser.add_argument('--inject-delay',
+                        metavar='DELAY',
+                        help=_('delay the system calls: D, MIN-MAX or '
+                               'exp:MEAN (in s, ms or us)'))
+    parser.add_argument('--delay-at',
+                        choices=('entry', 'exit'),
+                        help=_('hold the delayed system calls on entry or '
+                               'on exit (default)'))
+    parser.add_argument('--delay-path',
+                        metavar='PREFIX',
+                        action='append',
+                        dest='delay_paths',
+                        default=[],
+                        help=_('only delay the system calls on paths '
+                               'starting with prefix'))
+    parser.add_argument('--delay-fd',
+                        metavar='KIND',
+                        action='append',
+                        dest='delay_fd_kinds',
+                        default=[],
+                        help=_('only delay the system calls on file, pipe, '
+                               'socket, anon or unknown descriptors'))
+    parser.add_argument('--delay-pid',
+                        metavar='PID',
+                        action='append',
+                        type=int,
+                        dest='delay_pids',
+                        default=[],
+                        help=_('only delay the system calls of a process'))
+    parser.add_argument('--delay-seed',
+                        metavar='N',
+                        type=int,
+                        help=_('seed of the random delays'))
+    parser.add_argument('--top',
+                        metavar='N',
+                        type=int,
+                        default=20,
+                        help=_('number of calls in the reports'))
     parser.add_argument('--full', '-F',
                         action='store_true',
                         default=False,
@@ -79,10 +345,89 @@ def main():
                         dest='programs',
                         default=[],
                         help=_('filter program by name'))
+    parser.add_argument('--detach-unmatched',
+                        action='store_true',
+                        default=False,
+                        help=_('stop tracing the processes running other '
+                               'programs'))
+    parser.add_argument('--no-children',
+                        action='store_false',
+                        dest='follow_children',
+                        default=True,
+                        help=_('do not trace the children of the filtered '
+                               'programs'))
+    parser.add_argument('--control',
+                        metavar='PATH',
+                        help=_('serve live statistics on a control socket'))
+    parser.add_argument('--pid', '-p',
+                        metavar='PID',
+                        action='append',
+                        type=int,
+                        dest='pids',
+                        default=[],
+                        help=_('attach to a running process'))
+    parser.add_argument('--tree',
+                        action='store_true',
+                        default=False,
+                        help=_('attach to all threads and descendants'))
+    parser.add_argument('--batch', '-b',
+                        metavar='FILE',
+                        help=_('trace the commands listed in file'))
+    parser.add_argument('--jobs', '-j',
+                        metavar='N',
+                        type=int,
+                        help=_('number of commands traced in parallel'))
     args = parser.parse_args()
 
-    if len(args.arguments) == 0:
+    if args.batch:
+        if args.arguments or args.pids:
+            parser.error(_('Can not mix --batch with a command or --pid'))
+        if args.control or args.profile:
+            parser.error(_('Can not mix --batch with --control or --profile'))
+    elif len(args.arguments) == 0 and not args.pids:
         parser.error(_('Missing argument(s)'))
+    elif args.jobs is not None:
+        parser.error(_('--jobs requires --batch'))
+
+    if not args.programs:
+        if args.detach_unmatched or not args.follow_children:
+            parser.error(_('--detach-unmatched and --no-children require '
+                           '--program'))
+
+    mode = get_report_mode(args, parser)
+    for dest, option, mode_dest, mode_option in REPORT_OPTIONS:
+        if getattr(args, dest) is not None and not getattr(args, mode_dest):
+            parser.error(_('{} requires {}').format(option, mode_option))
+
+    if args.control:
+        from ptraceplus.control import check_socket_path, ControlError
+        try:
+            check_socket_path(args.control)
+        except ControlError as e:
+            parser.error(str(e))
+
+    if args.sampling:
+        if args.exec_only:
+            parser.error(_('Can not mix --sample with --execution'))
+        from ptraceplus.sampling import create_sampler, SamplerError
+        try:
+            create_sampler(args.sampling)
+        except SamplerError as e:
+            parser.error(str(e))
+
+    if args.startup_marker:
+        if not args.startup:
+            parser.error(_('--startup-marker requires --startup'))
+        markers, time_limit = parse_startup_marker(args.startup_marker, parser)
+
+    if args.inject_delay:
+        rule = create_delay_rule(args, parser)
+    else:
+        for dest, option in DELAY_OPTIONS:
+            if getattr(args, dest) not in (None, []):
+                parser.error(_('{} requires --inject-delay').format(option))
+
+    pids = list_pids(args, parser) if args.pids else []
 
     try:
         if args.output:
@@ -96,25 +441,120 @@ def main():
         sys.exit(1)
 
     try:
-        if args.exec_only:
+        if args.batch:
+            tracer = run_jobs(args, output, quiet)
+        elif args.exec_only:
+            from ptraceplus.extra import ExecutionTracer
             tracer = ExecutionTracer(args.arguments,
                                      quiet,
                                      output)
             tracer.with_files = args.with_files
             tracer.with_args = args.with_args
+        elif args.io_profile:
+            from ptraceplus.extra import IOProfileTracer
+            tracer = IOProfileTracer(args.arguments, quiet)
+        elif args.redundant:
+            from ptraceplus.extra import RedundancyTracer
+            tracer = RedundancyTracer(args.arguments, quiet)
+            tracer.top = args.top
+            if args.syscalls:
+                tracer.filter_syscalls(args.syscalls)
+        elif args.futex:
+            from ptraceplus.extra import FutexTracer
+            tracer = FutexTracer(args.arguments, quiet)
+            tracer.top = args.top
+        elif args.timeline:
+            from ptraceplus.extra import TimelineTracer
+            tracer = TimelineTracer(args.arguments, quiet, output)
+        elif args.flamegraph:
+            from ptraceplus.extra import FlameGraphTracer
+            tracer = FlameGraphTracer(args.arguments, quiet)
+        elif args.critical_path:
+            from ptraceplus.extra import CriticalPathTracer
+            tracer = CriticalPathTracer(args.arguments, quiet)
+        elif args.startup:
+            from ptraceplus.extra import StartupTracer
+            tracer = StartupTracer(args.arguments, quiet)
+            tracer.top = args.top
+            if args.startup_marker:
+                tracer.markers = markers
+                tracer.time_limit = time_limit
+        elif args.callsites:
+            from ptraceplus.extra import CallSiteTracer
+            tracer = CallSiteTracer(args.arguments, quiet)
+            tracer.top = args.top
+            if args.callsite_depth is not None:
+                tracer.depth = args.callsite_depth
+            if args.syscalls:
+                tracer.filter_syscalls(args.syscalls)
+        elif args.count_calls:
+            from ptraceplus.extra import CallCountTracer
+            tracer = CallCountTracer(args.arguments, quiet)
+            tracer.functions = [f for f in args.count_calls.split(',') if f]
+        elif args.inject_delay:
+            from ptraceplus.extra import LatencyTracer
+            tracer = LatencyTracer(args.arguments, quiet, args.delay_seed)
+            tracer.add_rule(rule)
         else:
+            from ptraceplus.extra import SyscallTracer
             tracer = SyscallTracer(args.arguments,
                                    quiet,
                                    args.full,
                                    output)
             tracer.filter_syscalls(args.syscalls)
-        tracer.filter_programs(args.programs)
-        tracer.run()
+            tracer.summary_only = args.summary_only
+            if args.sampling:
+                tracer.sampler = create_sampler(args.sampling)
+        if not args.batch:
+            if not mode:
+                tracer.filter_programs(args.programs)
+                tracer.detach_unmatched = args.detach_unmatched
+                tracer.follow_children = args.follow_children
+            tracer.control_path = args.control
+            tracer.attach_pids = pids
+            if args.profile:
+                from ptraceplus.profiling import PhaseProfiler
+                tracer.profiler = PhaseProfiler()
+            tracer.run()
+        if args.summary_only and not args.exec_only:
+            from ptraceplus.extra import format_syscall_summary
+            output.write(format_syscall_summary(tracer.stats))
+        if args.io_profile:
+            write_io_report(tracer, args, output)
+        if args.redundant:
+            from ptraceplus.extra import format_redundancy_report
+            output.write(format_redundancy_report(tracer.stats))
+        if args.futex:
+            from ptraceplus.extra import format_futex_report
+            output.write(format_futex_report(tracer.stats))
+        if args.flamegraph:
+            from ptraceplus.extra import write_folded_stacks
+            write_folded_stacks(tracer.stacks, output,
+                                args.flamegraph_weight or 'count')
+        if args.critical_path:
+            write_process_analysis(tracer, args, output)
+        if args.startup:
+            from ptraceplus.extra import format_startup_profile
+            output.write(format_startup_profile(tracer.stats))
+        if args.callsites:
+            from ptraceplus.extra import format_callsite_report
+            output.write(format_callsite_report(tracer.stats))
+        if args.count_calls:
+            from ptraceplus.extra import format_call_counts
+            output.write(format_call_counts(tracer.stats))
+        if args.inject_delay:
+            from ptraceplus.extra import format_latency_report
+            output.write(format_latency_report(tracer.stats))
     finally:
         if output is not sys.stdout:
             output.close()
 
-    if args.with_stats and not args.exec_only:
+    if args.with_stats and not (args.exec_only or mode):
+        from ptraceplus.extra import format_tracer_stats
         print(format_tracer_stats(tracer.stats))
 
+    if args.with_stats and args.profile:
+        from ptraceplus.profiling import format_profile
+        print(format_profile(tracer.profiler, tracer.elapsed))
+
 # vim: ts=4 sts=4 sw=4 sta et ai
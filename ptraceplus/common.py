@@ -23,35 +23,57 @@ Common functions/helpers
 """
 
 import os
-import logging
 from gettext import bindtextdomain, textdomain
 
-__LOG_LEVELS = {
-    'debug': logging.DEBUG,
-    'info': logging.INFO,
-    'warning': logging.WARNING,
-    'error': logging.ERROR
-}
+__LOG_LEVELS = ('debug', 'info', 'warning', 'error')
 
-try:
-    __level = __LOG_LEVELS[os.environ.get('PTRACEPLUS_LOG', 'warning')]
-except:
-    __level = logging.WARNING
+__level = os.environ.get('PTRACEPLUS_LOG', 'warning')
+if __level not in __LOG_LEVELS:
+    __level = 'warning'
 
-__logger = logging.getLogger('ptraceplus')
-__logger.setLevel(__level)
+__logger = None
 
+# Checked by the hot paths before building a debug message.
+DEBUG = (__level == 'debug')
 
-def debug(message):
+
+def _get_logger():
+    # The logging module is only imported when a message has to be logged.
+    global __logger
+    if __logger is None:
+        import logging
+        __logger = logging.getLogger('ptraceplus')
+        __logger.setLevel(getattr(logging, __level.upper()))
+    return __logger
+
+
+def debug(message, *args):
     """Log a debug message.
 
     The message will only be printed to standard output if the environment
-    variable 'PTRACEPLUS_LOG' is set to 'debug'.
+    variable 'PTRACEPLUS_LOG' is set to 'debug'. It is only formatted with
+    the arguments in this case.
+
+    In the tracing loop, check `DEBUG` before calling this function, so
+    that the message is not even translated when debugging is disabled.
 
     :param message: the message to be logged.
     :type message: str.
+
+    :param args: arguments passed to `str.format()` on the message.
+    :type args: tuple.
     """
-    __logger.debug(message)
+    if DEBUG:
+        if args:
+            message = message.format(*args)
+        _get_logger().debug(message)
+
+
+def setup_logging():
+    """Set up logging, if debug messages are enabled."""
+    if DEBUG:
+        import logging
+        logging.basicConfig()
 
 
 def setup_i18n():
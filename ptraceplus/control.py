@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Control socket of a running tracer
+
+Requests and responses are JSON objects, one per line. A request holds a
+'command' key (e.g. 'stats') and optional arguments.
+"""
+
+import os
+import stat
+import json
+import socket
+import select
+import threading
+from gettext import gettext as _
+from .common import debug
+
+
+class ControlError(Exception):
+    """Error raised when a control request can not be processed"""
+
+
+def check_socket_path(path):
+    """Check that a socket can be created at a path.
+
+    A socket left by a previous tracer is removed, but no other kind of
+    file.
+
+    :param path: path of the socket.
+    :type path: str.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    except OSError as e:
+        raise ControlError(_("Can not use {}: {}").format(path, e.strerror))
+    if not stat.S_ISSOCK(mode):
+        raise ControlError(_("{} exists and is not a socket").format(path))
+    os.unlink(path)
+
+
+class ControlServer(object):
+    """Serve control requests on a Unix-domain socket.
+
+    The requests are handled in a separate thread, so the handler must only
+    read counters or replace attributes of the tracer.
+
+    :param path: path of the socket.
+    :type path: str.
+
+    :param handler: callable taking a request and returning a response.
+    :type handler: callable.
+    """
+    def __init__(self, path, handler):
+        self._path = path
+        self._handler = handler
+        self._sock = None
+        self._thread = None
+        self._stop_r, self._stop_w = (None, None)
+
+    @property
+    def path(self):
+        return self._path
+
+    def start(self):
+        check_socket_path(self._path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self._path)
+        self._sock.listen(4)
+        self._stop_r, self._stop_w = os.pipe()
+        self._thread = threading.Thread(target=self._serve,
+                                        name='ptraceplus-control')
+        self._thread.daemon = True
+        self._thread.start()
+        debug(_("Serving control requests on {}"), self._path)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        os.write(self._stop_w, b'x')
+        self._thread.join()
+        self._thread = None
+        self._sock.close()
+        os.close(self._stop_r)
+        os.close(self._stop_w)
+        try:
+            os.unlink(self._path)
+        except OSError:
+            pass
+
+    def _serve(self):
+        clients = {}
+        while True:
+            fds = [self._stop_r, self._sock] + list(clients.keys())
+            ready, _w, _x = select.select(fds, [], [])
+            if self._stop_r in ready:
+                break
+            for item in ready:
+                if item is self._sock:
+                    conn, addr = self._sock.accept()
+                    clients[conn] = b''
+                elif item in clients:
+                    if not self._read_client(item, clients):
+                        del clients[item]
+                        item.close()
+        for conn in clients:
+            conn.close()
+
+    def _read_client(self, conn, clients):
+        try:
+            data = conn.recv(4096)
+        except OSError:
+            return False
+        if not data:
+            return False
+        buf = clients[conn] + data
+        while b'\n' in buf:
+            line, buf = buf.split(b'\n', 1)
+            if line.strip():
+                response = self.process(line)
+                try:
+                    conn.sendall(response + b'\n')
+                except OSError:
+                    return False
+        clients[conn] = buf
+        return True
+
+    def process(self, line):
+        """Process a raw request and return the raw response.
+
+        :param line: JSON encoded request.
+        :type line: bytes.
+
+        :returns: JSON encoded response.
+        :rtype: bytes.
+        """
+        try:
+            request = json.loads(line.decode('utf-8'))
+            if not isinstance(request, dict) or 'command' not in request:
+                raise ControlError(_('Invalid request'))
+            response = self._handler(request)
+        except (ValueError, ControlError) as e:
+            response = {'error': str(e)}
+        except Exception as e:
+            # The server thread must survive a failing handler
+            debug(_("Control request failed: {!r}"), e)
+            response = {'error': _("Internal error: {!r}").format(e)}
+        return json.dumps(response, sort_keys=True).encode('utf-8')
+
+
+def send_command(path, command, **kwargs):
+    """Send a command to the control socket of a tracer.
+
+    :param path: path of the socket.
+    :type path: str.
+
+    :param command: name of the command.
+    :type command: str.
+
+    :returns: the response of the tracer.
+    :rtype: dict.
+    """
+    request = dict(kwargs, command=command)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        sock.close()
+    return json.loads(data.decode('utf-8'))
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+ELF symbol indexes
+
+The function symbols of a file are read from its symbol table (.symtab, or
+.dynsym for the stripped files), which is memory-mapped: only the addresses
+of the symbols are indexed, and their names are read from the string table
+when they are looked up. The indexes are cached by file identity (device,
+inode and modification time), so that each file is parsed once.
+"""
+
+import os
+import mmap
+import bisect
+import struct
+from array import array
+from gettext import gettext as _
+
+_ELF_MAGIC = b'\x7fELF'
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2LSB = 1
+PT_LOAD = 1
+SHT_SYMTAB = 2
+SHT_DYNSYM = 11
+STT_FUNC = 2
+STT_GNU_IFUNC = 10
+
+# Layouts of the header, the program and section headers and the symbols
+_LAYOUTS = {
+    ELFCLASS32: ('16sHHIIIIIHHHHHH', 'IIIIIIII', 'IIIIIIIIII', 'IIIBBH'),
+    ELFCLASS64: ('16sHHIQQQIHHHHHH', 'IIQQQQQQ', 'IIQQQQIIQQ', 'IBBHQQ'),
+}
+
+
+class ElfError(Exception):
+    """Error raised when an ELF file can not be parsed"""
+
+
+class SymbolIndex(object):
+    """Index of the function symbols of an ELF file.
+
+    :param path: path of the file.
+    :type path: str.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._addresses = array('Q')
+        self._sizes = array('Q')
+        self._names = array('Q')
+        self._segments = []
+        self._strtab = 0
+        self._by_name = None
+        with open(path, 'rb') as f:
+            try:
+                self._data = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+            except (ValueError, OSError) as e:
+                raise ElfError(_("Can not map {}: {}").format(path, e))
+        try:
+            self._parse()
+        except ElfError:
+            self.close()
+            raise
+        except struct.error:
+            self.close()
+            raise ElfError(_("Truncated ELF file {}").format(path))
+
+    def __len__(self):
+        return len(self._addresses)
+
+    def close(self):
+        self._data.close()
+
+    def _parse(self):
+        data = self._data
+        if data[:4] != _ELF_MAGIC or data[4] not in _LAYOUTS:
+            raise ElfError(_("Not an ELF file: {}").format(self.path))
+        order = '<' if data[5] == ELFDATA2LSB else '>'
+        header, phdr, shdr, sym = (order + f for f in _LAYOUTS[data[4]])
+        is_64 = data[4] == ELFCLASS64
+        fields = struct.unpack_from(header, data)
+        phoff, shoff = fields[5], fields[6]
+        phentsize, phnum, shentsize, shnum = fields[9:13]
+
+        for i in range(phnum):
+            p = struct.unpack_from(phdr, data, phoff + i * phentsize)
+            if p[0] != PT_LOAD:
+                continue
+            if is_64:
+                offset, vaddr, filesz = p[2], p[3], p[5]
+            else:
+                offset, vaddr, filesz = p[1], p[2], p[4]
+            self._segments.append((offset, vaddr, filesz))
+
+        sections = [struct.unpack_from(shdr, data, shoff + i * shentsize)
+                    for i in range(shnum)]
+        tables = [s for s in sections if s[1] == SHT_SYMTAB] or \
+            [s for s in sections if s[1] == SHT_DYNSYM]
+        if not tables:
+            return
+        table = tables[0]
+        offset, size, link, entsize = table[4], table[5], table[6], table[9]
+        if not entsize or link >= len(sections):
+            return
+        self._strtab = sections[link][4]
+        symbols = []
+        for i in range(0, size - size % entsize, entsize):
+            s = struct.unpack_from(sym, data, offset + i)
+            if is_64:
+                st_name, st_info, st_shndx, st_value, st_size = \
+                    s[0], s[1], s[3], s[4], s[5]
+            else:
+                st_name, st_value, st_size, st_info, st_shndx = \
+                    s[0], s[1], s[2], s[3], s[5]
+            if st_info & 0xf not in (STT_FUNC, STT_GNU_IFUNC) or \
+               not st_shndx or not st_value:
+                continue
+            symbols.append((st_value, st_size, st_name))
+        symbols.sort()
+        for st_value, st_size, st_name in symbols:
+            self._addresses.append(st_value)
+            self._sizes.append(st_size)
+            self._names.append(st_name)
+
+    def _get_name(self, index):
+        start = self._strtab + self._names[index]
+        end = self._data.find(b'\0', start)
+        return self._data[start:end].decode('utf-8', 'replace')
+
+    def to_address(self, offset):
+        """Convert an offset in the file to a virtual address.
+
+        :param offset: the offset.
+        :type offset: int.
+
+        :returns: the address (or None if the offset is not loaded).
+        :rtype: int.
+        """
+        for start, vaddr, size in self._segments:
+            if start <= offset < start + size:
+                return offset - start + vaddr
+        return None
+
+    def to_offset(self, address):
+        """Convert a virtual address to an offset in the file.
+
+        :param address: the address.
+        :type address: int.
+
+        :returns: the offset (or None if the address is not loaded).
+        :rtype: int.
+        """
+        for start, vaddr, size in self._segments:
+            if vaddr <= address < vaddr + size:
+                return address - vaddr + start
+        return None
+
+    def find(self, name):
+        """Find the virtual address of a function.
+
+        The names are only indexed on the first call.
+
+        :param name: the name of the function.
+        :type name: str.
+
+        :returns: the address (or None if the function is unknown).
+        :rtype: int.
+        """
+        if self._by_name is None:
+            self._by_name = {}
+            for i in range(len(self._addresses)):
+                self._by_name.setdefault(self._get_name(i),
+                                         self._addresses[i])
+        return self._by_name.get(name)
+
+    def get_size(self, address):
+        """Return the size of the function starting at an address.
+
+        :param address: the address of the function.
+        :type address: int.
+
+        :returns: the size (or None if no function starts at the address).
+        :rtype: int.
+        """
+        index = bisect.bisect_left(self._addresses, address)
+        if index < len(self._addresses) and \
+           self._addresses[index] == address:
+            return self._sizes[index]
+        return None
+
+    def lookup(self, address):
+        """Find the function holding a virtual address.
+
+        :param address: the address.
+        :type address: int.
+
+        :returns: the name of the function and the offset of the address in
+                  it (or None).
+        :rtype: tuple.
+        """
+        index = bisect.bisect_right(self._addresses, address) - 1
+        if index < 0:
+            return None
+        start = self._addresses[index]
+        size = self._sizes[index]
+        if size and address >= start + size:
+            return None
+        return self._get_name(index), address - start
+
+
+_INDEXES = {}
+
+
+def get_symbol_index(path):
+    """Return the symbol index of a file.
+
+    The indexes are cached by file identity: a file is parsed once, even
+    if it is mapped by many processes.
+
+    :param path: path of the file.
+    :type path: str.
+
+    :returns: the index (or None if the file can not be parsed).
+    :rtype: :class:`SymbolIndex`.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = (st.st_dev, st.st_ino, st.st_mtime_ns)
+    try:
+        return _INDEXES[key]
+    except KeyError:
+        pass
+    try:
+        index = SymbolIndex(path)
+    except (ElfError, OSError):
+        index = None
+    _INDEXES[key] = index
+    return index
+
+
+def symbolize(path, offset):
+    """Describe a location in a mapped file.
+
+    :param path: path of the file.
+    :type path: str.
+
+    :param offset: offset of the location in the file.
+    :type offset: int.
+
+    :returns: the location, as 'function+0xN (file)', or 'file+0xN' if the
+              function is unknown.
+    :rtype: str.
+    """
+    name = os.path.basename(path)
+    index = get_symbol_index(path) if path.startswith('/') else None
+    if index is not None:
+        address = index.to_address(offset)
+        if address is not None:
+            symbol = index.lookup(address)
+            if symbol is not None:
+                return "{}+{:#x} ({})".format(symbol[0], symbol[1], name)
+    return "{}+{:#x}".format(name or '?', offset)
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -23,35 +23,155 @@ Collections of tracers
 """
 
 import os
+import sys
+import errno
+import bisect
+import struct
+import random
+import itertools
+import ptraceminus as ptrace
+from time import monotonic
+from array import array
 from .tracerplus import TracerPlus
+from .process import (ExecutionEvent, ExitedEvent, KilledEvent,
+                      CloneEvent)
 from .syscalls.helpers import format_syscall, convert_names
-from .common import debug
+from .syscalls.helpers import get_syscall_name, get_syscall_count
+from .syscalls.helpers import get_syscall_names, is_error_result
+from .utils import get_process_command
+from .common import debug, DEBUG
 from gettext import gettext as _
 
 
+def match_program(names, prog, args):
+    """Check if a program matches one of the names.
+
+    :param names: names of the programs.
+    :type names: list of str.
+
+    :param prog: path of the program, as passed to execve() (for a script,
+                 the script and not its interpreter).
+    :type prog: str.
+
+    :param args: arguments of the program, starting with argv[0].
+    :type args: list of str.
+
+    :returns: True if the path or argv[0] ends with one of the names.
+    :rtype: bool.
+    """
+    for name in names:
+        if prog.endswith(name) or (args and args[0].endswith(name)):
+            return True
+    return False
+
+
 class TracerStats:
-    __slots__ = ['n_traced', 'n_filtered', 'results']
+    __slots__ = ['n_traced', 'n_filtered', 'results', 'times', 'errors',
+                 'estimated']
 
-    def __init__(self, nt, nf, r):
+    def __init__(self, nt, nf, r, t=None, e=None, est=False):
         self.n_traced = nt
         self.n_filtered = nf
         self.results = r
+        self.times = t or {}
+        self.errors = e or {}
+        self.estimated = est
+
+
+def scale_tracer_stats(stats, ratio):
+    """Estimate the statistics of all the system calls from a sample.
+
+    :param stats: statistics of the sampled system calls.
+    :type stats: :class:`TracerStats`.
+
+    :param ratio: fraction of the system calls sampled.
+    :type ratio: float.
+
+    :returns: the estimated statistics.
+    :rtype: :class:`TracerStats`.
+    """
+    if ratio <= 0:
+        ratio = 1.0
+    results = [(n, int(round(c / ratio))) for n, c in stats.results]
+    times = dict((n, t / ratio) for n, t in stats.times.items())
+    errors = dict((n, int(round(e / ratio))) for n, e in stats.errors.items())
+    return TracerStats(stats.n_traced, stats.n_filtered, results, times,
+                       errors, True)
 
 
 class SyscallTracer(TracerPlus):
+    """Trace the system calls of a program.
+
+    If `summary_only` is set, only the number of calls, the time spent and
+    the number of errors are recorded for each system call: the parameters
+    are not decoded and nothing is printed during the trace.
+
+    When filtering by program, the processes are matched when they execute
+    a program, and the others only stop on fork, exec and exit. If
+    `detach_unmatched` is set, the processes executing another program are
+    detached, with their future children. If `follow_children` is unset,
+    the children of the matched processes are detached.
+
+    If the memory maps are tracked (`mem_tracker`), the strings at unmapped
+    addresses are rejected without reading the memory of the process.
+    """
     def __init__(self, args, quiet=True, full=False, stream=None):
         TracerPlus.__init__(self, args, quiet=quiet)
         self._os = stream
         self._full = full
         self._results = {}
+        self._times = {}
+        self._errors = {}
         self._syscalls = []
-        self._pids = []
+        self._pids = set()
         self._progs = []
+        self.summary_only = False
+        self.detach_unmatched = False
+        self.follow_children = True
+        size = get_syscall_count() + 1
+        self._counts = array('L', [0] * size)
+        self._elapsed = array('d', [0.0] * size)
+        self._failures = array('L', [0] * size)
 
     @property
     def stats(self):
-        results = [(n, c) for n, c in self._results.items()]
-        return TracerStats(self.n_procs, len(self._progs), sorted(results))
+        if self.summary_only:
+            stats = self._summary_stats()
+        else:
+            # Copied before iterating: the stats are also read by the
+            # control thread, while the tracing loop adds system calls
+            results = list(dict(self._results).items())
+            stats = TracerStats(self.n_procs, len(self._progs),
+                                sorted(results), dict(self._times),
+                                dict(self._errors))
+        if self.sampler:
+            stats = scale_tracer_stats(stats, self.sampling_ratio)
+        return stats
+
+    def _summary_stats(self):
+        results = {}
+        times = {}
+        errors = {}
+        last = len(self._counts) - 1
+        for num, count in enumerate(self._counts):
+            if not count:
+                continue
+            name = 'unknown' if num == last else get_syscall_name(num)
+            results[name] = results.get(name, 0) + count
+            times[name] = times.get(name, 0.0) + self._elapsed[num]
+            errors[name] = errors.get(name, 0) + self._failures[num]
+        return TracerStats(self.n_procs, len(self._progs),
+                           sorted(results.items()), times, errors)
+
+    def live_stats(self):
+        stats = TracerPlus.live_stats(self)
+        current = self.stats
+        stats['estimated'] = current.estimated
+        stats['syscalls'] = dict((n, {'count': c,
+                                      'time': current.times.get(n, 0.0),
+                                      'errors': current.errors.get(n, 0)})
+                                 for n, c in current.results)
+        return stats
 
     def filter_syscalls(self, names):
         self._syscalls = convert_names(names)
@@ -60,6 +180,35 @@ class SyscallTracer(TracerPlus):
         for name in names:
             self._progs.append(name)
 
+    def _get_profiled_phases(self):
+        phases = TracerPlus._get_profiled_phases(self)
+        phases['_check_wanted_syscall'] = 'filter'
+        phases['_log_syscall'] = 'output'
+        phases['_log'] = 'output'
+        return phases
+
+    def _on_control(self, request):
+        from .control import ControlError
+        command = request['command']
+        if command == 'filter':
+            for key in ('syscalls', 'programs'):
+                names = request.get(key, [])
+                if not isinstance(names, list) or \
+                   not all(isinstance(n, str) for n in names):
+                    msg = _("'{}' must be a list of strings")
+                    raise ControlError(msg.format(key))
+            if 'syscalls' in request:
+                self.filter_syscalls(request['syscalls'])
+            if 'programs' in request:
+                self._progs = list(request['programs'])
+            return {'syscalls': sorted(self._syscalls),
+                    'programs': self._progs}
+        elif command == 'dump':
+            if self._os:
+                self._os.flush()
+            return {'dumped': True}
+        return TracerPlus._on_control(self, request)
+
     def _check_wanted_syscall(self, syscall):
         if self._progs:
             if syscall.pid in self._pids:
@@ -87,52 +236,158 @@ class SyscallTracer(TracerPlus):
         else:
             print(message)
 
+    def _log_syscall(self, syscall, result):
+        txt = "[{}] {} = {}"
+        self._log(txt.format(syscall.pid, format_syscall(syscall, True),
+                             result))
+
     def _on_event(self, event):
-        if self._full:
+        if self._full and not self.summary_only:
             self._log(str(event))
 
+    def _trace_syscalls(self, proc):
+        if self._progs and not self._full and proc.pid not in self._pids:
+            return False
+        return TracerPlus._trace_syscalls(self, proc)
+
+    def _match_program(self, pid):
+        command = get_process_command(pid)
+        if command is None:
+            return False
+        return match_program(self._progs, command[0], command[1])
+
+    def _on_tracing_started(self, proc):
+        if self._progs and self.attach_pids:
+            if self._match_program(proc.pid):
+                self._pids.add(proc.pid)
+
+    def _on_exec(self, event):
+        if not self._progs or event.pid in self._pids:
+            return
+        if self._match_program(event.pid):
+            self._pids.add(event.pid)
+        elif self.detach_unmatched:
+            self.detach_process(event.pid)
+
+    def _on_fork(self, event):
+        if not self.follow_children and event.pid in self._pids:
+            self.detach_process(event.child_pid)
+
+    def _count_syscall(self, syscall):
+        num = syscall.num
+        if not 0 <= num < len(self._counts) - 1:
+            num = len(self._counts) - 1
+        result = syscall.collect_retval()
+        self._counts[num] += 1
+        self._elapsed[num] += syscall.elapsed
+        if is_error_result(result):
+            self._failures[num] += 1
+
     def _on_syscall_enter(self, syscall):
-        debug("Entering syscall {}".format(syscall.num))
-        if syscall.name == 'execve':
-            params = syscall.collect_params()
-            for name in self._progs:
-                if params[0].pvalue.endswith(name):
-                    self._pids.append(syscall.pid)
+        if self.summary_only:
+            return
 
+        if DEBUG:
+            debug("Entering syscall {}", syscall.num)
         wanted = self._check_wanted_syscall(syscall)
 
         if self._full or wanted:
             if not syscall.params:
-                syscall.collect_params()
+                syscall.collect_params(self._tracer[syscall.pid].maps)
         if self._full:
-            txt = "[{}] {} = ?"
-            self._log(txt.format(syscall.pid, format_syscall(syscall, True)))
+            self._log_syscall(syscall, '?')
 
     def _on_syscall_exit(self, syscall):
-        debug("Exiting syscall {}".format(syscall.num))
+        if self.summary_only:
+            if self._check_wanted_syscall(syscall):
+                self._count_syscall(syscall)
+            return
+
+        if DEBUG:
+            debug("Exiting syscall {}", syscall.num)
         wanted = self._check_wanted_syscall(syscall)
         if self._full or wanted:
             res = syscall.collect_result()
-            if syscall.name not in self._results:
-                self._results[syscall.name] = 0
-            else:
-                self._results[syscall.name] += 1
-            txt = "[{}] {} = {}"
-            self._log(txt.format(syscall.pid, format_syscall(syscall, True),
-                                 res))
+            name = syscall.name
+            self._results[name] = self._results.get(name, 0) + 1
+            self._times[name] = self._times.get(name, 0.0) + syscall.elapsed
+            if is_error_result(res):
+                self._errors[name] = self._errors.get(name, 0) + 1
+            self._log_syscall(syscall, res)
+
+
+def merge_tracer_stats(stats_list):
+    """Merge the statistics of several tracers.
+
+    :param stats_list: statistics to merge.
+    :type stats_list: list of :class:`TracerStats`.
+
+    :returns: the merged statistics.
+    :rtype: :class:`TracerStats`.
+    """
+    n_traced = 0
+    n_filtered = 0
+    results = {}
+    times = {}
+    errors = {}
+    estimated = False
+    for stats in stats_list:
+        estimated = estimated or stats.estimated
+        n_traced += stats.n_traced
+        n_filtered = max(n_filtered, stats.n_filtered)
+        for name, count in stats.results:
+            results[name] = results.get(name, 0) + count
+        for name, value in stats.times.items():
+            times[name] = times.get(name, 0.0) + value
+        for name, value in stats.errors.items():
+            errors[name] = errors.get(name, 0) + value
+    return TracerStats(n_traced, n_filtered, sorted(results.items()), times,
+                       errors, estimated)
 
 
 def format_tracer_stats(stats):
     text = "----\n"
     text += _("Number of processes traced: {}\n").format(stats.n_traced)
     text += _("Number of processes filtered: {}\n").format(stats.n_filtered)
-    if stats.results:
+    if stats.results and stats.estimated:
+        text += _("Syscalls statistics (estimated):\n")
+    elif stats.results:
         text += _("Syscalls statistics:\n")
     for n, c in stats.results:
         text += " {:<24}: {}\n".format(n, c)
     return text
 
 
+def format_syscall_summary(stats):
+    total = sum(stats.times.values())
+    lines = []
+    lines.append("{:>6} {:>11} {:>11} {:>9} {:>9} {}".format(
+        _('% time'), _('seconds'), _('usecs/call'), _('calls'), _('errors'),
+        _('syscall')))
+    lines.append("{} {} {} {} {} {}".format('-' * 6, '-' * 11, '-' * 11,
+                                            '-' * 9, '-' * 9, '-' * 16))
+    results = sorted(stats.results, key=lambda r: stats.times.get(r[0], 0.0),
+                     reverse=True)
+    n_calls = 0
+    n_errors = 0
+    for name, count in results:
+        seconds = stats.times.get(name, 0.0)
+        errors = stats.errors.get(name, 0)
+        percent = 100.0 * seconds / total if total else 0.0
+        usecs = int(1e6 * seconds / count) if count else 0
+        lines.append("{:>6.2f} {:>11.6f} {:>11} {:>9} {:>9} {}".format(
+            percent, seconds, usecs, count, errors or '', name))
+        n_calls += count
+        n_errors += errors
+    lines.append("{} {} {} {} {} {}".format('-' * 6, '-' * 11, '-' * 11,
+                                            '-' * 9, '-' * 9, '-' * 16))
+    lines.append("{:>6.2f} {:>11.6f} {:>11} {:>9} {:>9} {}".format(
+        100.0, total, '', n_calls, n_errors or '', _('total')))
+    if stats.estimated:
+        lines.append(_("(estimated from sampled system calls)"))
+    return '\n'.join(lines) + '\n'
+
+
 def format_process_info(info, with_files=True):
         text = " - pid: {}\n".format(info.pid)
         text += "   ppid: {}\n".format(info.ppid)
@@ -159,16 +414,42 @@ class ProcessInfo:
         self.fname = None
         self.faccess = None
         self.allowed = False
+        self.start_time = monotonic()
+        self.exec_time = None
+        self.exit_time = None
 
 
 class ExecutionTracer(TracerPlus):
+    """Trace the execution of a program and of its children.
+
+    The command of a process is read from /proc when it executes a program.
+    The times of its start, of its last execution and of its exit are
+    recorded (monotonic clock). Unless `with_files` is set, the processes
+    only stop on fork, exec and exit, not on each system call.
+
+    If `with_history` is set, the information about the processes which
+    have exited is kept and available from `processes`.
+
+    When filtering by program, the files are only tracked for the matched
+    processes. If `detach_unmatched` is set, the processes executing another
+    program are detached, with their future children. If `follow_children`
+    is unset, the children of the matched processes are detached.
+    """
     def __init__(self, args, quiet=True, stream=None):
         TracerPlus.__init__(self, args, quiet=quiet)
         self._os = stream
         self._progs = []
         self._infos = {}
+        self._history = []
         self.with_files = False
         self.with_args = False
+        self.with_history = False
+        self.detach_unmatched = False
+        self.follow_children = True
+
+    @property
+    def processes(self):
+        return self._history
 
     def filter_programs(self, names):
         for name in names:
@@ -184,6 +465,12 @@ class ExecutionTracer(TracerPlus):
         self._infos[proc.pid] = ProcessInfo(proc.pid, -1)
 
     def _on_fork(self, event):
+        if not self.follow_children and self._progs:
+            parent = self._infos.get(event.pid)
+            if parent is not None and parent.allowed:
+                self._infos.pop(event.child_pid, None)
+                self.detach_process(event.child_pid)
+                return
         try:
             info = self._infos[event.child_pid]
             info.ppid = event.pid
@@ -191,30 +478,42 @@ class ExecutionTracer(TracerPlus):
             info = ProcessInfo(event.child_pid, event.pid)
             self._infos[event.child_pid] = info
 
-    def _on_syscall_enter(self, syscall):
-        if syscall.name == 'execve':
-            params = syscall.collect_params()
-            prog = params[0].pvalue
-            if self._progs:
-                allowed = False
-                for name in self._progs:
-                    if prog.endswith(name):
-                        allowed = True
-                        break
-            else:
-                allowed = True
+    def _trace_syscalls(self, proc):
+        if not self.with_files:
+            return False
+        if self._progs:
+            info = self._infos.get(proc.pid)
+            return info is not None and info.allowed
+        return True
 
-            try:
-                info = self._infos[syscall.pid]
-            except KeyError:
-                info = ProcessInfo(syscall.pid)
-                self._infos[syscall.pid] = info
-            info.allowed = allowed
-            info.args = [prog]
-            if self.with_args:
-                info.args += params[1].pvalue[1:]
-
-        elif syscall.name == 'open' and self.with_files:
+    def _on_exec(self, event):
+        command = get_process_command(event.pid)
+        if command is None:
+            return
+        prog, args = command
+        if self._progs:
+            allowed = match_program(self._progs, prog, args)
+        else:
+            allowed = True
+
+        if not allowed and self.detach_unmatched:
+            self._infos.pop(event.pid, None)
+            self.detach_process(event.pid)
+            return
+
+        try:
+            info = self._infos[event.pid]
+        except KeyError:
+            info = ProcessInfo(event.pid)
+            self._infos[event.pid] = info
+        info.exec_time = monotonic()
+        info.allowed = allowed
+        info.args = [prog]
+        if self.with_args:
+            info.args += args[1:]
+
+    def _on_syscall_enter(self, syscall):
+        if syscall.name == 'open' and self.with_files:
             info = self._infos[syscall.pid]
             if info.allowed:
                 params = syscall.collect_params()
@@ -233,10 +532,1484 @@ class ExecutionTracer(TracerPlus):
                         info.rfiles.append(info.fname)
 
     def _on_exit(self, event):
-        info = self._infos[event.pid]
+        info = self._infos.pop(event.pid, None)
+        if info is None:
+            return
         info.code = event.code
+        info.exit_time = monotonic()
         if info.allowed and info.args:
             self._log(format_process_info(info, self.with_files))
-        del self._infos[event.pid]
+            if self.with_history:
+                self._history.append(info)
+
+
+class CriticalPathTracer(ExecutionTracer):
+    """Record the timeline of a program and of its children, for analysis.
+
+    Every process is kept, including the ones which do not execute a program
+    and the ones killed by a signal. Nothing is printed while tracing: the
+    processes are analyzed once the tracing is over, see `analysis`.
+    """
+    def __init__(self, args, quiet=True):
+        ExecutionTracer.__init__(self, args, quiet=quiet)
+        self.with_history = True
+
+    @property
+    def analysis(self):
+        """The analysis of the processes"""
+        end_time = self._end_time or monotonic()
+        infos = self._history + list(self._infos.values())
+        from .analysis import analyze_processes
+        return analyze_processes(infos, end_time)
+
+    def _keep(self, pid, code):
+        info = self._infos.pop(pid, None)
+        if info is not None:
+            info.code = code
+            info.exit_time = monotonic()
+            self._history.append(info)
+
+    def _on_exit(self, event):
+        self._keep(event.pid, event.code)
+
+    def _on_killed(self, event):
+        self._keep(event.pid, -event.signum)
+
+
+# Upper bounds of the I/O size classes, in bytes
+IO_SIZE_LIMITS = (64, 512, 4096, 65536)
+IO_SIZE_LABELS = ('<=64', '<=512', '<=4K', '<=64K', '>64K')
+
+IO_READ_SYSCALLS = ('read', 'pread64', 'readv', 'preadv', 'preadv2',
+                    'recvfrom')
+IO_WRITE_SYSCALLS = ('write', 'pwrite64', 'writev', 'pwritev', 'pwritev2',
+                     'sendto')
+
+
+class IOStats:
+    __slots__ = ['target', 'kind', 'n_reads', 'n_writes', 'bytes_read',
+                 'bytes_written', 'time', 'errors', 'sizes']
+
+    def __init__(self, target, kind):
+        self.target = target
+        self.kind = kind
+        self.n_reads = 0
+        self.n_writes = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.time = 0.0
+        self.errors = 0
+        self.sizes = [0] * len(IO_SIZE_LABELS)
+
+    @property
+    def n_calls(self):
+        return self.n_reads + self.n_writes
+
+    @property
+    def n_bytes(self):
+        return self.bytes_read + self.bytes_written
+
+    def add(self, is_write, result, elapsed):
+        """Account for an I/O system call.
+
+        :param is_write: True if data were written.
+        :type is_write: bool.
+
+        :param result: result of the system call.
+        :type result: int.
+
+        :param elapsed: time spent in the system call, in seconds.
+        :type elapsed: float.
+        """
+        if is_write:
+            self.n_writes += 1
+        else:
+            self.n_reads += 1
+        self.time += elapsed
+        if is_error_result(result):
+            self.errors += 1
+            return
+        if is_write:
+            self.bytes_written += result
+        else:
+            self.bytes_read += result
+        self.sizes[bisect.bisect_left(IO_SIZE_LIMITS, result)] += 1
+
+    def as_dict(self):
+        return {
+            'target': self.target,
+            'kind': self.kind,
+            'reads': self.n_reads,
+            'writes': self.n_writes,
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'time': self.time,
+            'errors': self.errors,
+            'sizes': dict(zip(IO_SIZE_LABELS, self.sizes)),
+        }
+
+
+_IO_SORT_KEYS = {
+    'bytes': lambda s: s.n_bytes,
+    'calls': lambda s: s.n_calls,
+    'time': lambda s: s.time,
+}
+
+
+def sort_io_stats(stats, key='bytes'):
+    """Sort the I/O statistics, the busiest files first.
+
+    :param stats: the statistics.
+    :type stats: list of :class:`IOStats`.
+
+    :param key: sort key: 'bytes', 'calls' or 'time'.
+    :type key: str.
+
+    :returns: the sorted statistics.
+    :rtype: list of :class:`IOStats`.
+    """
+    return sorted(stats, key=lambda s: (-_IO_SORT_KEYS[key](s), s.target))
+
+
+class IOProfileTracer(TracerPlus):
+    """Measure the I/O volume of a program, by file and socket.
+
+    The results of the read, write and send/receive system calls are
+    aggregated by the path or the endpoint of their file descriptor, looked
+    up in the file descriptor table of the process: the buffers are never
+    read.
+    """
+    def __init__(self, args, quiet=True):
+        TracerPlus.__init__(self, args, quiet=quiet)
+        from .fdtable import FdTracker
+        self.fd_tracker = FdTracker()
+        self._stats = {}
+        self._ops = {}
+        for num, name in get_syscall_names().items():
+            if name in IO_READ_SYSCALLS:
+                self._ops[num] = False
+            elif name in IO_WRITE_SYSCALLS:
+                self._ops[num] = True
+            elif name in ('sendfile', 'sendfile64'):
+                self._ops[num] = None
+
+    @property
+    def stats(self):
+        """I/O statistics by file, the busiest first"""
+        return sort_io_stats(list(self._stats.values()))
+
+    def live_stats(self):
+        stats = TracerPlus.live_stats(self)
+        stats['io'] = [s.as_dict() for s in self.stats]
+        return stats
+
+    def _get_profiled_phases(self):
+        phases = TracerPlus._get_profiled_phases(self)
+        phases['_account'] = 'io'
+        return phases
+
+    def _account(self, table, fd, is_write, result, elapsed):
+        entry = table.get(fd)
+        if entry is None:
+            target, kind = '<fd {}>'.format(fd), 'unknown'
+        else:
+            target, kind = entry.target, entry.kind
+        stats = self._stats.get(target)
+        if stats is None:
+            stats = IOStats(target, kind)
+            self._stats[target] = stats
+        stats.add(is_write, result, elapsed)
+
+    def _on_syscall_exit(self, syscall):
+        try:
+            is_write = self._ops[syscall.num]
+        except KeyError:
+            return
+        table = self._tracer[syscall.pid].fds
+        if table is None:
+            return
+        result = syscall.collect_retval()
+        args = syscall.collect_args()
+        if is_write is None:
+            # sendfile(out_fd, in_fd, ...) moves data from in_fd to out_fd
+            self._account(table, args[1] & 0xffffffff, False, result,
+                          syscall.elapsed)
+            self._account(table, args[0] & 0xffffffff, True, result,
+                          syscall.elapsed)
+        else:
+            self._account(table, args[0] & 0xffffffff, is_write, result,
+                          syscall.elapsed)
+
+
+def format_io_profile(stats):
+    """Format the I/O statistics as a table.
+
+    :param stats: the statistics, in the order of the rows.
+    :type stats: list of :class:`IOStats`.
+
+    :returns: the table.
+    :rtype: str.
+    """
+    header = "{:>12} {:>12} {:>8} {:>8} {:>6} {:>10} " + \
+        "{:>7} " * len(IO_SIZE_LABELS) + "{}"
+    row = "{:>12} {:>12} {:>8} {:>8} {:>6} {:>10.6f} " + \
+        "{:>7} " * len(IO_SIZE_LABELS) + "{}"
+    lines = []
+    lines.append(header.format(_('read'), _('written'), _('reads'),
+                               _('writes'), _('errors'), _('seconds'),
+                               *(IO_SIZE_LABELS + (_('file'),))))
+    for s in stats:
+        lines.append(row.format(s.bytes_read, s.bytes_written, s.n_reads,
+                                s.n_writes, s.errors or '', s.time,
+                                *(s.sizes + [s.target])))
+    return '\n'.join(lines) + '\n'
+
+
+def write_io_profile_csv(stats, stream):
+    """Write the I/O statistics as CSV.
+
+    :param stats: the statistics, in the order of the rows.
+    :type stats: list of :class:`IOStats`.
+
+    :param stream: the output stream.
+    :type stream: file-like object.
+    """
+    import csv
+    writer = csv.writer(stream)
+    writer.writerow(['target', 'kind', 'bytes_read', 'bytes_written',
+                     'reads', 'writes', 'errors', 'time'] +
+                    ['size' + label for label in IO_SIZE_LABELS])
+    for s in stats:
+        writer.writerow([s.target, s.kind, s.bytes_read, s.bytes_written,
+                         s.n_reads, s.n_writes, s.errors,
+                         '{:.6f}'.format(s.time)] + s.sizes)
+
+
+def write_io_profile_json(stats, stream):
+    """Write the I/O statistics as JSON.
+
+    :param stats: the statistics, in the order of the rows.
+    :type stats: list of :class:`IOStats`.
+
+    :param stream: the output stream.
+    :type stream: file-like object.
+    """
+    import json
+    json.dump([s.as_dict() for s in stats], stream, indent=2)
+    stream.write('\n')
+
+
+# Index of the path parameter of the system calls looking up files
+LOOKUP_SYSCALLS = {
+    'open': 0, 'creat': 0, 'openat': 1, 'openat2': 1,
+    'stat': 0, 'lstat': 0, 'newfstatat': 1, 'statx': 1,
+    'stat64': 0, 'lstat64': 0, 'fstatat64': 1,
+    'access': 0, 'faccessat': 1, 'faccessat2': 1,
+    'readlink': 0, 'readlinkat': 1,
+    'execve': 0, 'execveat': 1,
+    'chdir': 0, 'getxattr': 0, 'lgetxattr': 0,
+}
+
+
+class RedundancyStats:
+    __slots__ = ['n_calls', 'n_failures', 'wasted_time', 'repeated',
+                 'failures']
+
+    def __init__(self, nc, nf, w, r, f):
+        self.n_calls = nc
+        self.n_failures = nf
+        self.wasted_time = w
+        self.repeated = r
+        self.failures = f
+
+
+class RedundancyTracer(TracerPlus):
+    """Find the system calls repeated with identical arguments, and the
+    failing file lookups.
+
+    The calls are identified by the system call and its path, or the values
+    of its parameters for the system calls without a path. By default, only
+    the system calls looking up files are considered.
+
+    The counts are estimated in bounded memory: only the `capacity` most
+    frequent calls are kept, and the `top` ones are reported. The wasted
+    time is the time spent in the repeated calls and in the failing ones.
+    """
+    def __init__(self, args, quiet=True, capacity=1024):
+        TracerPlus.__init__(self, args, quiet=quiet)
+        self._wanted = {}
+        self._pending = {}
+        from .sketch import HeavyHitters
+        self._repeated = HeavyHitters(capacity)
+        self._failures = HeavyHitters(capacity)
+        self._n_failures = 0
+        self._wasted_time = 0.0
+        self.top = 20
+        self.filter_syscalls(list(LOOKUP_SYSCALLS))
+
+    def filter_syscalls(self, names):
+        self._wanted = {}
+        for num, name in get_syscall_names().items():
+            if name in names:
+                self._wanted[num] = LOOKUP_SYSCALLS.get(name)
+
+    @property
+    def stats(self):
+        """The most repeated calls, as (name, argument, count, time) tuples,
+        and the most common failures, as (name, argument, errno, count, time)
+        tuples.
+        """
+        n = self.top
+        repeated = [(get_syscall_name(i.key[0]), i.key[1], i.count, i.time)
+                    for i in self._repeated.most_common(n) if i.count > 1]
+        failures = [(get_syscall_name(i.key[0]), i.key[1],
+                     errno.errorcode.get(i.key[2], str(i.key[2])),
+                     i.count, i.time)
+                    for i in self._failures.most_common(n)]
+        return RedundancyStats(self._repeated.total, self._n_failures,
+                               self._wasted_time, repeated, failures)
+
+    def live_stats(self):
+        stats = TracerPlus.live_stats(self)
+        current = self.stats
+        stats['wasted_time'] = current.wasted_time
+        stats['n_failures'] = current.n_failures
+        return stats
+
+    def _get_profiled_phases(self):
+        phases = TracerPlus._get_profiled_phases(self)
+        phases['_get_argument'] = 'decode'
+        return phases
+
+    def _get_argument(self, syscall, index):
+        args = syscall.collect_args()
+        if index is None:
+            return tuple(args[:len(syscall.prototype)])
+        try:
+            path = ptrace.getstr(syscall.pid, args[index])
+        except (OSError, MemoryError, UnicodeDecodeError):
+            return '?'
+        if not path and index > 0:
+            # AT_EMPTY_PATH: the file is the descriptor
+            path = '<fd {}>'.format(args[0] & 0xffffffff)
+        # Interned, so that the repeated paths share a single string
+        return sys.intern(path)
+
+    def _on_syscall_enter(self, syscall):
+        # The path must be read on entry: execve() replaces the memory
+        try:
+            index = self._wanted[syscall.num]
+        except KeyError:
+            return
+        self._pending[syscall.pid] = self._get_argument(syscall, index)
+
+    def _on_syscall_exit(self, syscall):
+        argument = self._pending.pop(syscall.pid, None)
+        if argument is None or syscall.num not in self._wanted:
+            return
+        result = syscall.collect_retval()
+        elapsed = syscall.elapsed
+        key = (syscall.num, argument)
+        repeated = self._repeated.add(key, elapsed) > 1
+        if is_error_result(result):
+            self._n_failures += 1
+            self._failures.add(key + (-result,), elapsed)
+            self._wasted_time += elapsed
+        elif repeated:
+            self._wasted_time += elapsed
+
+    def _on_exit(self, event):
+        self._pending.pop(event.pid, None)
+
+    def _on_killed(self, event):
+        self._pending.pop(event.pid, None)
+
+
+def _format_argument(argument):
+    if isinstance(argument, tuple):
+        return '(' + ', '.join('{:#x}'.format(v) for v in argument) + ')'
+    return '"{}"'.format(argument)
+
+
+def format_redundancy_report(stats):
+    """Format the repeated and the failing system calls as tables.
+
+    :param stats: the statistics.
+    :type stats: :class:`RedundancyStats`.
+
+    :returns: the report.
+    :rtype: str.
+    """
+    lines = []
+    lines.append(_("Most repeated calls:"))
+    lines.append("{:>9} {:>11} {:<12} {}".format(_('calls'), _('seconds'),
+                                                 _('syscall'),
+                                                 _('argument')))
+    for name, argument, count, time in stats.repeated:
+        lines.append("{:>9} {:>11.6f} {:<12} {}".format(
+            count, time, name, _format_argument(argument)))
+    lines.append('')
+    lines.append(_("Most common failures:"))
+    lines.append("{:>9} {:>11} {:<12} {:<10} {}".format(
+        _('calls'), _('seconds'), _('syscall'), _('error'), _('argument')))
+    for name, argument, error, count, time in stats.failures:
+        lines.append("{:>9} {:>11.6f} {:<12} {:<10} {}".format(
+            count, time, name, error, _format_argument(argument)))
+    lines.append('')
+    lines.append(_("Calls: {}, failures: {}, wasted time: {:.6f}s").format(
+        stats.n_calls, stats.n_failures, stats.wasted_time))
+    return '\n'.join(lines) + '\n'
+
+
+FUTEX_PRIVATE_FLAG = 128
+FUTEX_CLOCK_REALTIME = 256
+FUTEX_OPS = ('FUTEX_WAIT', 'FUTEX_WAKE', 'FUTEX_FD', 'FUTEX_REQUEUE',
+             'FUTEX_CMP_REQUEUE', 'FUTEX_WAKE_OP', 'FUTEX_LOCK_PI',
+             'FUTEX_UNLOCK_PI', 'FUTEX_TRYLOCK_PI', 'FUTEX_WAIT_BITSET',
+             'FUTEX_WAKE_BITSET', 'FUTEX_WAIT_REQUEUE_PI',
+             'FUTEX_CMP_REQUEUE_PI', 'FUTEX_LOCK_PI2')
+# Operations blocking the caller, and operations waking waiters up
+_FUTEX_WAIT_OPS = frozenset((0, 6, 9, 11, 13))
+_FUTEX_WAKE_OPS = frozenset((1, 3, 4, 5, 7, 10, 12))
+
+
+def decode_futex_op(op):
+    """Decode the operation of a futex() call.
+
+    :param op: the operation.
+    :type op: int.
+
+    :returns: the name of the operation, with its flags.
+    :rtype: str.
+    """
+    op &= 0xffffffff
+    cmd = op & ~(FUTEX_PRIVATE_FLAG | FUTEX_CLOCK_REALTIME)
+    if cmd < len(FUTEX_OPS):
+        text = FUTEX_OPS[cmd]
+    else:
+        text = str(cmd)
+    if op & FUTEX_PRIVATE_FLAG:
+        text += '_PRIVATE'
+    if op & FUTEX_CLOCK_REALTIME:
+        text += '|FUTEX_CLOCK_REALTIME'
+    return text
+
+
+class FutexCounters(object):
+    """Futex counters indexed by key, stored in parallel arrays.
+
+    The keys are listed in `keys`, in the order of their slots.
+    """
+    def __init__(self):
+        self.keys = []
+        self._slots = {}
+        self.wait_time = array('d')
+        self.waits = array('L')
+        self.wakes = array('L')
+        self.woken = array('L')
+        self.waiters = array('l')
+        self.max_waiters = array('L')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get_slot(self, key):
+        """Return the slot of a key, creating it if needed"""
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = len(self.keys)
+            self._slots[key] = slot
+            self.keys.append(key)
+            self.wait_time.append(0.0)
+            for a in (self.waits, self.wakes, self.woken, self.waiters,
+                      self.max_waiters):
+                a.append(0)
+        return slot
+
+    def most_contended(self, n=None):
+        """Return the slots, the longest blocked first"""
+        slots = sorted(range(len(self.keys)),
+                       key=lambda i: (-self.wait_time[i], -self.waits[i]))
+        return slots if n is None else slots[:n]
+
+
+class FutexStats:
+    __slots__ = ['n_calls', 'ops', 'addresses', 'threads']
+
+    def __init__(self, nc, o, a, t):
+        self.n_calls = nc
+        self.ops = o
+        self.addresses = a
+        self.threads = t
+
+
+class FutexTracer(TracerPlus):
+    """Measure the lock contention of a multi-threaded program.
+
+    The futex() calls of all the threads are decoded: the time blocked in
+    the waiting operations and the number of wake-ups are aggregated by
+    futex address (in the address space of the process) and by thread. The
+    `top` most contended addresses and threads are reported.
+    """
+    def __init__(self, args, quiet=True):
+        TracerPlus.__init__(self, args, quiet=quiet)
+        self.follow_threads = True
+        self.top = 20
+        self._futex = frozenset(convert_names(['futex']))
+        self._addresses = FutexCounters()
+        self._threads = FutexCounters()
+        self._tgids = {}
+        self._pending = {}
+        self._ops = {}
+        self._n_calls = 0
+
+    @property
+    def stats(self):
+        """The most contended addresses, as (pid, uaddr, wait time, waits,
+        wakes, woken, max waiters) tuples, and threads, as (tid, wait time,
+        waits, wakes) tuples.
+        """
+        a = self._addresses
+        addresses = [a.keys[i] + (a.wait_time[i], a.waits[i], a.wakes[i],
+                                  a.woken[i], a.max_waiters[i])
+                     for i in a.most_contended(self.top)]
+        t = self._threads
+        threads = [(t.keys[i], t.wait_time[i], t.waits[i], t.wakes[i])
+                   for i in t.most_contended(self.top)]
+        ops = dict((decode_futex_op(op), c) for op, c in self._ops.items())
+        return FutexStats(self._n_calls, ops, addresses, threads)
+
+    def _get_tgid(self, tid):
+        tgid = self._tgids.get(tid)
+        if tgid is None:
+            tgid = tid
+            try:
+                with open('/proc/{}/status'.format(tid)) as f:
+                    for line in f:
+                        if line.startswith('Tgid:'):
+                            tgid = int(line.split()[1])
+                            break
+            except (OSError, ValueError):
+                pass
+            self._tgids[tid] = tgid
+        return tgid
+
+    def _on_syscall_enter(self, syscall):
+        if syscall.num not in self._futex:
+            return
+        args = syscall.collect_args()
+        op = args[1] & 0xffffffff
+        cmd = op & ~(FUTEX_PRIVATE_FLAG | FUTEX_CLOCK_REALTIME)
+        self._ops[op] = self._ops.get(op, 0) + 1
+        self._n_calls += 1
+        tid = syscall.pid
+        addr = self._addresses.get_slot((self._get_tgid(tid), args[0]))
+        thread = self._threads.get_slot(tid)
+        if cmd in _FUTEX_WAIT_OPS:
+            waiters = self._addresses.waiters
+            waiters[addr] += 1
+            if waiters[addr] > self._addresses.max_waiters[addr]:
+                self._addresses.max_waiters[addr] = waiters[addr]
+        self._pending[tid] = (cmd, addr, thread)
+
+    def _on_syscall_exit(self, syscall):
+        pending = self._pending.pop(syscall.pid, None)
+        if pending is None:
+            return
+        cmd, addr, thread = pending
+        a = self._addresses
+        t = self._threads
+        if cmd in _FUTEX_WAIT_OPS:
+            elapsed = syscall.elapsed
+            a.waiters[addr] -= 1
+            a.waits[addr] += 1
+            a.wait_time[addr] += elapsed
+            t.waits[thread] += 1
+            t.wait_time[thread] += elapsed
+        elif cmd in _FUTEX_WAKE_OPS:
+            result = syscall.collect_retval()
+            a.wakes[addr] += 1
+            t.wakes[thread] += 1
+            if result > 0:
+                a.woken[addr] += result
+
+    def _forget_thread(self, tid):
+        pending = self._pending.pop(tid, None)
+        if pending is not None and pending[0] in _FUTEX_WAIT_OPS:
+            self._addresses.waiters[pending[1]] -= 1
+        self._tgids.pop(tid, None)
+
+    def _on_exit(self, event):
+        self._forget_thread(event.pid)
+
+    def _on_killed(self, event):
+        self._forget_thread(event.pid)
+
+
+def format_futex_report(stats):
+    """Format the most contended futexes and threads as tables.
+
+    :param stats: the statistics.
+    :type stats: :class:`FutexStats`.
+
+    :returns: the report.
+    :rtype: str.
+    """
+    lines = []
+    lines.append(_("Most contended futexes:"))
+    lines.append("{:>11} {:>9} {:>9} {:>9} {:>8} {:>8} {}".format(
+        _('seconds'), _('waits'), _('wakes'), _('woken'), _('waiters'),
+        _('pid'), _('address')))
+    for pid, uaddr, time, waits, wakes, woken, waiters in stats.addresses:
+        lines.append("{:>11.6f} {:>9} {:>9} {:>9} {:>8} {:>8} {:#x}".format(
+            time, waits, wakes, woken, waiters, pid, uaddr))
+    lines.append('')
+    lines.append(_("Most blocked threads:"))
+    lines.append("{:>11} {:>9} {:>9} {:>8}".format(
+        _('seconds'), _('waits'), _('wakes'), _('tid')))
+    for tid, time, waits, wakes in stats.threads:
+        lines.append("{:>11.6f} {:>9} {:>9} {:>8}".format(time, waits, wakes,
+                                                          tid))
+    lines.append('')
+    lines.append(_("Futex calls: {}").format(stats.n_calls))
+    for op, count in sorted(stats.ops.items(), key=lambda o: -o[1]):
+        lines.append(" {:<40}: {}".format(op, count))
+    return '\n'.join(lines) + '\n'
+
+
+class TimelineTracer(TracerPlus):
+    """Write the timeline of a program and of its children as trace events.
+
+    Each process is a track: the time it runs a program is a span named
+    after the program, its system calls are slices, and its forks,
+    executions and exit are instant events. The events are written to the
+    stream as they come, in the Chrome trace-event format. Unless
+    `with_syscalls` is set, the system calls are not traced.
+    """
+    def __init__(self, args, quiet=True, stream=None):
+        TracerPlus.__init__(self, args, quiet=quiet)
+        self._os = stream
+        self._writer = None
+        self._names = {}
+        self.with_syscalls = True
+
+    def _trace_syscalls(self, proc):
+        if not self.with_syscalls:
+            return False
+        return TracerPlus._trace_syscalls(self, proc)
+
+    def run(self):
+        from .timeline import TraceEventWriter
+        self._writer = TraceEventWriter(self._os or sys.stdout)
+        try:
+            TracerPlus.run(self)
+        finally:
+            # Close the spans of the processes left running
+            ts = self.elapsed
+            for pid in sorted(self._names):
+                self._writer.end(ts, pid, pid)
+            self._names.clear()
+            self._writer.close()
+
+    def _now(self):
+        return monotonic() - self._start_time
+
+    def _begin(self, pid, ts, command=None):
+        if command is None:
+            command = get_process_command(pid)
+        if command is None:
+            name = self._names.get(pid, str(pid))
+            args = None
+        else:
+            name = os.path.basename(command[0])
+            args = {'command': ' '.join(command[1]) or command[0]}
+        self._names[pid] = name
+        self._writer.metadata('process_name', pid, pid, {'name': name})
+        self._writer.begin(name, 'process', ts, pid, pid, args)
+
+    def _on_tracing_started(self, proc):
+        if self.attach_pids:
+            self._begin(proc.pid, self._now())
+        else:
+            # The program is not executed yet
+            self._begin(proc.pid, self._now(), (self._args[0], self._args))
+
+    def _on_fork(self, event):
+        ts = self._now()
+        self._writer.instant('fork', 'process', ts, event.pid, event.pid,
+                             {'child': event.child_pid})
+        self._names[event.child_pid] = self._names.get(event.pid, '?')
+        self._begin(event.child_pid, ts)
+
+    def _on_exec(self, event):
+        ts = self._now()
+        if event.pid in self._names:
+            self._writer.end(ts, event.pid, event.pid)
+        self._writer.instant('exec', 'process', ts, event.pid, event.pid)
+        self._begin(event.pid, ts)
+
+    def _end(self, pid, name, args):
+        ts = self._now()
+        self._writer.instant(name, 'process', ts, pid, pid, args)
+        if self._names.pop(pid, None) is not None:
+            self._writer.end(ts, pid, pid, args)
+
+    def _on_exit(self, event):
+        self._end(event.pid, 'exit', {'code': event.code})
+
+    def _on_killed(self, event):
+        self._end(event.pid, 'killed', {'signal': event.signum})
+
+    def _on_syscall_exit(self, syscall):
+        result = syscall.collect_retval()
+        self._writer.complete(syscall.name, 'syscall',
+                              syscall.start_time - self._start_time,
+                              syscall.elapsed, syscall.pid, syscall.pid,
+                              {'result': result})
+
+
+class FlameGraphTracer(TracerPlus):
+    """Aggregate the system calls by process lineage, for flame graphs.
+
+    Each process has a stack of frames: the frames of its parent, followed
+    by the program it runs. The stacks are built from the fork and exec
+    events, and the number of calls and the time spent in each system call
+    are aggregated by stack.
+    """
+    def __init__(self, args, quiet=True):
+        TracerPlus.__init__(self, args, quiet=quiet)
+        self._stacks = {}
+        self._stack_ids = {}
+        self._frames = []
+        self._counts = {}
+
+    @property
+    def stacks(self):
+        """The stacks, as (frames, system call, count, time) tuples"""
+        return [(self._frames[i], get_syscall_name(num), c[0], c[1])
+                for (i, num), c in sorted(self._counts.items())]
+
+    def _get_stack_id(self, frames):
+        stack_id = self._stack_ids.get(frames)
+        if stack_id is None:
+            stack_id = len(self._frames)
+            self._stack_ids[frames] = stack_id
+            self._frames.append(frames)
+        return stack_id
+
+    def _get_frame(self, pid):
+        command = get_process_command(pid)
+        if command is None:
+            return '?'
+        return os.path.basename(command[0]).replace(';', ':')
+
+    def _on_tracing_started(self, proc):
+        if self.attach_pids:
+            frame = self._get_frame(proc.pid)
+        else:
+            frame = os.path.basename(self._args[0]).replace(';', ':')
+        self._stacks[proc.pid] = self._get_stack_id((frame,))
+
+    def _on_fork(self, event):
+        frames = self._frames[self._stacks.get(event.pid, 0)]
+        # The child runs the program of its parent until it executes another
+        self._stacks[event.child_pid] = self._get_stack_id(frames +
+                                                           frames[-1:])
+
+    def _on_exec(self, event):
+        stack_id = self._stacks.get(event.pid)
+        frames = self._frames[stack_id][:-1] if stack_id is not None else ()
+        frames += (self._get_frame(event.pid),)
+        self._stacks[event.pid] = self._get_stack_id(frames)
+
+    def _on_exit(self, event):
+        self._stacks.pop(event.pid, None)
+
+    def _on_killed(self, event):
+        self._stacks.pop(event.pid, None)
+
+    def _on_syscall_exit(self, syscall):
+        stack_id = self._stacks.get(syscall.pid)
+        if stack_id is None:
+            return
+        key = (stack_id, syscall.num)
+        counts = self._counts.get(key)
+        if counts is None:
+            self._counts[key] = [1, syscall.elapsed]
+        else:
+            counts[0] += 1
+            counts[1] += syscall.elapsed
+
+
+def write_folded_stacks(stacks, stream, weight='count'):
+    """Write the stacks in the folded format of the flame graph tools.
+
+    Each line is made of the frames and the system call, separated by ';',
+    and of the weight: the number of calls, or the time in microseconds.
+
+    :param stacks: the stacks, as (frames, system call, count, time) tuples.
+    :type stacks: list of tuple.
+
+    :param stream: the output stream.
+    :type stream: file-like object.
+
+    :param weight: 'count' or 'time'.
+    :type weight: str.
+    """
+    for frames, name, count, time in stacks:
+        if weight == 'time':
+            value = int(round(time * 1e6))
+        else:
+            value = count
+        if value:
+            stream.write("{};{} {}\n".format(';'.join(frames), name, value))
+
+
+# System calls marking the end of the startup of a service
+STARTUP_MARKERS = ('listen', 'accept', 'accept4', 'connect')
+
+# Index of the descriptor of the system calls loading files, and what they
+# do with it
+_LOAD_SYSCALLS = {
+    'read': (0, 'read'), 'pread64': (0, 'read'), 'mmap': (4, 'map'),
+    'mmap2': (4, 'map'), 'fstat': (0, 'stat'), 'fstat64': (0, 'stat'),
+}
+
+
+class StartupStats:
+    """Activity of the startup for a file name or a directory"""
+    __slots__ = ['name', 'n_probes', 'n_failures', 'bytes_mapped',
+                 'bytes_read', 'time']
+
+    def __init__(self, name):
+        self.name = name
+        self.n_probes = 0
+        self.n_failures = 0
+        self.bytes_mapped = 0
+        self.bytes_read = 0
+        self.time = 0.0
+
+    def as_dict(self):
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+
+class StartupProfile:
+    __slots__ = ['duration', 'marker', 'n_calls', 'time', 'objects',
+                 'directories']
+
+    def __init__(self, d, m, nc, t, o, dirs):
+        self.duration = d
+        self.marker = m
+        self.n_calls = nc
+        self.time = t
+        self.objects = o
+        self.directories = dirs
+
+
+class StartupTracer(TracerPlus):
+    """Profile the startup of a program: the loading of its shared objects
+    or of its modules.
+
+    The program is traced until it enters one of the `markers` system calls
+    (by default, the first listen, accept or connect), or for `time_limit`
+    seconds: then all the processes are detached, so that the rest of the
+    run is not slowed down.
+
+    The file lookups, the mapped and the read bytes and the time spent in
+    these system calls are aggregated by file name (the shared object or
+    the module) and by directory (the search path).
+    """
+    def __init__(self, args, quiet=True):
+        TracerPlus.__init__(self, args, quiet=quiet)
+        from .fdtable import FdTracker, FD_KIND_FILE
+        self.fd_tracker = FdTracker()
+        self.markers = STARTUP_MARKERS
+        self.time_limit = None
+        self.top = 20
+        self._marker_nums = frozenset()
+        self._lookups = {}
+        self._loads = {}
+        self._pending = {}
+        self._objects = {}
+        self._directories = {}
+        self._marker = None
+        self._n_calls = 0
+        self._time = 0.0
+        self._file_kind = FD_KIND_FILE
+
+    @property
+    def stats(self):
+        """The startup profile, the longest file names and directories
+        first.
+        """
+        if self._n_detached and self._stop_time is not None:
+            end = self._stop_time
+        else:
+            end = self._end_time or monotonic()
+        marker = self._marker
+        if marker is None and self._n_detached:
+            marker = '{:g}ms'.format(self.time_limit * 1000)
+        objects = sorted(self._objects.values(), key=lambda s: -s.time)
+        directories = sorted(self._directories.values(),
+                             key=lambda s: -s.time)
+        return StartupProfile(end - self._start_time, marker, self._n_calls,
+                              self._time, objects[:self.top],
+                              directories[:self.top])
+
+    def _get_stats(self, path):
+        name = os.path.basename(path) or path
+        directory = os.path.dirname(path) or '.'
+        objstats = self._objects.get(name)
+        if objstats is None:
+            objstats = StartupStats(name)
+            self._objects[name] = objstats
+        dirstats = self._directories.get(directory)
+        if dirstats is None:
+            dirstats = StartupStats(directory)
+            self._directories[directory] = dirstats
+        return objstats, dirstats
+
+    def _on_tracing_started(self, proc):
+        nums = {}
+        for num, name in get_syscall_names().items():
+            if name in LOOKUP_SYSCALLS:
+                self._lookups[num] = LOOKUP_SYSCALLS[name]
+            elif name in _LOAD_SYSCALLS:
+                self._loads[num] = _LOAD_SYSCALLS[name]
+            elif name in self.markers:
+                nums[num] = name
+        self._marker_nums = nums
+        if self.time_limit is not None:
+            self.stop_tracing(self.time_limit)
+
+    def _on_syscall_enter(self, syscall):
+        if syscall.num in self._marker_nums:
+            if self._marker is None:
+                self._marker = self._marker_nums[syscall.num]
+                self.stop_tracing()
+            return
+        index = self._lookups.get(syscall.num)
+        if index is None:
+            return
+        args = syscall.collect_args()
+        try:
+            path = ptrace.getstr(syscall.pid, args[index])
+        except (OSError, MemoryError, UnicodeDecodeError):
+            return
+        if path:
+            self._pending[syscall.pid] = path
+
+    def _on_syscall_exit(self, syscall):
+        self._n_calls += 1
+        self._time += syscall.elapsed
+        path = self._pending.pop(syscall.pid, None)
+        if path is not None:
+            result = syscall.collect_retval()
+            for stats in self._get_stats(path):
+                stats.n_probes += 1
+                if is_error_result(result):
+                    stats.n_failures += 1
+                stats.time += syscall.elapsed
+            return
+        try:
+            index, op = self._loads[syscall.num]
+        except KeyError:
+            return
+        table = self._tracer[syscall.pid].fds
+        if table is None:
+            return
+        args = syscall.collect_args()
+        entry = table.get(args[index] & 0xffffffff)
+        if entry is None or entry.kind != self._file_kind:
+            return
+        result = syscall.collect_retval()
+        if is_error_result(result):
+            return
+        for stats in self._get_stats(entry.target):
+            if op == 'read':
+                stats.bytes_read += result
+            elif op == 'map':
+                stats.bytes_mapped += args[1]
+            stats.time += syscall.elapsed
+
+    def _on_exit(self, event):
+        self._pending.pop(event.pid, None)
+
+    def _on_killed(self, event):
+        self._pending.pop(event.pid, None)
+
+
+def format_startup_profile(profile):
+    """Format the startup profile as tables.
+
+    :param profile: the profile.
+    :type profile: :class:`StartupProfile`.
+
+    :returns: the report.
+    :rtype: str.
+    """
+    lines = []
+    if profile.marker is None:
+        marker = _('exit')
+    else:
+        marker = profile.marker
+    lines.append(_("Startup: {:.6f} seconds (until {})").format(
+        profile.duration, marker))
+    lines.append(_("System calls: {} ({:.6f} seconds)").format(
+        profile.n_calls, profile.time))
+    for title, stats in ((_("By file name:"), profile.objects),
+                         (_("By directory:"), profile.directories)):
+        lines.append('')
+        lines.append(title)
+        lines.append("{:>11} {:>8} {:>8} {:>12} {:>12} {}".format(
+            _('seconds'), _('probes'), _('failed'), _('mapped'), _('read'),
+            _('name')))
+        for s in stats:
+            lines.append("{:>11.6f} {:>8} {:>8} {:>12} {:>12} {}".format(
+                s.time, s.n_probes, s.n_failures, s.bytes_mapped,
+                s.bytes_read, s.name))
+    return '\n'.join(lines) + '\n'
+
+
+class CallSite:
+    __slots__ = ['syscall', 'frames', 'count', 'time']
+
+    def __init__(self, s, f, c, t):
+        self.syscall = s
+        self.frames = f
+        self.count = c
+        self.time = t
+
+
+class CallSiteTracer(TracerPlus):
+    """Attribute the system calls to the code issuing them.
+
+    On the entry of a system call, the instruction pointer is captured and,
+    if `depth` is set, the return addresses of up to `depth` callers: the
+    one at the top of the stack (the system call wrappers are usually leaf
+    functions), then the ones found by walking the frame pointers. The
+    addresses are checked against the memory map of the process, and
+    recorded as offsets in the mapped files.
+
+    The calls and their time are aggregated by system call and call stack.
+    The locations are only symbolized for the report, from the symbol
+    tables of the files, parsed once per file.
+    """
+    # Size of the top of the stack read at once when walking the frames
+    STACK_WINDOW = 4096
+
+    def __init__(self, args, quiet=True):
+        TracerPlus.__init__(self, args, quiet=quiet)
+        from .memmap import MemoryTracker, PROT_EXEC
+        self.mem_tracker = MemoryTracker()
+        self.depth = 0
+        self.top = 20
+        self._wanted = None
+        self._pending = {}
+        self._sites = {}
+        self._word = struct.Struct('P')
+        self._frame = struct.Struct('PP')
+        self._prot_exec = PROT_EXEC
+
+    def filter_syscalls(self, names):
+        if names:
+            self._wanted = frozenset(convert_names(names))
+        else:
+            self._wanted = None
+
+    @property
+    def stats(self):
+        """The most frequent call sites, as :class:`CallSite` objects"""
+        sites = sorted(self._sites.items(), key=lambda s: -s[1][0])
+        return [CallSite(get_syscall_name(num),
+                         [_format_location(p, o) for p, o in frames],
+                         count, time)
+                for (num, frames), (count, time) in sites[:self.top]]
+
+    def _get_profiled_phases(self):
+        phases = TracerPlus._get_profiled_phases(self)
+        phases['_walk_stack'] = 'decode'
+        return phases
+
+    def _locate(self, maps, addr):
+        mapping = maps.lookup(addr)
+        if mapping is None or not mapping.name:
+            return ('', addr)
+        return (mapping.name, addr - mapping.start + mapping.offset)
+
+    def _walk_stack(self, pid, maps, sp, fp):
+        stack = maps.lookup(sp)
+        if stack is None:
+            return []
+        data = ptrace.getdata(pid, sp, min(self.STACK_WINDOW, stack.end - sp))
+        callers = []
+        ret = self._word.unpack_from(data)[0]
+        if maps.is_valid(ret, 1, self._prot_exec):
+            callers.append(ret)
+        size = self._frame.size
+        while len(callers) < self.depth and fp:
+            if sp <= fp and fp + size <= sp + len(data):
+                frame = self._frame.unpack_from(data, fp - sp)
+            elif maps.is_valid(fp, size):
+                frame = self._frame.unpack(ptrace.getdata(pid, fp, size))
+            else:
+                break
+            next_fp, ret = frame
+            if not maps.is_valid(ret, 1, self._prot_exec):
+                break
+            callers.append(ret)
+            if next_fp <= fp:
+                break
+            fp = next_fp
+        return callers
+
+    def _on_syscall_enter(self, syscall):
+        if self._wanted is not None and syscall.num not in self._wanted:
+            return
+        maps = self._tracer[syscall.pid].maps
+        if maps is None:
+            return
+        pc, sp, fp = syscall.collect_frame()
+        frames = [self._locate(maps, pc)]
+        if self.depth:
+            try:
+                callers = self._walk_stack(syscall.pid, maps, sp, fp)
+            except OSError:
+                callers = []
+            # A return address follows the call instruction
+            frames += [self._locate(maps, ret - 1) for ret in callers]
+        self._pending[syscall.pid] = tuple(frames)
+
+    def _on_syscall_exit(self, syscall):
+        frames = self._pending.pop(syscall.pid, None)
+        if frames is None:
+            return
+        key = (syscall.num, frames)
+        site = self._sites.get(key)
+        if site is None:
+            self._sites[key] = [1, syscall.elapsed]
+        else:
+            site[0] += 1
+            site[1] += syscall.elapsed
+
+    def _on_exit(self, event):
+        self._pending.pop(event.pid, None)
+
+    def _on_killed(self, event):
+        self._pending.pop(event.pid, None)
+
+
+def _format_location(path, offset):
+    if not path:
+        return '{:#x}'.format(offset)
+    from .elf import symbolize
+    return symbolize(path, offset)
+
+
+def format_callsite_report(sites):
+    """Format the call sites as a table.
+
+    :param sites: the call sites.
+    :type sites: list of :class:`CallSite`.
+
+    :returns: the report.
+    :rtype: str.
+    """
+    lines = []
+    lines.append("{:>9} {:>11} {:<16} {}".format(_('calls'), _('seconds'),
+                                                 _('syscall'),
+                                                 _('call site')))
+    for site in sites:
+        lines.append("{:>9} {:>11.6f} {:<16} {}".format(
+            site.count, site.time, site.syscall, site.frames[0]))
+        for frame in site.frames[1:]:
+            lines.append("{:>39}<- {}".format('', frame))
+    return '\n'.join(lines) + '\n'
+
+
+class CallCountTracer(TracerPlus):
+    """Count the calls of functions of the traced programs.
+
+    A counting breakpoint is set at the entry of each function, in the
+    program run by each process (on exec, or when attaching). The system
+    calls are not traced: the processes only stop in the tracer on fork,
+    exec and exit. While a single process is traced, the hits are handled by
+    the extension without returning to the tracer.
+
+    Only the functions of the programs can be counted: the shared libraries
+    are not loaded yet on exec.
+    """
+    def __init__(self, args, quiet=True):
+        TracerPlus.__init__(self, args, quiet=quiet)
+        self.functions = ()
+        # Program and function names of the breakpoints of each process,
+        # and the token of its breakpoint manager
+        self._programs = {}
+        # Hits of each breakpoint manager, by token, saved before it is
+        # dropped. The tokens are never reused, unlike the ids of the
+        # managers.
+        self._saved = {}
+        self._tokens = itertools.count()
+
+    @property
+    def stats(self):
+        """The number of calls, by program and function name"""
+        counts = {}
+        for manager, program, names, hits in self._saved.values():
+            if manager is not None:
+                hits = manager.hits
+            for address, count in hits.items():
+                key = (program, names[address])
+                counts[key] = counts.get(key, 0) + count
+        return sorted(counts.items(), key=lambda c: (-c[1], c[0]))
+
+    def _trace_syscalls(self, proc):
+        return False
+
+    def _resume(self, proc, signum=0):
+        if proc.breakpoints is None or len(self._tracer) > 1 or \
+           self._detaching:
+            TracerPlus._resume(self, proc, signum)
+            return
+        started = monotonic()
+        status = proc.run_counting(signum)
+        # The process ran in the extension: this is not time spent tracing
+        self._busy_time -= monotonic() - started
+        self._tracer.push_status(proc.pid, status)
+
+    def _set_breakpoints(self, proc):
+        from .elf import get_symbol_index
+        from .memmap import MemoryMap
+        from .breakpoints import BreakpointError
+        try:
+            path = os.readlink('/proc/{}/exe'.format(proc.pid))
+        except OSError:
+            return
+        index = get_symbol_index(path)
+        if index is None:
+            return
+        maps = MemoryMap()
+        maps.resync(proc.pid)
+        names = {}
+        for name in self.functions:
+            address = index.find(name)
+            if address is not None:
+                address = index.to_offset(address)
+            if address is not None:
+                address = maps.find_file_offset(path, address)
+            if address is None or address in names:
+                continue
+            try:
+                proc.insert_breakpoint(address, counting=True)
+            except BreakpointError as e:
+                debug(str(e))
+                continue
+            names[address] = name
+        if names:
+            program = os.path.basename(path)
+            token = next(self._tokens)
+            self._programs[proc.pid] = (program, names, token)
+            self._saved[token] = (proc.breakpoints, program, names, None)
+
+    def _save_hits(self, proc):
+        manager = proc.breakpoints
+        if manager is None or proc.pid not in self._programs:
+            return
+        program, names, token = self._programs[proc.pid]
+        # The manager is dropped from the memory: only keep its hits
+        self._saved[token] = (None, program, names, manager.hits)
+
+    def _on_event(self, event):
+        if isinstance(event, (ExecutionEvent, ExitedEvent, KilledEvent)):
+            if event.pid in self._tracer:
+                self._save_hits(self._tracer[event.pid])
+            if not isinstance(event, ExecutionEvent):
+                self._programs.pop(event.pid, None)
+
+    def _on_tracing_started(self, proc):
+        if self.attach_pids:
+            self._set_breakpoints(proc)
+
+    def _on_exec(self, event):
+        self._programs.pop(event.pid, None)
+        self._set_breakpoints(self._tracer[event.pid])
+
+    def _on_fork(self, event):
+        if event.pid in self._programs:
+            program, names, token = self._programs[event.pid]
+            if not isinstance(event, CloneEvent):
+                # The child gets a copy of the breakpoints
+                token = next(self._tokens)
+            self._programs[event.child_pid] = (program, names, token)
+
+
+def format_call_counts(counts):
+    """Format the numbers of calls of the functions as a table.
+
+    :param counts: the numbers of calls, by program and function name.
+    :type counts: list of tuple.
+
+    :returns: the report.
+    :rtype: str.
+    """
+    lines = []
+    lines.append("{:>12} {:<24} {}".format(_('calls'), _('function'),
+                                           _('program')))
+    for (program, function), count in counts:
+        lines.append("{:>12} {:<24} {}".format(count, function, program))
+    return '\n'.join(lines) + '\n'
+
+
+class DelayStats:
+    """Delays injected into a system call"""
+    __slots__ = ['name', 'n_delayed', 'total', 'longest']
+
+    def __init__(self, name):
+        self.name = name
+        self.n_delayed = 0
+        self.total = 0.0
+        self.longest = 0.0
+
+    def as_dict(self):
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+
+class LatencyTracer(TracerPlus):
+    """Inject latency into the system calls of a program, to test how it
+    behaves on a slow disk or network.
+
+    The system calls selected by a rule (see
+    :class:`ptraceplus.injection.DelayRule`) are held for a delay drawn
+    from its distribution; the first matching rule applies. The held
+    process stays stopped, while the other processes keep running.
+
+    The paths looked up are compared as passed to the system calls, the
+    ones of the file descriptors as found in the descriptor table. The
+    delays are drawn from `rng`, which can be seeded to replay a run.
+    """
+    def __init__(self, args, quiet=True, seed=None):
+        TracerPlus.__init__(self, args, quiet=quiet)
+        self.rng = random.Random(seed)
+        self._rules = []
+        self._selected = {}
+        self._lookups = {}
+        self._pending = {}
+        self._stats = {}
+        self._file_kind = None
+        for num, name in get_syscall_names().items():
+            if name in LOOKUP_SYSCALLS:
+                self._lookups[num] = LOOKUP_SYSCALLS[name]
+
+    @property
+    def rules(self):
+        return list(self._rules)
+
+    @property
+    def stats(self):
+        """Delays injected by system call, the longest total first"""
+        return sorted(list(self._stats.values()), key=lambda s: -s.total)
+
+    def live_stats(self):
+        stats = TracerPlus.live_stats(self)
+        stats['delays'] = [s.as_dict() for s in self.stats]
+        return stats
+
+    def add_rule(self, rule):
+        """Add a rule selecting system calls to delay.
+
+        :param rule: the rule.
+        :type rule: :class:`ptraceplus.injection.DelayRule`.
+        """
+        self._rules.append(rule)
+        for num, name in get_syscall_names().items():
+            if not rule.syscalls or name in rule.syscalls:
+                self._selected.setdefault(num, []).append(rule)
+        if rule.needs_target and self.fd_tracker is None:
+            from .fdtable import FdTracker, FD_KIND_FILE
+            self.fd_tracker = FdTracker()
+            self._file_kind = FD_KIND_FILE
+
+    def _get_target(self, syscall):
+        args = syscall.collect_args()
+        index = self._lookups.get(syscall.num)
+        if index is not None:
+            try:
+                path = ptrace.getstr(syscall.pid, args[index])
+            except (OSError, MemoryError, UnicodeDecodeError):
+                return None, None
+            return path, self._file_kind
+        prototype = syscall.prototype
+        if not prototype or prototype[0][1] != 'fd':
+            return None, None
+        table = self._tracer[syscall.pid].fds
+        entry = table.get(args[0] & 0xffffffff) if table else None
+        if entry is None:
+            return None, None
+        return entry.target, entry.kind
+
+    def _select(self, syscall):
+        target = None
+        for rule in self._selected[syscall.num]:
+            if rule.pids and syscall.pid not in rule.pids:
+                continue
+            if rule.needs_target:
+                if target is None:
+                    target = self._get_target(syscall)
+                if not rule.match_target(*target):
+                    continue
+            return rule
+        return None
+
+    def _delay(self, syscall, delay):
+        self.hold(syscall.pid, delay)
+        stats = self._stats.get(syscall.num)
+        if stats is None:
+            stats = DelayStats(syscall.name)
+            self._stats[syscall.num] = stats
+        stats.n_delayed += 1
+        stats.total += delay
+        stats.longest = max(stats.longest, delay)
+
+    def _on_syscall_enter(self, syscall):
+        # The path must be read on entry, and the descriptor may be closed
+        if syscall.num not in self._selected:
+            return
+        rule = self._select(syscall)
+        if rule is None:
+            return
+        delay = rule.delay.draw(self.rng)
+        if rule.at_entry:
+            self._delay(syscall, delay)
+        else:
+            self._pending[syscall.pid] = delay
+
+    def _on_syscall_exit(self, syscall):
+        delay = self._pending.pop(syscall.pid, None)
+        if delay is not None:
+            self._delay(syscall, delay)
+
+    def _on_exit(self, event):
+        self._pending.pop(event.pid, None)
+
+    def _on_killed(self, event):
+        self._pending.pop(event.pid, None)
+
+
+def format_latency_report(stats):
+    """Format the delays injected into the system calls as a table.
+
+    :param stats: the delays, by system call.
+    :type stats: list of :class:`DelayStats`.
+
+    :returns: the report.
+    :rtype: str.
+    """
+    lines = []
+    lines.append("{:>11} {:>8} {:>11} {}".format(
+        _('seconds'), _('calls'), _('longest'), _('syscall')))
+    for s in stats:
+        lines.append("{:>11.6f} {:>8} {:>11.6f} {}".format(
+            s.total, s.n_delayed, s.longest, s.name))
+    return '\n'.join(lines) + '\n'
 
 # vim: ts=4 sts=4 sw=4 sta et ai
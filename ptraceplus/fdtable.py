@@ -0,0 +1,477 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+File descriptor tables
+
+The table of a process is updated from the system calls creating,
+duplicating and closing its file descriptors, so that the file or the
+endpoint behind a descriptor is known without reading /proc. The
+/proc/<pid>/fd directory is only read to resynchronize a table, when some
+system calls of the process were not traced.
+"""
+
+import os
+import errno
+import socket
+import struct
+import functools
+import ptraceminus as ptrace
+from gettext import gettext as _
+from .common import debug, DEBUG
+from .syscalls.helpers import get_syscall_names, is_error_result
+
+(FD_KIND_FILE, FD_KIND_PIPE, FD_KIND_SOCKET, FD_KIND_ANON,
+ FD_KIND_UNKNOWN) = ('file', 'pipe', 'socket', 'anon', 'unknown')
+
+AT_FDCWD = -100
+F_DUPFD = 0
+F_SETFD = 2
+F_DUPFD_CLOEXEC = 1030
+FD_CLOEXEC = 1
+MFD_CLOEXEC = 1
+CLOSE_RANGE_CLOEXEC = 4
+
+
+class FdEntry(object):
+    """File referenced by a file descriptor.
+
+    :param kind: kind of the file (one of the FD_KIND_* constants).
+    :type kind: str.
+
+    :param target: path of the file, or endpoint of the socket.
+    :type target: str.
+
+    :param cloexec: if True, the descriptor is closed on exec.
+    :type cloexec: bool.
+    """
+    __slots__ = ('kind', 'target', 'cloexec')
+
+    def __init__(self, kind, target, cloexec=False):
+        self.kind = kind
+        self.target = target
+        self.cloexec = cloexec
+
+    def __str__(self):
+        return self.target
+
+
+class FdTable(object):
+    """File descriptor table of a process.
+
+    The table is flagged as `stale` when the system calls of the process
+    are not traced: it must then be resynchronized with :meth:`resync`.
+    """
+    def __init__(self):
+        self._fds = {}
+        self.stale = False
+
+    def __len__(self):
+        return len(self._fds)
+
+    def __contains__(self, fd):
+        return fd in self._fds
+
+    def __iter__(self):
+        return iter(sorted(self._fds))
+
+    def __getitem__(self, fd):
+        return self._fds[fd]
+
+    def get(self, fd):
+        """Return the entry of a file descriptor (or None)"""
+        return self._fds.get(fd)
+
+    def lookup(self, fd):
+        """Return the path or the endpoint of a file descriptor (or None)"""
+        entry = self._fds.get(fd)
+        if entry is None:
+            return None
+        return entry.target
+
+    def add(self, fd, kind, target, cloexec=False):
+        """Register a new file descriptor.
+
+        :param fd: the file descriptor.
+        :type fd: int.
+
+        :param kind: kind of the file (one of the FD_KIND_* constants).
+        :type kind: str.
+
+        :param target: path of the file, or endpoint of the socket.
+        :type target: str.
+
+        :param cloexec: if True, the descriptor is closed on exec.
+        :type cloexec: bool.
+
+        :returns: the entry of the descriptor.
+        :rtype: :class:`FdEntry`.
+        """
+        entry = FdEntry(kind, target, cloexec)
+        self._fds[fd] = entry
+        return entry
+
+    def dup(self, oldfd, newfd, cloexec=False):
+        """Duplicate a file descriptor.
+
+        :param oldfd: the file descriptor to duplicate.
+        :type oldfd: int.
+
+        :param newfd: the new file descriptor.
+        :type newfd: int.
+
+        :param cloexec: if True, the new descriptor is closed on exec.
+        :type cloexec: bool.
+        """
+        entry = self._fds.get(oldfd)
+        if entry is None:
+            self.add(newfd, FD_KIND_UNKNOWN, '?', cloexec)
+        else:
+            self.add(newfd, entry.kind, entry.target, cloexec)
+
+    def close(self, fd):
+        """Remove a file descriptor"""
+        self._fds.pop(fd, None)
+
+    def close_range(self, first, last, cloexec=False):
+        """Remove the file descriptors in a range.
+
+        :param first: the first file descriptor.
+        :type first: int.
+
+        :param last: the last file descriptor (included).
+        :type last: int.
+
+        :param cloexec: if True, the descriptors are flagged as closed on
+                        exec instead.
+        :type cloexec: bool.
+        """
+        fds = [fd for fd in self._fds if first <= fd <= last]
+        for fd in fds:
+            if cloexec:
+                self._fds[fd].cloexec = True
+            else:
+                del self._fds[fd]
+
+    def set_cloexec(self, fd, cloexec):
+        """Set or clear the close-on-exec flag of a file descriptor"""
+        entry = self._fds.get(fd)
+        if entry is not None:
+            entry.cloexec = cloexec
+
+    def execute(self):
+        """Remove the file descriptors closed on exec"""
+        fds = [fd for fd, e in self._fds.items() if e.cloexec]
+        for fd in fds:
+            del self._fds[fd]
+
+    def copy(self):
+        """Copy the table, for a forked process.
+
+        :returns: the new table.
+        :rtype: :class:`FdTable`.
+        """
+        table = FdTable()
+        for fd, e in self._fds.items():
+            table._fds[fd] = FdEntry(e.kind, e.target, e.cloexec)
+        table.stale = self.stale
+        return table
+
+    def resync(self, pid):
+        """Read the table of a process from /proc.
+
+        :param pid: PID of the process.
+        :type pid: int.
+
+        :returns: True if the table was read.
+        :rtype: bool.
+        """
+        if DEBUG:
+            debug(_("Reading file descriptors of {}"), pid)
+        path = '/proc/{}/fd'.format(pid)
+        try:
+            names = os.listdir(path)
+        except OSError:
+            return False
+        fds = {}
+        for name in names:
+            try:
+                target = os.readlink(os.path.join(path, name))
+            except OSError:
+                continue
+            fd = int(name)
+            fds[fd] = FdEntry(_get_kind(target), target,
+                              _read_cloexec(pid, fd))
+        self._fds = fds
+        self.stale = False
+        return True
+
+
+def _get_kind(target):
+    if target.startswith('/'):
+        return FD_KIND_FILE
+    elif target.startswith('pipe:'):
+        return FD_KIND_PIPE
+    elif target.startswith('socket:'):
+        return FD_KIND_SOCKET
+    else:
+        return FD_KIND_ANON
+
+
+def _read_cloexec(pid, fd):
+    try:
+        with open('/proc/{}/fdinfo/{}'.format(pid, fd)) as f:
+            for line in f:
+                if line.startswith('flags:'):
+                    return bool(int(line.split()[1], 8) & os.O_CLOEXEC)
+    except (OSError, ValueError):
+        pass
+    return False
+
+
+def _to_int(value):
+    value &= 0xffffffff
+    if value & 0x80000000:
+        value -= 0x100000000
+    return value
+
+
+def _get_cloexec(args, flags_index):
+    # O_CLOEXEC, SOCK_CLOEXEC, EFD_CLOEXEC, ... share the same value
+    if flags_index is None:
+        return False
+    return bool(args[flags_index] & os.O_CLOEXEC)
+
+
+def format_sockaddr(data):
+    """Format a socket address.
+
+    :param data: the address (struct sockaddr).
+    :type data: bytes.
+
+    :returns: the address, as 'unix:PATH', 'inet:ADDR:PORT' or
+              'inet6:[ADDR]:PORT'.
+    :rtype: str.
+    """
+    if len(data) < 2:
+        return '?'
+    family = struct.unpack_from('=H', data)[0]
+    if family == socket.AF_UNIX:
+        path = data[2:]
+        if path[:1] == b'\0':
+            path = b'@' + path[1:]
+        else:
+            path = path.split(b'\0', 1)[0]
+        return 'unix:' + path.decode('utf-8', 'replace')
+    elif family == socket.AF_INET and len(data) >= 8:
+        port = struct.unpack_from('!H', data, 2)[0]
+        addr = socket.inet_ntop(socket.AF_INET, data[4:8])
+        return 'inet:{}:{}'.format(addr, port)
+    elif family == socket.AF_INET6 and len(data) >= 24:
+        port = struct.unpack_from('!H', data, 2)[0]
+        addr = socket.inet_ntop(socket.AF_INET6, data[8:24])
+        return 'inet6:[{}]:{}'.format(addr, port)
+    return _format_family(family)
+
+
+def _format_family(family):
+    try:
+        return 'socket:' + socket.AddressFamily(family).name
+    except ValueError:
+        return 'socket:{}'.format(family)
+
+
+class FdTracker(object):
+    """Update the file descriptor tables of the processes.
+
+    Only the exit of the system calls is handled: their parameters are read
+    again from the registers, without decoding the other system calls.
+    """
+    def __init__(self):
+        anon = self._on_anon
+        handlers = {
+            'open': functools.partial(self._on_open, None, 0, 1),
+            'creat': functools.partial(self._on_open, None, 0, None),
+            'openat': functools.partial(self._on_open, 0, 1, 2),
+            'openat2': self._on_openat2,
+            'socket': self._on_socket,
+            'bind': self._on_address,
+            'connect': self._on_address,
+            'accept': functools.partial(self._on_accept, None),
+            'accept4': functools.partial(self._on_accept, 3),
+            'dup': functools.partial(self._on_dup, None),
+            'dup2': functools.partial(self._on_dup, None),
+            'dup3': functools.partial(self._on_dup, 2),
+            'pipe': functools.partial(self._on_pipe, None),
+            'pipe2': functools.partial(self._on_pipe, 1),
+            'socketpair': self._on_socketpair,
+            'fcntl': self._on_fcntl,
+            'fcntl64': self._on_fcntl,
+            'close': self._on_close,
+            'close_range': self._on_close_range,
+            'memfd_create': self._on_memfd,
+            'eventfd': functools.partial(anon, '[eventfd]', None),
+            'eventfd2': functools.partial(anon, '[eventfd]', 1),
+            'epoll_create': functools.partial(anon, '[eventpoll]', None),
+            'epoll_create1': functools.partial(anon, '[eventpoll]', 0),
+            'signalfd': functools.partial(anon, '[signalfd]', None),
+            'signalfd4': functools.partial(anon, '[signalfd]', 3),
+            'timerfd_create': functools.partial(anon, '[timerfd]', 1),
+            'inotify_init': functools.partial(anon, 'inotify', None),
+            'inotify_init1': functools.partial(anon, 'inotify', 0),
+            'pidfd_open': functools.partial(anon, '[pidfd]', None),
+            'userfaultfd': functools.partial(anon, '[userfaultfd]', 0),
+        }
+        self._handlers = dict((num, handlers[name])
+                              for num, name in get_syscall_names().items()
+                              if name in handlers)
+
+    def __contains__(self, num):
+        return num in self._handlers
+
+    def update(self, table, syscall):
+        """Update a table from the exit of a system call.
+
+        :param table: the table of the process.
+        :type table: :class:`FdTable`.
+
+        :param syscall: the system call.
+        :type syscall: :class:`ptraceplus.syscalls.core.Syscall`.
+
+        :returns: True if the system call was handled.
+        :rtype: bool.
+        """
+        handler = self._handlers.get(syscall.num)
+        if handler is None:
+            return False
+        result = syscall.collect_retval()
+        # Linux releases the descriptor even if close() fails
+        if is_error_result(result) and (handler != self._on_close or
+                                        result == -errno.EBADF):
+            return True
+        args = syscall.collect_args()
+        try:
+            handler(table, syscall.pid, result, args)
+        except OSError as e:
+            if DEBUG:
+                debug(_("Can not decode {} for {} ({})"), syscall.name,
+                      syscall.pid, e)
+            table.resync(syscall.pid)
+        return True
+
+    def _resolve(self, table, pid, dirfd, path):
+        if path.startswith('/'):
+            return path
+        if dirfd == AT_FDCWD:
+            try:
+                base = os.readlink('/proc/{}/cwd'.format(pid))
+            except OSError:
+                return path
+        else:
+            base = table.lookup(dirfd)
+            if base is None:
+                return path
+        return os.path.normpath(os.path.join(base, path))
+
+    def _on_open(self, dirfd_index, path_index, flags_index, table, pid,
+                 result, args):
+        path = ptrace.getstr(pid, args[path_index])
+        if dirfd_index is None:
+            dirfd = AT_FDCWD
+        else:
+            dirfd = _to_int(args[dirfd_index])
+        path = self._resolve(table, pid, dirfd, path)
+        table.add(result, FD_KIND_FILE, path,
+                  _get_cloexec(args, flags_index))
+
+    def _on_openat2(self, table, pid, result, args):
+        path = ptrace.getstr(pid, args[1])
+        path = self._resolve(table, pid, _to_int(args[0]), path)
+        flags = struct.unpack('=Q', ptrace.getdata(pid, args[2], 8))[0]
+        table.add(result, FD_KIND_FILE, path, bool(flags & os.O_CLOEXEC))
+
+    def _on_socket(self, table, pid, result, args):
+        cloexec = bool(args[1] & socket.SOCK_CLOEXEC)
+        table.add(result, FD_KIND_SOCKET, _format_family(_to_int(args[0])),
+                  cloexec)
+
+    def _read_sockaddr(self, pid, addr, size):
+        if not addr or size <= 0:
+            return None
+        return format_sockaddr(ptrace.getdata(pid, addr, min(size, 128)))
+
+    def _on_address(self, table, pid, result, args):
+        entry = table.get(_to_int(args[0]))
+        if entry is not None:
+            target = self._read_sockaddr(pid, args[1], _to_int(args[2]))
+            if target:
+                entry.target = target
+
+    def _on_accept(self, flags_index, table, pid, result, args):
+        target = None
+        if args[1] and args[2]:
+            size = struct.unpack('=i', ptrace.getdata(pid, args[2], 4))[0]
+            target = self._read_sockaddr(pid, args[1], size)
+        if not target:
+            target = table.lookup(_to_int(args[0])) or 'socket:?'
+        table.add(result, FD_KIND_SOCKET, target,
+                  _get_cloexec(args, flags_index))
+
+    def _on_dup(self, flags_index, table, pid, result, args):
+        table.dup(_to_int(args[0]), result, _get_cloexec(args, flags_index))
+
+    def _on_pipe(self, flags_index, table, pid, result, args):
+        rfd, wfd = struct.unpack('=ii', ptrace.getdata(pid, args[0], 8))
+        cloexec = _get_cloexec(args, flags_index)
+        table.add(rfd, FD_KIND_PIPE, 'pipe', cloexec)
+        table.add(wfd, FD_KIND_PIPE, 'pipe', cloexec)
+
+    def _on_socketpair(self, table, pid, result, args):
+        fd0, fd1 = struct.unpack('=ii', ptrace.getdata(pid, args[3], 8))
+        target = _format_family(_to_int(args[0]))
+        cloexec = bool(args[1] & socket.SOCK_CLOEXEC)
+        table.add(fd0, FD_KIND_SOCKET, target, cloexec)
+        table.add(fd1, FD_KIND_SOCKET, target, cloexec)
+
+    def _on_fcntl(self, table, pid, result, args):
+        fd = _to_int(args[0])
+        cmd = _to_int(args[1])
+        if cmd in (F_DUPFD, F_DUPFD_CLOEXEC):
+            table.dup(fd, result, cmd == F_DUPFD_CLOEXEC)
+        elif cmd == F_SETFD:
+            table.set_cloexec(fd, bool(args[2] & FD_CLOEXEC))
+
+    def _on_close(self, table, pid, result, args):
+        table.close(_to_int(args[0]))
+
+    def _on_close_range(self, table, pid, result, args):
+        table.close_range(args[0] & 0xffffffff, args[1] & 0xffffffff,
+                          bool(args[2] & CLOSE_RANGE_CLOEXEC))
+
+    def _on_memfd(self, table, pid, result, args):
+        name = ptrace.getstr(pid, args[0])
+        table.add(result, FD_KIND_FILE, '/memfd:' + name,
+                  bool(args[1] & MFD_CLOEXEC))
+
+    def _on_anon(self, name, flags_index, table, pid, result, args):
+        table.add(result, FD_KIND_ANON, 'anon_inode:' + name,
+                  _get_cloexec(args, flags_index))
+
+# vim: ts=4 sts=4 sw=4 sta et ai
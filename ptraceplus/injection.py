@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Latency injection
+
+A delay rule selects system calls by name, by process, by the path they
+look up or the one behind their file descriptor, and by the kind of the
+descriptor. The tracer holds the selected calls, on their entry or on their
+exit, for a duration drawn from the distribution of the rule: this emulates
+a slow disk or network.
+"""
+
+from gettext import gettext as _
+from .fdtable import (FD_KIND_FILE, FD_KIND_PIPE, FD_KIND_SOCKET,
+                      FD_KIND_ANON, FD_KIND_UNKNOWN)
+
+FD_KINDS = (FD_KIND_FILE, FD_KIND_PIPE, FD_KIND_SOCKET, FD_KIND_ANON,
+            FD_KIND_UNKNOWN)
+
+# The longest suffixes first, as 'ms' ends with 's'
+_UNITS = (('us', 1e-6), ('ms', 1e-3), ('s', 1.0))
+
+
+class InjectionError(Exception):
+    """Error raised when a delay or a delay rule is invalid"""
+
+
+def parse_duration(text):
+    """Parse a duration.
+
+    :param text: a number of seconds, or a number followed by 's', 'ms' or
+                 'us'.
+    :type text: str.
+
+    :returns: the duration, in seconds.
+    :rtype: float.
+    """
+    number, scale = text, 1.0
+    for suffix, value in _UNITS:
+        if text.endswith(suffix):
+            number, scale = text[:-len(suffix)], value
+            break
+    try:
+        duration = float(number) * scale
+    except ValueError:
+        raise InjectionError(_("Invalid duration '{}'").format(text))
+    if duration < 0 or duration != duration:
+        raise InjectionError(_("Invalid duration '{}'").format(text))
+    return duration
+
+
+class Delay(object):
+    """Base class of the delay distributions: a fixed duration.
+
+    :param duration: the duration, in seconds.
+    :type duration: float.
+    """
+    def __init__(self, duration):
+        self.duration = duration
+
+    @property
+    def mean(self):
+        return self.duration
+
+    def draw(self, rng):
+        """Draw a delay.
+
+        :param rng: the random number generator.
+        :type rng: :class:`random.Random`.
+
+        :returns: the delay, in seconds.
+        :rtype: float.
+        """
+        return self.duration
+
+    def __str__(self):
+        return "{:g}ms".format(self.duration * 1000)
+
+
+class UniformDelay(Delay):
+    """Delays uniformly distributed between two durations"""
+    def __init__(self, low, high):
+        Delay.__init__(self, low)
+        self.high = high
+
+    @property
+    def mean(self):
+        return (self.duration + self.high) / 2
+
+    def draw(self, rng):
+        return rng.uniform(self.duration, self.high)
+
+    def __str__(self):
+        return "{:g}ms-{:g}ms".format(self.duration * 1000, self.high * 1000)
+
+
+class ExponentialDelay(Delay):
+    """Exponentially distributed delays, such as the service times of a
+    busy device.
+    """
+    def draw(self, rng):
+        if not self.duration:
+            return 0.0
+        return rng.expovariate(1.0 / self.duration)
+
+    def __str__(self):
+        return "exp:{:g}ms".format(self.duration * 1000)
+
+
+def create_delay(spec):
+    """Create a delay distribution from its description.
+
+    The description is one of:
+
+    - 'D': a fixed delay,
+    - 'MIN-MAX': a delay uniformly distributed between MIN and MAX,
+    - 'exp:MEAN': an exponentially distributed delay.
+
+    The durations are parsed by :func:`parse_duration`.
+
+    :param spec: description of the distribution.
+    :type spec: str.
+
+    :returns: the distribution.
+    :rtype: :class:`Delay`.
+    """
+    try:
+        if spec.startswith('exp:'):
+            return ExponentialDelay(parse_duration(spec[4:]))
+        elif '-' in spec:
+            low, high = (parse_duration(d) for d in spec.split('-', 1))
+            if low > high:
+                raise InjectionError()
+            return UniformDelay(low, high)
+        else:
+            return Delay(parse_duration(spec))
+    except InjectionError:
+        raise InjectionError(_("Invalid delay '{}'").format(spec))
+
+
+class DelayRule(object):
+    """Selection of the system calls to delay.
+
+    A system call is selected if it matches all the criteria given.
+
+    :param delay: distribution of the delays.
+    :type delay: :class:`Delay`.
+
+    :param syscalls: names of the system calls (all if empty).
+    :type syscalls: list of str.
+
+    :param paths: prefixes of the path looked up by the system call, or of
+                  the one of its file descriptor.
+    :type paths: list of str.
+
+    :param fd_kinds: kinds of the file descriptor of the system call (the
+                     system calls looking up a path are on files).
+    :type fd_kinds: list of str.
+
+    :param pids: PIDs of the processes (or threads) issuing the calls.
+    :type pids: list of int.
+
+    :param at_entry: if True, the calls are held on entry, before they are
+                     executed, and on exit otherwise.
+    :type at_entry: bool.
+    """
+    def __init__(self, delay, syscalls=(), paths=(), fd_kinds=(), pids=(),
+                 at_entry=False):
+        for kind in fd_kinds:
+            if kind not in FD_KINDS:
+                msg = _("Unknown file descriptor kind '{}'")
+                raise InjectionError(msg.format(kind))
+        self.delay = delay
+        self.syscalls = frozenset(syscalls)
+        self.paths = tuple(paths)
+        self.fd_kinds = frozenset(fd_kinds)
+        self.pids = frozenset(pids)
+        self.at_entry = at_entry
+
+    @property
+    def needs_target(self):
+        """True if the path or the descriptor of the calls is checked"""
+        return bool(self.paths or self.fd_kinds)
+
+    def match_target(self, path, kind):
+        """Check the path and the descriptor of a call.
+
+        :param path: the path (or None if unknown).
+        :type path: str.
+
+        :param kind: the kind of the descriptor (or None if unknown).
+        :type kind: str.
+
+        :returns: True if the call is selected.
+        :rtype: bool.
+        """
+        if self.fd_kinds and kind not in self.fd_kinds:
+            return False
+        if self.paths:
+            return path is not None and path.startswith(self.paths)
+        return True
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Parallel tracing of independent commands
+
+Each command is traced in its own session, by a tracer owned by a process
+of a pool. The results are merged in the order of the commands.
+"""
+
+import os
+import shutil
+import tempfile
+import multiprocessing
+from gettext import gettext as _
+from .common import debug
+from .extra import SyscallTracer, ExecutionTracer, merge_tracer_stats
+from .sampling import create_sampler
+
+
+class SyscallTracerFactory(object):
+    """Create a system call tracer for a job.
+
+    :param full: if True, trace all events.
+    :type full: bool.
+
+    :param syscalls: names of the system calls to trace.
+    :type syscalls: list of str.
+
+    :param programs: names of the programs to trace.
+    :type programs: list of str.
+
+    :param summary_only: if True, only count the system calls.
+    :type summary_only: bool.
+
+    :param sampling: description of the sampling policy (or None).
+    :type sampling: str.
+
+    :param detach_unmatched: if True, detach the processes running other
+                             programs.
+    :type detach_unmatched: bool.
+
+    :param follow_children: if False, detach the children of the programs.
+    :type follow_children: bool.
+    """
+    def __init__(self, full=False, syscalls=None, programs=None,
+                 summary_only=False, sampling=None, detach_unmatched=False,
+                 follow_children=True):
+        self.full = full
+        self.syscalls = syscalls or []
+        self.programs = programs or []
+        self.summary_only = summary_only
+        self.sampling = sampling
+        self.detach_unmatched = detach_unmatched
+        self.follow_children = follow_children
+
+    def __call__(self, args, quiet, stream):
+        tracer = SyscallTracer(args, quiet, self.full, stream)
+        tracer.filter_syscalls(self.syscalls)
+        tracer.filter_programs(self.programs)
+        tracer.summary_only = self.summary_only
+        tracer.detach_unmatched = self.detach_unmatched
+        tracer.follow_children = self.follow_children
+        if self.sampling:
+            tracer.sampler = create_sampler(self.sampling)
+        return tracer
+
+
+class ExecutionTracerFactory(object):
+    """Create an execution tracer for a job.
+
+    :param with_files: if True, trace file access.
+    :type with_files: bool.
+
+    :param with_args: if True, get the arguments of the programs.
+    :type with_args: bool.
+
+    :param programs: names of the programs to trace.
+    :type programs: list of str.
+
+    :param detach_unmatched: if True, detach the processes running other
+                             programs.
+    :type detach_unmatched: bool.
+
+    :param follow_children: if False, detach the children of the programs.
+    :type follow_children: bool.
+    """
+    def __init__(self, with_files=False, with_args=False, programs=None,
+                 detach_unmatched=False, follow_children=True):
+        self.with_files = with_files
+        self.with_args = with_args
+        self.programs = programs or []
+        self.detach_unmatched = detach_unmatched
+        self.follow_children = follow_children
+
+    def __call__(self, args, quiet, stream):
+        tracer = ExecutionTracer(args, quiet, stream)
+        tracer.with_files = self.with_files
+        tracer.with_args = self.with_args
+        tracer.with_history = True
+        tracer.detach_unmatched = self.detach_unmatched
+        tracer.follow_children = self.follow_children
+        tracer.filter_programs(self.programs)
+        return tracer
+
+
+class JobResult(object):
+    """Result of a trace session.
+
+    :param index: index of the command.
+    :type index: int.
+
+    :param args: arguments of the command.
+    :type args: list of str.
+    """
+    def __init__(self, index, args):
+        self.index = index
+        self.args = args
+        self.stats = None
+        self.processes = []
+        self.output = None
+        self.error = None
+
+
+class JobReport(object):
+    """Combined report of trace sessions"""
+    def __init__(self):
+        self.results = []
+
+    @property
+    def stats(self):
+        stats = [r.stats for r in self.results if r.stats is not None]
+        return merge_tracer_stats(stats)
+
+    @property
+    def processes(self):
+        processes = []
+        for result in self.results:
+            processes += result.processes
+        return processes
+
+    @property
+    def failures(self):
+        return [r for r in self.results if r.error is not None]
+
+
+def _run_job(task):
+    factory, index, args, quiet, workdir = task
+    result = JobResult(index, list(args))
+    result.output = os.path.join(workdir, '{}.out'.format(index))
+    try:
+        with open(result.output, 'w') as stream:
+            tracer = factory(list(args), quiet, stream)
+            tracer.run()
+        if hasattr(tracer, 'stats'):
+            result.stats = tracer.stats
+        if hasattr(tracer, 'processes'):
+            result.processes = tracer.processes
+    except Exception as e:
+        result.error = str(e)
+    return result
+
+
+class JobRunner(object):
+    """Trace many independent commands in parallel.
+
+    :param factory: picklable callable creating the tracer of a job, given
+                    the arguments of the command, the quiet flag and the
+                    output stream.
+    :type factory: callable.
+
+    :param jobs: number of parallel sessions (default: number of CPUs).
+    :type jobs: int.
+
+    :param quiet: if True, the output of the programs will not be printed.
+    :type quiet: bool.
+    """
+    def __init__(self, factory, jobs=None, quiet=True):
+        self._factory = factory
+        self._jobs = jobs or multiprocessing.cpu_count()
+        self._quiet = quiet
+
+    def run(self, commands, stream=None):
+        """Trace the commands.
+
+        :param commands: arguments of the commands to trace.
+        :type commands: list of list of str.
+
+        :param stream: stream to write the combined output of the tracers
+                       to, in the order of the commands.
+        :type stream: file-like object.
+
+        :returns: the combined report.
+        :rtype: :class:`JobReport`.
+        """
+        report = JobReport()
+        workdir = tempfile.mkdtemp(prefix='ptraceplus-')
+        tasks = [(self._factory, i, c, self._quiet, workdir)
+                 for i, c in enumerate(commands)]
+        context = multiprocessing.get_context('fork')
+        pool = context.Pool(self._jobs)
+        debug(_("Running {} jobs on {} workers"), len(tasks), self._jobs)
+        try:
+            for result in pool.imap(_run_job, tasks):
+                if os.path.exists(result.output):
+                    if stream is not None:
+                        with open(result.output) as f:
+                            shutil.copyfileobj(f, stream)
+                    os.unlink(result.output)
+                result.output = None
+                report.results.append(result)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            shutil.rmtree(workdir, ignore_errors=True)
+        return report
+
+# vim: ts=4 sts=4 sw=4 sta et ai
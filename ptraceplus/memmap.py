@@ -0,0 +1,487 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Address-space maps
+
+The map of a process is an index of its memory mappings, sorted by address,
+so that the mapping holding an address is found with a binary search. It is
+updated from the system calls mapping, moving and unmapping memory: pointers
+can be classified, and the invalid ones rejected, without a ptrace request.
+The /proc/<pid>/maps file is only read to seed a map, on attach and exec,
+and to resynchronize it when some system calls of the process were not
+traced.
+"""
+
+import os
+import bisect
+import functools
+from time import monotonic
+from array import array
+from gettext import gettext as _
+from .common import debug, DEBUG
+from .syscalls.helpers import get_syscall_names, is_error_result
+
+(MAP_KIND_FILE, MAP_KIND_ANON, MAP_KIND_HEAP, MAP_KIND_STACK,
+ MAP_KIND_SPECIAL) = ('file', 'anon', 'heap', 'stack', 'special')
+
+PROT_READ = 1
+PROT_WRITE = 2
+PROT_EXEC = 4
+MAP_ANONYMOUS = 0x20
+MAP_GROWSDOWN = 0x100
+MAP_STACK = 0x20000
+# mmap2() takes the offset in units of 4096 bytes
+MMAP2_UNIT = 4096
+
+PAGE_SIZE = os.sysconf('SC_PAGESIZE')
+
+
+def _page_align(value):
+    return (value + PAGE_SIZE - 1) & ~(PAGE_SIZE - 1)
+
+
+class Mapping(object):
+    """Memory mapping of a process.
+
+    :param start: address of the first byte.
+    :type start: int.
+
+    :param end: address following the last byte.
+    :type end: int.
+
+    :param prot: protection (PROT_* flags).
+    :type prot: int.
+
+    :param kind: kind of the mapping (one of the MAP_KIND_* constants).
+    :type kind: str.
+
+    :param name: path of the mapped file, or name of the mapping.
+    :type name: str.
+
+    :param offset: offset of the mapping in the file.
+    :type offset: int.
+    """
+    __slots__ = ('start', 'end', 'prot', 'kind', 'name', 'offset')
+
+    def __init__(self, start, end, prot, kind, name='', offset=0):
+        self.start = start
+        self.end = end
+        self.prot = prot
+        self.kind = kind
+        self.name = name
+        self.offset = offset
+
+    @property
+    def size(self):
+        return self.end - self.start
+
+    def __str__(self):
+        perms = ''.join(c if self.prot & p else '-' for c, p in
+                        (('r', PROT_READ), ('w', PROT_WRITE),
+                         ('x', PROT_EXEC)))
+        return "{:x}-{:x} {} {}".format(self.start, self.end, perms,
+                                        self.name)
+
+
+class MemoryMap(object):
+    """Memory mappings of a process.
+
+    The total size of the mappings is recorded each time it changes: see
+    `growth`. The map is flagged as `stale` when the system calls of the
+    process are not traced: it must then be resynchronized with
+    :meth:`resync`.
+    """
+    def __init__(self):
+        self._starts = []
+        self._maps = []
+        self._brk_start = None
+        self._brk = None
+        self._times = array('d')
+        self._sizes = array('Q')
+        self.size = 0
+        self.stale = False
+
+    def __len__(self):
+        return len(self._maps)
+
+    def __iter__(self):
+        return iter(list(self._maps))
+
+    @property
+    def growth(self):
+        """The total size of the mappings over time, as (time, size) tuples
+        (monotonic clock).
+        """
+        return list(zip(self._times, self._sizes))
+
+    def _record(self):
+        if not self._sizes or self._sizes[-1] != self.size:
+            self._times.append(monotonic())
+            self._sizes.append(self.size)
+
+    def lookup(self, addr):
+        """Return the mapping holding an address (or None)"""
+        index = bisect.bisect_right(self._starts, addr) - 1
+        if index < 0:
+            return None
+        mapping = self._maps[index]
+        if addr >= mapping.end:
+            return None
+        return mapping
+
+    def find_file_offset(self, name, offset):
+        """Return the address where an offset of a file is mapped.
+
+        :param name: path of the file.
+        :type name: str.
+
+        :param offset: offset in the file.
+        :type offset: int.
+
+        :returns: the address (or None if the offset is not mapped).
+        :rtype: int.
+        """
+        for mapping in self._maps:
+            if mapping.name == name and \
+               mapping.offset <= offset < mapping.offset + mapping.size:
+                return mapping.start + offset - mapping.offset
+        return None
+
+    def classify(self, addr):
+        """Return the kind of the mapping holding an address (or None)"""
+        mapping = self.lookup(addr)
+        if mapping is None:
+            return None
+        return mapping.kind
+
+    def is_valid(self, addr, size=1, prot=PROT_READ):
+        """Check if a range of addresses is mapped with a protection.
+
+        :param addr: address of the first byte.
+        :type addr: int.
+
+        :param size: number of bytes.
+        :type size: int.
+
+        :param prot: protection required (PROT_* flags).
+        :type prot: int.
+
+        :returns: True if all the bytes are mapped with the protection.
+        :rtype: bool.
+        """
+        end = addr + size
+        index = bisect.bisect_right(self._starts, addr) - 1
+        if index < 0:
+            return False
+        while addr < end:
+            if index >= len(self._maps):
+                return False
+            mapping = self._maps[index]
+            if not mapping.start <= addr < mapping.end or \
+               mapping.prot & prot != prot:
+                return False
+            addr = mapping.end
+            index += 1
+        return True
+
+    def _insert(self, mapping):
+        index = bisect.bisect_left(self._starts, mapping.start)
+        self._starts.insert(index, mapping.start)
+        self._maps.insert(index, mapping)
+        self.size += mapping.size
+
+    def _split(self, addr):
+        # Split the mapping holding an address, so that a mapping starts
+        # at this address
+        mapping = self.lookup(addr)
+        if mapping is None or mapping.start == addr:
+            return
+        self._insert(Mapping(addr, mapping.end, mapping.prot, mapping.kind,
+                             mapping.name,
+                             mapping.offset + addr - mapping.start))
+        self.size -= mapping.end - addr
+        mapping.end = addr
+
+    def _remove(self, start, end):
+        self._split(start)
+        self._split(end)
+        first = bisect.bisect_left(self._starts, start)
+        last = bisect.bisect_left(self._starts, end)
+        removed = self._maps[first:last]
+        del self._starts[first:last]
+        del self._maps[first:last]
+        self.size -= sum(m.size for m in removed)
+        return removed
+
+    def map(self, start, length, prot, kind, name='', offset=0):
+        """Add a mapping, replacing the mappings it overlaps.
+
+        :param start: address of the mapping.
+        :type start: int.
+
+        :param length: size of the mapping, in bytes.
+        :type length: int.
+
+        :param prot: protection (PROT_* flags).
+        :type prot: int.
+
+        :param kind: kind of the mapping (one of the MAP_KIND_* constants).
+        :type kind: str.
+
+        :param name: path of the mapped file, or name of the mapping.
+        :type name: str.
+
+        :param offset: offset of the mapping in the file.
+        :type offset: int.
+
+        :returns: the mapping.
+        :rtype: :class:`Mapping`.
+        """
+        end = start + _page_align(length)
+        self._remove(start, end)
+        mapping = Mapping(start, end, prot, kind, name, offset)
+        self._insert(mapping)
+        self._record()
+        return mapping
+
+    def unmap(self, start, length):
+        """Remove the mappings in a range of addresses"""
+        self._remove(start, start + _page_align(length))
+        self._record()
+
+    def protect(self, start, length, prot):
+        """Change the protection of the mappings in a range of addresses"""
+        end = start + _page_align(length)
+        self._split(start)
+        self._split(end)
+        first = bisect.bisect_left(self._starts, start)
+        last = bisect.bisect_left(self._starts, end)
+        for mapping in self._maps[first:last]:
+            mapping.prot = prot
+
+    def remap(self, old_start, old_length, new_start, new_length):
+        """Move and/or resize a mapping.
+
+        :param old_start: address of the mapping.
+        :type old_start: int.
+
+        :param old_length: size of the mapping, in bytes.
+        :type old_length: int.
+
+        :param new_start: new address of the mapping.
+        :type new_start: int.
+
+        :param new_length: new size of the mapping, in bytes.
+        :type new_length: int.
+        """
+        mapping = self.lookup(old_start)
+        if mapping is None:
+            prot, kind, name = PROT_READ | PROT_WRITE, MAP_KIND_ANON, ''
+            offset = 0
+        else:
+            prot, kind, name = mapping.prot, mapping.kind, mapping.name
+            offset = mapping.offset + old_start - mapping.start
+        if old_length:
+            self._remove(old_start, old_start + _page_align(old_length))
+        self.map(new_start, new_length, prot, kind, name, offset)
+
+    def set_brk(self, brk):
+        """Update the heap from the program break.
+
+        :param brk: the program break (result of the brk system call).
+        :type brk: int.
+        """
+        if self._brk_start is None:
+            self._brk_start = brk
+            self._brk = brk
+        end = _page_align(max(self._brk, brk))
+        self._remove(self._brk_start, end)
+        if brk > self._brk_start:
+            self.map(self._brk_start, brk - self._brk_start,
+                     PROT_READ | PROT_WRITE, MAP_KIND_HEAP, '[heap]')
+        else:
+            self._record()
+        self._brk = brk
+
+    def execute(self):
+        """Forget the mappings replaced on exec"""
+        self._starts = []
+        self._maps = []
+        self._brk_start = None
+        self._brk = None
+        self.size = 0
+        self.stale = True
+
+    def copy(self):
+        """Copy the map, for a forked process.
+
+        :returns: the new map.
+        :rtype: :class:`MemoryMap`.
+        """
+        maps = MemoryMap()
+        maps._starts = list(self._starts)
+        maps._maps = [Mapping(m.start, m.end, m.prot, m.kind, m.name,
+                              m.offset) for m in self._maps]
+        maps._brk_start = self._brk_start
+        maps._brk = self._brk
+        maps.size = self.size
+        maps.stale = self.stale
+        maps._record()
+        return maps
+
+    def resync(self, pid):
+        """Read the mappings of a process from /proc.
+
+        :param pid: PID of the process.
+        :type pid: int.
+
+        :returns: True if the mappings were read.
+        :rtype: bool.
+        """
+        if DEBUG:
+            debug(_("Reading memory mappings of {}"), pid)
+        try:
+            with open('/proc/{}/maps'.format(pid)) as f:
+                lines = f.readlines()
+        except OSError:
+            return False
+        self.execute()
+        for line in lines:
+            fields = line.split(None, 5)
+            if len(fields) < 5:
+                continue
+            start, end = (int(v, 16) for v in fields[0].split('-'))
+            perms = fields[1]
+            prot = (PROT_READ if perms[0] == 'r' else 0) | \
+                (PROT_WRITE if perms[1] == 'w' else 0) | \
+                (PROT_EXEC if perms[2] == 'x' else 0)
+            name = fields[5].strip() if len(fields) > 5 else ''
+            mapping = Mapping(start, end, prot, _get_kind(name), name,
+                              int(fields[2], 16))
+            self._starts.append(start)
+            self._maps.append(mapping)
+            self.size += mapping.size
+            if name == '[heap]':
+                self._brk_start = start
+                self._brk = end
+        self.stale = False
+        self._record()
+        return True
+
+
+def _get_kind(name):
+    if name.startswith('/'):
+        return MAP_KIND_FILE
+    elif name == '[heap]':
+        return MAP_KIND_HEAP
+    elif name.startswith('[stack'):
+        return MAP_KIND_STACK
+    elif name.startswith('['):
+        return MAP_KIND_SPECIAL
+    else:
+        return MAP_KIND_ANON
+
+
+class MemoryTracker(object):
+    """Update the memory maps of the processes.
+
+    Only the exit of the system calls is handled: their parameters are read
+    again from the registers, without decoding the other system calls.
+    """
+    def __init__(self):
+        handlers = {
+            'mmap': functools.partial(self._on_mmap, 1),
+            'mmap2': functools.partial(self._on_mmap, MMAP2_UNIT),
+            'munmap': self._on_munmap,
+            'mremap': self._on_mremap,
+            'mprotect': self._on_mprotect,
+            'brk': self._on_brk,
+        }
+        self._handlers = dict((num, handlers[name])
+                              for num, name in get_syscall_names().items()
+                              if name in handlers)
+
+    def __contains__(self, num):
+        return num in self._handlers
+
+    def update(self, maps, syscall, fds=None):
+        """Update a map from the exit of a system call.
+
+        :param maps: the map of the process.
+        :type maps: :class:`MemoryMap`.
+
+        :param syscall: the system call.
+        :type syscall: :class:`ptraceplus.syscalls.core.Syscall`.
+
+        :param fds: the file descriptor table of the process (or None), to
+                    name the mapped files.
+        :type fds: :class:`ptraceplus.fdtable.FdTable`.
+
+        :returns: True if the system call was handled.
+        :rtype: bool.
+        """
+        handler = self._handlers.get(syscall.num)
+        if handler is None:
+            return False
+        result = syscall.collect_retval()
+        if is_error_result(result) and handler != self._on_brk:
+            return True
+        handler(maps, syscall.pid, result, syscall.collect_args(), fds)
+        return True
+
+    def _get_name(self, pid, fd, fds):
+        if fds is not None:
+            name = fds.lookup(fd)
+            if name is not None:
+                return name
+        try:
+            return os.readlink('/proc/{}/fd/{}'.format(pid, fd))
+        except OSError:
+            return '?'
+
+    def _on_mmap(self, unit, maps, pid, result, args, fds):
+        flags = args[3]
+        offset = 0
+        if flags & MAP_ANONYMOUS:
+            name = ''
+            if flags & (MAP_GROWSDOWN | MAP_STACK):
+                kind = MAP_KIND_STACK
+            else:
+                kind = MAP_KIND_ANON
+        else:
+            kind = MAP_KIND_FILE
+            name = self._get_name(pid, args[4] & 0xffffffff, fds)
+            offset = args[5] * unit
+        maps.map(result, args[1], args[2], kind, name, offset)
+
+    def _on_munmap(self, maps, pid, result, args, fds):
+        maps.unmap(args[0], args[1])
+
+    def _on_mremap(self, maps, pid, result, args, fds):
+        maps.remap(args[0], args[1], result, args[2])
+
+    def _on_mprotect(self, maps, pid, result, args, fds):
+        maps.protect(args[0], args[1], args[2])
+
+    def _on_brk(self, maps, pid, result, args, fds):
+        maps.set_brk(result)
+
+# vim: ts=4 sts=4 sw=4 sta et ai
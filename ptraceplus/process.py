@@ -23,12 +23,17 @@ Traced process management
 """
 
 import os
+import errno
 import signal
 import ptraceminus as ptrace
+from array import array
+from collections import Counter
 from gettext import gettext as _
-from .common import debug
+from .common import debug, DEBUG
 from .syscalls.helpers import create_syscall
 
+WALL = 0x40000000
+
 
 class UnknownEventError(Exception):
     """Error raised when process status can not be decoded"""
@@ -70,6 +75,12 @@ class ForkEvent(ProcessEvent):
         return _("[{}] forked as {}").format(self._pid, self._cpid)
 
 
+class CloneEvent(ForkEvent):
+    """Event indicating a process has created a thread"""
+    def __str__(self):
+        return _("[{}] created thread {}").format(self._pid, self._cpid)
+
+
 class SignalEvent(ProcessEvent):
     """Process received a signal during execution"""
     def __init__(self, pid, signum):
@@ -170,6 +181,9 @@ def create_process_event(pid, status):
             elif pevent in (ptrace.EVENT_FORK, ptrace.EVENT_VFORK):
                 cpid = ptrace.getventmsg(pid)
                 event = ForkEvent(pid, cpid)
+            elif pevent == ptrace.EVENT_CLONE:
+                cpid = ptrace.getventmsg(pid)
+                event = CloneEvent(pid, cpid)
             elif pevent == ptrace.EVENT_EXIT:
                 code = ptrace.getventmsg(pid)
                 event = ExitingEvent(pid, code)
@@ -183,6 +197,28 @@ def create_process_event(pid, status):
     return event
 
 
+class InstructionProfile(object):
+    """Instructions executed by a single-stepped process.
+
+    `histogram` maps the addresses of the instructions executed in the
+    profiled region to their count. `reason` tells why the stepping ended
+    (one of the `ptraceminus.STEP_*` constants) and `status` is the last
+    status of the process, as returned by `os.waitpid()`.
+    """
+    __slots__ = ['count', 'n_syscalls', 'histogram', 'reason', 'status']
+
+    def __init__(self):
+        self.count = 0
+        self.n_syscalls = 0
+        self.histogram = Counter()
+        self.reason = None
+        self.status = 0
+
+    def hottest(self, n=10):
+        """Return the (address, count) of the most executed instructions"""
+        return self.histogram.most_common(n)
+
+
 class TracedProcess(object):
     """Process traced by a tracer.
 
@@ -191,6 +227,12 @@ class TracedProcess(object):
 
     :param parent: parent of the process (or None).
     :type parent: :class:`ptraceplus.process.TracedProcess`.
+
+    If the file descriptors are tracked, `fds` is the
+    :class:`ptraceplus.fdtable.FdTable` of the process. If the memory
+    mappings are tracked, `maps` is its :class:`ptraceplus.memmap.MemoryMap`.
+    If breakpoints are set, `breakpoints` is its
+    :class:`ptraceplus.breakpoints.BreakpointManager`.
     """
     def __init__(self, pid, parent=None):
         self._pid = pid
@@ -199,6 +241,10 @@ class TracedProcess(object):
         self._is_attached = False
         self._options = 0
         self._syscall = None
+        self.fds = None
+        self.maps = None
+        self.breakpoints = None
+        self._breakpoint = None
 
     def _set_options(self, value):
         self._options = value
@@ -223,34 +269,239 @@ class TracedProcess(object):
 
     def attach(self):
         if not self._is_attached:
-            debug(_("Attaching {}").format(self._pid))
+            debug(_("Attaching {}"), self._pid)
             ptrace.attach(self._pid)
             self._is_attached = True
 
     def detach(self):
         if self._is_attached:
-            debug(_("Detaching {}").format(self._pid))
-            ptrace.detach(self._pid)
+            if DEBUG:
+                debug(_("Detaching {}"), self._pid)
+            try:
+                self._clear_breakpoints()
+                ptrace.detach(self._pid)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
             self._is_attached = False
 
+    def release(self):
+        """Detach from the process, even if it is running.
+
+        A running process is stopped with SIGSTOP first, as it can only be
+        detached while stopped.
+
+        :returns: True if the process was stopped by the tracer.
+        :rtype: bool.
+        """
+        debug(_("Releasing {}"), self._pid)
+        self._is_attached = False
+        try:
+            self._clear_breakpoints()
+            ptrace.detach(self._pid)
+            return False
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+        try:
+            os.kill(self._pid, signal.SIGSTOP)
+        except OSError:
+            return False
+        while True:
+            try:
+                pid, status = os.waitpid(self._pid, WALL)
+            except OSError:
+                return False
+            if not os.WIFSTOPPED(status):
+                return False
+            signum = os.WSTOPSIG(status)
+            if signum == signal.SIGSTOP:
+                self._clear_breakpoints()
+                ptrace.detach(self._pid)
+                return True
+            if signum & 0x80 or signum == signal.SIGTRAP:
+                signum = 0
+            ptrace.cont(self._pid, signum)
+
     def terminate(self):
         pass
 
     def kill(self, signum):
         os.kill(self._pid, signum)
 
+    def interrupt(self):
+        """Stop the process (only this thread) with SIGSTOP"""
+        ptrace.tkill(self._pid, signal.SIGSTOP)
+
     def syscall(self, signum=0):
         if signum == signal.SIGTRAP:
             signum = 0
+        if self._breakpoint is not None:
+            signum = self._step_over_breakpoint(signum)
         ptrace.syscall(self._pid, signum)
         self._is_stopped = False
 
     def cont(self, signum=0):
         if signum == signal.SIGTRAP:
             signum = 0
+        if self._breakpoint is not None:
+            signum = self._step_over_breakpoint(signum)
         ptrace.cont(self._pid, signum)
         self._is_stopped = False
 
+    def insert_breakpoint(self, address, counting=False):
+        """Insert a breakpoint in the stopped process.
+
+        See :meth:`ptraceplus.breakpoints.BreakpointManager.insert`.
+        """
+        if self.breakpoints is None:
+            from .breakpoints import BreakpointManager
+            self.breakpoints = BreakpointManager()
+        self.breakpoints.insert(self._pid, address, counting)
+
+    def remove_breakpoint(self, address):
+        """Remove a breakpoint from the stopped process"""
+        self.breakpoints.remove(self._pid, address)
+        if self._breakpoint == address:
+            self._breakpoint = None
+
+    def hit_breakpoint(self):
+        """Check if the process was stopped by a breakpoint.
+
+        To be called when the process is stopped with SIGTRAP. The hit is
+        counted and the instruction pointer is moved back to the address of
+        the breakpoint, which is stepped over when the process is resumed.
+
+        :returns: the address of the breakpoint (or None).
+        :rtype: int.
+        """
+        if self.breakpoints is None:
+            return None
+        address = ptrace.peekuser(self._pid, ptrace.PC_OFFSET) - 1
+        if address not in self.breakpoints:
+            return None
+        self.breakpoints.record_hit(address)
+        ptrace.pokeuser(self._pid, ptrace.PC_OFFSET, address)
+        self._breakpoint = address
+        return address
+
+    def drop_breakpoints(self):
+        """Forget the breakpoints, which the memory no longer holds (exec)"""
+        self.breakpoints = None
+        self._breakpoint = None
+
+    def run_counting(self, signum=0):
+        """Resume the process, until it stops otherwise than on a counting
+        breakpoint.
+
+        The hits of the counting breakpoints are handled by the extension.
+        If the process stops on another breakpoint, :meth:`hit_breakpoint`
+        is still to be called.
+
+        :returns: the status of the process.
+        :rtype: int.
+        """
+        if signum == signal.SIGTRAP:
+            signum = 0
+        if self._breakpoint is not None:
+            signum = self._step_over_breakpoint(signum)
+        if self.breakpoints is None:
+            ptrace.cont(self._pid, signum)
+            pid, status = os.waitpid(self._pid, WALL)
+            return status
+        return self.breakpoints.cont(self._pid, signum)
+
+    def _step_over_breakpoint(self, signum):
+        # Returns the signal to deliver when resuming the process
+        address = self._breakpoint
+        self._breakpoint = None
+        if self.breakpoints is None or address not in self.breakpoints:
+            return signum
+        status = self.breakpoints.step_over(self._pid, address, signum)
+        if os.WIFSTOPPED(status) and os.WSTOPSIG(status) != signal.SIGTRAP:
+            return os.WSTOPSIG(status)
+        return 0
+
+    def _clear_breakpoints(self):
+        if self.breakpoints is not None:
+            self.breakpoints.clear(self._pid)
+            self.drop_breakpoints()
+
+    def step(self, n, buffer=None, signum=0):
+        """Execute up to n instructions, one at a time.
+
+        See `ptraceminus.singlestep_n()`.
+        """
+        if signum == signal.SIGTRAP:
+            signum = 0
+        return ptrace.singlestep_n(self._pid, n, buffer, signum)
+
+    def profile_instructions(self, until=(), limit=0, region=None,
+                             buffer_size=65536):
+        """Single-step the stopped process, counting the instructions.
+
+        The stepping loop runs in the extension, which records the addresses
+        of the instructions in a buffer: they are only read when the buffer
+        is full. The stepping goes on through the system calls, and ends
+        when the next instruction is at one of the addresses of `until`,
+        after `limit` instructions, or when the process is stopped by a
+        signal or an event, or exits. A signal is not delivered: it is left
+        in the status of the profile.
+
+        :param until: addresses ending the stepping.
+        :type until: iterable of int.
+
+        :param limit: maximum number of instructions (0 for no limit).
+        :type limit: int.
+
+        :param region: start and end addresses of the code whose
+                       instructions are counted in the histogram (or None
+                       for no histogram).
+        :type region: tuple.
+
+        :param buffer_size: number of addresses recorded between two reads.
+        :type buffer_size: int.
+
+        :returns: the profile.
+        :rtype: :class:`InstructionProfile`.
+        """
+        profile = InstructionProfile()
+        until = list(until)
+        buf = array('L', bytes(buffer_size * array('L').itemsize)) \
+            if region else None
+        while True:
+            if limit:
+                remaining = limit - profile.count
+                if not remaining:
+                    profile.reason = ptrace.STEP_COUNT
+                    break
+            else:
+                remaining = 0
+            reason, count, status = ptrace.step_until(self._pid, until,
+                                                      remaining, buf)
+            profile.count += count
+            if buf is not None:
+                start, end = region
+                profile.histogram.update(pc for pc in buf[:count]
+                                         if start <= pc < end)
+            if reason == ptrace.STEP_SYSCALL:
+                profile.n_syscalls += 1
+            elif reason != ptrace.STEP_FULL:
+                profile.reason = reason
+                profile.status = status
+                break
+        return profile
+
+    def count_instructions(self, until=(), limit=0):
+        """Count the instructions executed until an address is reached.
+
+        See :meth:`profile_instructions`.
+
+        :returns: the number of instructions.
+        :rtype: int.
+        """
+        return self.profile_instructions(until, limit).count
+
     def prepare_syscall_enter(self):
         syscall = create_syscall(self._pid)
         self._syscall = syscall
@@ -259,6 +510,7 @@ class TracedProcess(object):
     def prepare_syscall_exit(self):
         syscall = self._syscall
         self._syscall = None
+        syscall.set_exited()
         return syscall
 
 # vim: ts=4 sts=4 sw=4 sta et ai
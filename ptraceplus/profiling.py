@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Self-profiling of the tracer
+
+The profiler counts the calls and the time spent in each phase of the
+tracing loop and in each ptrace primitive. Nothing is instrumented unless a
+profiler is installed, so it costs nothing when disabled.
+"""
+
+import importlib
+from time import perf_counter
+from gettext import gettext as _
+
+# Modules calling the ptrace primitives through their 'ptrace' global.
+_PTRACE_MODULES = (
+    'ptraceplus.tracer',
+    'ptraceplus.process',
+    'ptraceplus.syscalls.core',
+    'ptraceplus.fdtable',
+    'ptraceplus.breakpoints',
+    'ptraceplus.extra',
+)
+
+# Methods of the system calls timed as the 'decode' phase.
+_SYSCALL_METHODS = (
+    'collect_params',
+    'collect_result',
+    'collect_retval',
+)
+
+
+class _InstrumentedModule(object):
+    def __init__(self, profiler, module):
+        for name in dir(module):
+            value = getattr(module, name)
+            if callable(value) and not isinstance(value, type):
+                value = profiler.wrap('ptrace.' + name, value)
+            setattr(self, name, value)
+
+
+class PhaseProfiler(object):
+    """Count calls and time spent per phase of the tracer.
+
+    The time of a phase excludes the time of the phases it calls, so the
+    times of all the phases can be added.
+    """
+    def __init__(self):
+        self._counters = {}
+        self._stack = []
+        self._saved = []
+
+    def wrap(self, phase, func):
+        """Wrap a function, accounting its calls to a phase.
+
+        :param phase: name of the phase.
+        :type phase: str.
+
+        :param func: function to wrap.
+        :type func: callable.
+
+        :returns: the wrapped function.
+        :rtype: callable.
+        """
+        counter = self._counters.setdefault(phase, [0, 0.0])
+        stack = self._stack
+
+        def wrapper(*args, **kwargs):
+            stack.append(0.0)
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                nested = stack.pop()
+                counter[0] += 1
+                counter[1] += elapsed - nested
+                if stack:
+                    stack[-1] += elapsed
+        return wrapper
+
+    def instrument(self, obj, phases):
+        """Instrument methods of an object.
+
+        :param obj: object to instrument.
+        :type obj: object.
+
+        :param phases: phases of the methods, indexed by method name.
+        :type phases: dict.
+        """
+        for name, phase in phases.items():
+            self._saved.append((obj, name, obj.__dict__.get(name)))
+            setattr(obj, name, self.wrap(phase, getattr(obj, name)))
+
+    def install(self):
+        """Instrument the ptrace primitives and the system call decoding"""
+        import ptraceminus
+        from .syscalls.core import Syscall
+        proxy = _InstrumentedModule(self, ptraceminus)
+        for name in _PTRACE_MODULES:
+            module = importlib.import_module(name)
+            self._saved.append((module, 'ptrace', module.ptrace))
+            module.ptrace = proxy
+        self.instrument(Syscall, dict((m, 'decode') for m in _SYSCALL_METHODS))
+
+    def uninstall(self):
+        """Remove all the instrumentation"""
+        while self._saved:
+            obj, name, value = self._saved.pop()
+            if value is None:
+                delattr(obj, name)
+            else:
+                setattr(obj, name, value)
+
+    @property
+    def results(self):
+        """Counters of the phases, as (phase, calls, time) tuples"""
+        counters = list(self._counters.items())
+        results = [(p, c[0], c[1]) for p, c in counters if c[0]]
+        return sorted(results, key=lambda r: r[2], reverse=True)
+
+
+def format_profile(profiler, elapsed=None):
+    text = _("Tracer profile:\n")
+    text += " {:<24} {:>10} {:>12} {:>10}".format(_('phase'), _('calls'),
+                                                  _('seconds'),
+                                                  _('usecs/call'))
+    if elapsed:
+        text += " {:>7}".format(_('% time'))
+    text += "\n"
+    for phase, calls, total in profiler.results:
+        text += " {:<24} {:>10} {:>12.6f} {:>10.2f}".format(
+            phase, calls, total, 1e6 * total / calls)
+        if elapsed:
+            text += " {:>7.2f}".format(100.0 * total / elapsed)
+        text += "\n"
+    return text
+
+# vim: ts=4 sts=4 sw=4 sta et ai
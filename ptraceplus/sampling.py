@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Sampling policies
+
+A sampling policy decides which system calls are recorded by a tracer. It
+can skip system calls, or define tracing windows: outside of them, the
+processes are only stopped on fork, exec and exit, which is much cheaper.
+
+The policy also estimates the fraction of the system calls recorded, used to
+scale the statistics.
+"""
+
+from time import monotonic
+from gettext import gettext as _
+
+
+class SamplerError(Exception):
+    """Error raised when a sampling policy is invalid"""
+
+
+class Sampler(object):
+    """Base class of the sampling policies: record everything."""
+    def __init__(self):
+        self._tracing = True
+        self._start_time = None
+        self._end_time = None
+        self._changed = None
+        self._traced_time = 0.0
+        self._n_seen = 0
+        self._n_sampled = 0
+        self.deadline = None
+
+    @property
+    def is_tracing(self):
+        """True if the processes are traced"""
+        return self._tracing
+
+    @property
+    def ratio(self):
+        """Estimated fraction of the system calls recorded"""
+        if self._start_time is None:
+            return 1.0
+        now = self._end_time or monotonic()
+        traced = self._traced_time
+        if self._tracing:
+            traced += now - self._changed
+        elapsed = now - self._start_time
+        ratio = traced / elapsed if elapsed > 0 else 1.0
+        if self._n_seen:
+            ratio *= float(self._n_sampled) / self._n_seen
+        return ratio
+
+    def start(self, now):
+        """Start sampling.
+
+        :param now: current time.
+        :type now: float.
+        """
+        self._start_time = now
+        self._end_time = None
+        self._changed = now
+        self._traced_time = 0.0
+        self._tracing = True
+        self._on_started(now)
+
+    def stop(self, now):
+        """Stop sampling.
+
+        :param now: current time.
+        :type now: float.
+        """
+        self._switch(now, False)
+        self._end_time = now
+
+    def update(self, now, busy):
+        """Update the tracing state.
+
+        This is called after each event, and when the deadline is reached.
+
+        :param now: current time.
+        :type now: float.
+
+        :param busy: time spent by the tracer handling events, in seconds.
+        :type busy: float.
+
+        :returns: True if the processes must be traced.
+        :rtype: bool.
+        """
+        if self.deadline is not None and now >= self.deadline:
+            self._switch(now, self._on_deadline(now, busy))
+        return self._tracing
+
+    def sample(self, pid):
+        """Check if the system call being entered by a process is recorded.
+
+        :param pid: PID of the process.
+        :type pid: int.
+
+        :returns: True if the system call is recorded.
+        :rtype: bool.
+        """
+        self._n_seen += 1
+        if self._on_sample(pid):
+            self._n_sampled += 1
+            return True
+        return False
+
+    def _switch(self, now, tracing):
+        if tracing == self._tracing:
+            return
+        if self._tracing:
+            self._traced_time += now - self._changed
+        self._changed = now
+        self._tracing = tracing
+
+    def _on_started(self, now):
+        pass
+
+    def _on_deadline(self, now, busy):
+        return True
+
+    def _on_sample(self, pid):
+        return True
+
+
+class EveryNthSampler(Sampler):
+    """Record one system call out of `n`, for each process.
+
+    :param n: sampling period.
+    :type n: int.
+    """
+    def __init__(self, n):
+        Sampler.__init__(self)
+        if n < 1:
+            raise SamplerError(_("Invalid sampling period ({})").format(n))
+        self._n = n
+        self._counters = {}
+
+    def _on_sample(self, pid):
+        count = self._counters.get(pid, 0)
+        self._counters[pid] = count + 1
+        return count % self._n == 0
+
+
+class WindowSampler(Sampler):
+    """Trace the processes during `on` seconds, then leave them running
+    during `off` seconds.
+
+    :param on: duration of the tracing windows, in seconds.
+    :type on: float.
+
+    :param off: duration between the tracing windows, in seconds.
+    :type off: float.
+    """
+    def __init__(self, on, off):
+        Sampler.__init__(self)
+        if on <= 0 or off < 0:
+            msg = _("Invalid sampling windows ({}/{})")
+            raise SamplerError(msg.format(on, off))
+        self._on = on
+        self._off = off
+
+    def _on_started(self, now):
+        self.deadline = now + self._on
+
+    def _on_deadline(self, now, busy):
+        tracing = not self._tracing
+        self.deadline = now + (self._on if tracing else self._off)
+        return tracing
+
+
+class BudgetSampler(Sampler):
+    """Trace the processes in windows of `window` seconds, spaced so that
+    the tracer does not spend more than `budget` of the time handling
+    events.
+
+    :param budget: maximum fraction of the time spent by the tracer.
+    :type budget: float.
+
+    :param window: duration of the tracing windows, in seconds.
+    :type window: float.
+    """
+    def __init__(self, budget, window=0.1):
+        Sampler.__init__(self)
+        if not 0 < budget <= 1 or window <= 0:
+            msg = _("Invalid overhead budget ({}/{})")
+            raise SamplerError(msg.format(budget, window))
+        self._budget = budget
+        self._window = window
+        self._busy = 0.0
+
+    def _on_started(self, now):
+        self.deadline = now + self._window
+
+    def _on_deadline(self, now, busy):
+        if not self._tracing:
+            self._busy = busy
+            self.deadline = now + self._window
+            return True
+        spent = busy - self._busy
+        traced = now - self._changed
+        pause = spent / self._budget - traced
+        if pause <= 0:
+            self._busy = busy
+            self.deadline = now + self._window
+            return True
+        self.deadline = now + pause
+        return False
+
+
+def create_sampler(spec):
+    """Create a sampling policy from its description.
+
+    The description is one of:
+
+    - 'N': record one system call out of N,
+    - 'ON/OFF': trace during ON seconds every ON + OFF seconds,
+    - 'P%': keep the overhead of the tracer below P percent.
+
+    :param spec: description of the policy.
+    :type spec: str.
+
+    :returns: the sampling policy.
+    :rtype: :class:`Sampler`.
+    """
+    try:
+        if spec.endswith('%'):
+            return BudgetSampler(float(spec[:-1]) / 100.0)
+        elif '/' in spec:
+            on, off = spec.split('/', 1)
+            return WindowSampler(float(on), float(off))
+        else:
+            return EveryNthSampler(int(spec))
+    except ValueError:
+        raise SamplerError(_("Invalid sampling policy '{}'").format(spec))
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Frequency estimation in bounded memory
+
+Long traces can issue millions of distinct calls: the counters are kept in a
+count-min sketch of fixed size, and only the most frequent keys are stored.
+"""
+
+from array import array
+from gettext import gettext as _
+
+
+class SketchError(Exception):
+    """Error raised when a sketch is invalid"""
+
+
+class CountMinSketch(object):
+    """Approximate counters of the keys of a stream, in fixed memory.
+
+    The counts are never under-estimated. With the conservative update, the
+    over-estimation is usually far below the bound of 2N / `width` (N being
+    the total count), with a probability of 1 - 1 / 2^`depth`.
+
+    :param width: number of counters of each row.
+    :type width: int.
+
+    :param depth: number of rows (hash functions).
+    :type depth: int.
+    """
+    def __init__(self, width=4096, depth=4):
+        if width < 1 or depth < 1:
+            msg = _("Invalid sketch size ({}x{})")
+            raise SketchError(msg.format(width, depth))
+        self._width = width
+        self._rows = [array('Q', [0] * width) for i in range(depth)]
+        self.total = 0
+
+    def _get_indexes(self, key):
+        # Derive the hash functions from a single hash of the key
+        h = hash(key)
+        h1 = h & 0xffffffff
+        h2 = ((h >> 32) & 0xffffffff) | 1
+        return [(h1 + i * h2) % self._width for i in range(len(self._rows))]
+
+    def add(self, key, count=1):
+        """Count a key.
+
+        :param key: the key (hashable).
+        :type key: object.
+
+        :param count: number of occurrences.
+        :type count: int.
+
+        :returns: the estimated count of the key.
+        :rtype: int.
+        """
+        indexes = self._get_indexes(key)
+        estimate = min(row[i] for row, i in zip(self._rows, indexes))
+        estimate += count
+        for row, i in zip(self._rows, indexes):
+            if row[i] < estimate:
+                row[i] = estimate
+        self.total += count
+        return estimate
+
+    def estimate(self, key):
+        """Return the estimated count of a key"""
+        indexes = self._get_indexes(key)
+        return min(row[i] for row, i in zip(self._rows, indexes))
+
+
+class HeavyHitter(object):
+    __slots__ = ['key', 'count', 'time']
+
+    def __init__(self, key, count, time):
+        self.key = key
+        self.count = count
+        self.time = time
+
+
+class HeavyHitters(object):
+    """Track the most frequent keys of a stream, with the time they took.
+
+    At most `capacity` keys are stored. A new key replaces the least
+    frequent one when its estimated count is higher: its count is then the
+    estimate, and its time is extrapolated from the current occurrence.
+
+    :param capacity: maximum number of keys stored.
+    :type capacity: int.
+
+    :param width: number of counters of each row of the sketch.
+    :type width: int.
+
+    :param depth: number of rows of the sketch.
+    :type depth: int.
+    """
+    def __init__(self, capacity=256, width=4096, depth=4):
+        if capacity < 1:
+            raise SketchError(_("Invalid capacity ({})").format(capacity))
+        self._capacity = capacity
+        self._sketch = CountMinSketch(width, depth)
+        self._items = {}
+        self._min_count = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def total(self):
+        """Number of occurrences of all the keys"""
+        return self._sketch.total
+
+    def add(self, key, time=0.0):
+        """Count an occurrence of a key.
+
+        :param key: the key (hashable).
+        :type key: object.
+
+        :param time: time taken by the occurrence, in seconds.
+        :type time: float.
+
+        :returns: the estimated count of the key.
+        :rtype: int.
+        """
+        estimate = self._sketch.add(key)
+        item = self._items.get(key)
+        if item is not None:
+            item.count += 1
+            item.time += time
+            return max(estimate, item.count)
+        if len(self._items) < self._capacity:
+            self._items[key] = HeavyHitter(key, estimate, time * estimate)
+            return estimate
+        # The tracked counts only grow: the cached minimum is a lower bound
+        if estimate <= self._min_count:
+            return estimate
+        victim = min(self._items.values(), key=lambda i: i.count)
+        self._min_count = victim.count
+        if estimate > victim.count:
+            del self._items[victim.key]
+            self._items[key] = HeavyHitter(key, estimate, time * estimate)
+        return estimate
+
+    def most_common(self, n=None):
+        """Return the most frequent keys.
+
+        :param n: maximum number of keys (or None for all).
+        :type n: int.
+
+        :returns: the keys, with their count and time, the most frequent
+                  first.
+        :rtype: list of :class:`HeavyHitter`.
+        """
+        items = sorted(list(self._items.values()), key=lambda i: -i.count)
+        if n is not None:
+            items = items[:n]
+        return items
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -24,6 +24,7 @@ Collects information about a system call
 
 import abc
 import ptraceminus as ptrace
+from time import monotonic
 from gettext import gettext as _
 
 (SYSCALL_STATE_UNKNOWN, SYSCALL_STATE_ENTER, SYSCALL_STATE_EXIT) = range(0, 3)
@@ -121,6 +122,8 @@ class Syscall(object):
         self._state = SYSCALL_STATE_ENTER
         self._params = []
         self._result = None
+        self._enter_time = monotonic()
+        self._exit_time = None
 
     @property
     def name(self):
@@ -156,6 +159,23 @@ class Syscall(object):
     def state(self):
         return self._state
 
+    @property
+    def start_time(self):
+        """Time of the entry in the system call (monotonic clock)"""
+        return self._enter_time
+
+    @property
+    def elapsed(self):
+        """Time spent in the system call, in seconds (or None)"""
+        if self._exit_time is None:
+            return None
+        return self._exit_time - self._enter_time
+
+    def set_exited(self):
+        """Mark the system call as exited"""
+        self._state = SYSCALL_STATE_EXIT
+        self._exit_time = monotonic()
+
     @abc.abstractmethod
     def _get_result_from_regs(self, regs):
         return
@@ -172,29 +192,75 @@ class Syscall(object):
     def _get_params_from_regs(self, regs):
         return
 
+    @abc.abstractmethod
+    def _get_frame_from_regs(self, regs):
+        return
+
     def __str__(self):
         state = _SYSCALL_STATES[self.state]
         txt = "Syscall {} ({}) for {} ({})"
         return txt.format(self.num, self.name, self.pid, state)
 
-    def collect_params(self):
+    def collect_params(self, maps=None):
+        """Collect and decode the parameters.
+
+        :param maps: the memory map of the process (or None). The strings
+                     at unmapped addresses are rejected without reading the
+                     memory of the process.
+        :type maps: :class:`ptraceplus.memmap.MemoryMap`.
+
+        :returns: the parameters.
+        :rtype: list of :class:`SyscallParam`.
+        """
         regs = ptrace.getregs(self._pid)
         values = self._get_params_from_regs(regs)
         params = []
         for (t, n), v in zip(self.prototype, values):
-            param = self._format_param(t, n, v)
+            param = self._format_param(t, n, v, maps)
             params.append(param)
         self._params = params
         return self._params
 
+    def collect_args(self):
+        """Collect the raw values of the parameters, without decoding them.
+
+        The registers holding the parameters are preserved by the kernel, so
+        they can also be collected on the exit of the system call.
+
+        :returns: the values of the parameters.
+        :rtype: list of int.
+        """
+        regs = ptrace.getregs(self._pid)
+        return self._get_params_from_regs(regs)
+
+    def collect_frame(self):
+        """Collect the registers locating the code issuing the system call.
+
+        :returns: the instruction pointer, the stack pointer and the frame
+                  pointer.
+        :rtype: tuple of int.
+        """
+        regs = ptrace.getregs(self._pid)
+        return self._get_frame_from_regs(regs)
+
     def collect_result(self):
         self._state = SYSCALL_STATE_EXIT
         regs = ptrace.getregs(self._pid)
         self._result = self._get_result_from_regs(regs)
         return self._result
 
-    def _format_param(self, t, n, v):
+    def collect_retval(self):
+        """Collect the result without reading all the registers"""
+        self._state = SYSCALL_STATE_EXIT
+        self._result = ptrace.getscret(self._pid)
+        return self._result
+
+    def _format_param(self, t, n, v, maps=None):
         param = SyscallParam(t, n, v)
+        if (param.is_string or param.is_stringv) and maps is not None and \
+           not maps.stale and not maps.is_valid(v):
+            msg = _("can not get '{} {}' for {}() at {:#x}")
+            raise SyscallParamError(msg.format(t, n, self.name, v))
         try:
             if param.is_string:
                 param.pvalue = ptrace.getstr(self._pid, v)
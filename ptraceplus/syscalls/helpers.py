@@ -20,30 +20,62 @@
 
 """
 Syscall handling helpers (platform abstraction)
+
+The tables of the architecture are loaded on first use.
 """
 
-import platform
+import os
 from gettext import gettext as _
 
-if platform.system() == 'Linux':
-    if platform.machine() in ('i386', 'i486', 'i586', 'i686'):
-        from .linux.x86.names import SYSCALL_NAMES
-        from .linux.x86.syscall import SyscallLinux as Syscall
-    elif platform.machine() in ('x86_64'):
-        from .linux.x86_64.names import SYSCALL_NAMES
-        from .linux.x86_64.syscall import SyscallLinux as Syscall
+_SYSCALL_NAMES = None
+_SYSCALL_CLASS = None
+
+
+def _load_arch():
+    global _SYSCALL_NAMES, _SYSCALL_CLASS
+    uname = os.uname()
+    if uname.sysname == 'Linux':
+        if uname.machine in ('i386', 'i486', 'i586', 'i686'):
+            from .linux.x86.names import SYSCALL_NAMES
+            from .linux.x86.syscall import SyscallLinux as Syscall
+        elif uname.machine == 'x86_64':
+            from .linux.x86_64.names import SYSCALL_NAMES
+            from .linux.x86_64.syscall import SyscallLinux as Syscall
+        else:
+            raise RuntimeError(_('Unsupported architecture'))
     else:
-        raise RuntimeError(_('Unsupported architecture'))
-else:
-    raise RuntimeError(_('Unsupported system'))
+        raise RuntimeError(_('Unsupported system'))
+    _SYSCALL_NAMES = SYSCALL_NAMES
+    _SYSCALL_CLASS = Syscall
+
+
+def get_syscall_names():
+    if _SYSCALL_NAMES is None:
+        _load_arch()
+    return _SYSCALL_NAMES
 
 
 def convert_names(names):
-    return [k for k, v in SYSCALL_NAMES.items() if v in names]
+    return [k for k, v in get_syscall_names().items() if v in names]
+
+
+def get_syscall_name(num):
+    return get_syscall_names().get(num, 'unknown')
+
+
+def get_syscall_count():
+    return max(get_syscall_names().keys()) + 1
 
 
 def create_syscall(pid):
-    return Syscall(pid)
+    if _SYSCALL_CLASS is None:
+        _load_arch()
+    return _SYSCALL_CLASS(pid)
+
+
+def is_error_result(result):
+    """Check if the result of a system call is an error code"""
+    return -4096 < result < 0
 
 
 def format_syscall(syscall, detailed=False):
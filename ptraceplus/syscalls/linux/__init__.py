@@ -22,4 +22,19 @@
 Syscalls definitions (Linux)
 """
 
+_SYSCALL_PROTOS = None
+
+
+def get_prototypes():
+    """Return the prototypes of the system calls, loading them on first use.
+
+    :returns: the prototypes, indexed by system call name.
+    :rtype: dict.
+    """
+    global _SYSCALL_PROTOS
+    if _SYSCALL_PROTOS is None:
+        from .prototypes import SYSCALL_PROTOS
+        _SYSCALL_PROTOS = SYSCALL_PROTOS
+    return _SYSCALL_PROTOS
+
 # vim: ts=4 sts=4 sw=4 sta et ai
@@ -391,4 +391,6 @@ SYSCALL_PROTOS = {
     'removexattr': [('const char*', 'pathname'), ('const char*', 'nam')],
     'lremovexattr': [('const char*', 'pathname'), ('const char*', 'nam')],
     'fremovexattr': [('int', 'fd'), ('const char*', 'name')],
+    'memfd_create': [('const char*', 'uname'), ('unsigned int', 'flags')],
+    'close_range': [('unsigned int', 'fd'), ('unsigned int', 'max_fd'), ('unsigned int', 'flags')],
 }
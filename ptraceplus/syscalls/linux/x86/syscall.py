@@ -23,7 +23,7 @@ Collects information about a system call (Linux, x86)
 """
 
 from .names import SYSCALL_NAMES
-from ..prototypes import SYSCALL_PROTOS
+from .. import get_prototypes
 from ...core import Syscall
 
 
@@ -33,7 +33,7 @@ class SyscallLinux(Syscall):
         return SYSCALL_NAMES[self.num]
 
     def _get_proto(self):
-        return SYSCALL_PROTOS[self.name]
+        return get_prototypes()[self.name]
 
     def _get_result_from_regs(self, regs):
         return regs['eax']
@@ -43,4 +43,8 @@ class SyscallLinux(Syscall):
                   regs['esi'], regs['edi'], regs['ebp'])
         return [v & 0xffffffff for v in values]
 
+    def _get_frame_from_regs(self, regs):
+        values = (regs['eip'], regs['esp'], regs['ebp'])
+        return tuple(v & 0xffffffff for v in values)
+
 # vim: ts=4 sts=4 sw=4 sta et ai
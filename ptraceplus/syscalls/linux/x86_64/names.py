@@ -306,7 +306,83 @@ SYSCALL_NAMES = {
     280: "utimensat",
     281: "epoll_pwait",
     282: "signalfd",
-    283: "timerfd",
+    283: "timerfd_create",
     284: "eventfd",
     285: "fallocate",
+    286: "timerfd_settime",
+    287: "timerfd_gettime",
+    288: "accept4",
+    289: "signalfd4",
+    290: "eventfd2",
+    291: "epoll_create1",
+    292: "dup3",
+    293: "pipe2",
+    294: "inotify_init1",
+    295: "preadv",
+    296: "pwritev",
+    297: "rt_tgsigqueueinfo",
+    298: "perf_event_open",
+    299: "recvmmsg",
+    300: "fanotify_init",
+    301: "fanotify_mark",
+    302: "prlimit64",
+    303: "name_to_handle_at",
+    304: "open_by_handle_at",
+    305: "clock_adjtime",
+    306: "syncfs",
+    307: "sendmmsg",
+    308: "setns",
+    309: "getcpu",
+    310: "process_vm_readv",
+    311: "process_vm_writev",
+    312: "kcmp",
+    313: "finit_module",
+    314: "sched_setattr",
+    315: "sched_getattr",
+    316: "renameat2",
+    317: "seccomp",
+    318: "getrandom",
+    319: "memfd_create",
+    320: "kexec_file_load",
+    321: "bpf",
+    322: "execveat",
+    323: "userfaultfd",
+    324: "membarrier",
+    325: "mlock2",
+    326: "copy_file_range",
+    327: "preadv2",
+    328: "pwritev2",
+    329: "pkey_mprotect",
+    330: "pkey_alloc",
+    331: "pkey_free",
+    332: "statx",
+    333: "io_pgetevents",
+    334: "rseq",
+    424: "pidfd_send_signal",
+    425: "io_uring_setup",
+    426: "io_uring_enter",
+    427: "io_uring_register",
+    428: "open_tree",
+    429: "move_mount",
+    430: "fsopen",
+    431: "fsconfig",
+    432: "fsmount",
+    433: "fspick",
+    434: "pidfd_open",
+    435: "clone3",
+    436: "close_range",
+    437: "openat2",
+    438: "pidfd_getfd",
+    439: "faccessat2",
+    440: "process_madvise",
+    441: "epoll_pwait2",
+    442: "mount_setattr",
+    443: "quotactl_fd",
+    444: "landlock_create_ruleset",
+    445: "landlock_add_rule",
+    446: "landlock_restrict_self",
+    447: "memfd_secret",
+    448: "process_mrelease",
+    449: "futex_waitv",
+    450: "set_mempolicy_home_node",
 }
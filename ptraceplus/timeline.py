@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Trace-event timeline output
+
+The events are written in the JSON array format of the Chrome trace-event
+format, which can be opened with chrome://tracing or the Perfetto UI. They
+are written as they come: nothing is kept in memory.
+"""
+
+import json
+
+
+class TraceEventWriter(object):
+    """Write trace events to a stream.
+
+    The timestamps and durations are given in seconds, and written in
+    microseconds.
+
+    :param stream: the output stream.
+    :type stream: file-like object.
+    """
+    def __init__(self, stream):
+        self._stream = stream
+        self._n_events = 0
+        self._encoder = json.JSONEncoder(separators=(',', ':'))
+        self._stream.write('[\n')
+
+    @property
+    def n_events(self):
+        return self._n_events
+
+    def write(self, event):
+        """Write an event.
+
+        :param event: the event, with the keys of the trace-event format.
+        :type event: dict.
+        """
+        if self._n_events:
+            self._stream.write(',\n')
+        self._stream.write(self._encoder.encode(event))
+        self._n_events += 1
+
+    def complete(self, name, cat, ts, dur, pid, tid, args=None):
+        """Write a duration slice"""
+        event = {'name': name, 'cat': cat, 'ph': 'X',
+                 'ts': round(ts * 1e6, 3), 'dur': round(dur * 1e6, 3),
+                 'pid': pid, 'tid': tid}
+        if args:
+            event['args'] = args
+        self.write(event)
+
+    def begin(self, name, cat, ts, pid, tid, args=None):
+        """Write the start of a span"""
+        event = {'name': name, 'cat': cat, 'ph': 'B',
+                 'ts': round(ts * 1e6, 3), 'pid': pid, 'tid': tid}
+        if args:
+            event['args'] = args
+        self.write(event)
+
+    def end(self, ts, pid, tid, args=None):
+        """Write the end of the last span started"""
+        event = {'ph': 'E', 'ts': round(ts * 1e6, 3), 'pid': pid,
+                 'tid': tid}
+        if args:
+            event['args'] = args
+        self.write(event)
+
+    def instant(self, name, cat, ts, pid, tid, args=None):
+        """Write an instant event, in the scope of its thread"""
+        event = {'name': name, 'cat': cat, 'ph': 'i', 's': 't',
+                 'ts': round(ts * 1e6, 3), 'pid': pid, 'tid': tid}
+        if args:
+            event['args'] = args
+        self.write(event)
+
+    def metadata(self, name, pid, tid, args):
+        """Write a metadata event, like 'process_name'"""
+        self.write({'name': name, 'ph': 'M', 'pid': pid, 'tid': tid,
+                    'args': args})
+
+    def close(self):
+        """Terminate the JSON array (the stream is left open)"""
+        self._stream.write('\n]\n')
+        self._stream.flush()
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Timer wheel
+
+The time is divided in ticks, and each timer is kept in the slot of its
+tick, modulo the number of slots: scheduling and cancelling a timer do not
+depend on the number of timers, and advancing the wheel only visits the
+slots of the elapsed ticks. The timers expire at the end of their tick,
+never early and at most one tick late.
+"""
+
+import math
+
+
+class TimerWheel(object):
+    """Hashed timer wheel.
+
+    :param resolution: duration of a tick, in seconds.
+    :type resolution: float.
+
+    :param n_slots: number of slots.
+    :type n_slots: int.
+
+    :param now: current time, in seconds.
+    :type now: float.
+    """
+    def __init__(self, resolution=0.001, n_slots=512, now=0.0):
+        self.resolution = resolution
+        self._slots = [[] for i in range(n_slots)]
+        # All the timers up to this tick have expired
+        self._tick = int(math.floor(now / resolution))
+        self._n_timers = 0
+
+    def __len__(self):
+        return self._n_timers
+
+    def schedule(self, when, item):
+        """Schedule a timer.
+
+        :param when: expiration time, in seconds.
+        :type when: float.
+
+        :param item: object returned when the timer expires.
+        :type item: object.
+
+        :returns: the timer, to cancel it.
+        :rtype: list.
+        """
+        tick = max(int(math.ceil(when / self.resolution)), self._tick + 1)
+        timer = [tick, item]
+        self._slots[tick % len(self._slots)].append(timer)
+        self._n_timers += 1
+        return timer
+
+    def cancel(self, timer):
+        """Cancel a timer which has not expired.
+
+        :param timer: the timer returned by :meth:`schedule`.
+        :type timer: list.
+        """
+        slot = self._slots[timer[0] % len(self._slots)]
+        for i, t in enumerate(slot):
+            if t is timer:
+                del slot[i]
+                self._n_timers -= 1
+                return
+
+    def advance(self, now):
+        """Move the wheel to the current time.
+
+        :param now: current time, in seconds.
+        :type now: float.
+
+        :returns: the items of the expired timers, by expiration time.
+        :rtype: list.
+        """
+        target = int(math.floor(now / self.resolution))
+        if target <= self._tick or not self._n_timers:
+            self._tick = max(target, self._tick)
+            return []
+        n_slots = len(self._slots)
+        if target - self._tick >= n_slots:
+            indexes = range(n_slots)
+        else:
+            indexes = (t % n_slots for t in range(self._tick + 1, target + 1))
+        expired = []
+        for index in indexes:
+            slot = self._slots[index]
+            if not slot:
+                continue
+            kept = [t for t in slot if t[0] > target]
+            if len(kept) < len(slot):
+                expired += [t for t in slot if t[0] <= target]
+                self._slots[index] = kept
+        self._tick = target
+        self._n_timers -= len(expired)
+        expired.sort(key=lambda t: t[0])
+        return [t[1] for t in expired]
+
+    def next_deadline(self):
+        """Return the expiration time of the next timer (or None)"""
+        if not self._n_timers:
+            return None
+        n_slots = len(self._slots)
+        for tick in range(self._tick + 1, self._tick + 1 + n_slots):
+            for t in self._slots[tick % n_slots]:
+                if t[0] == tick:
+                    return tick * self.resolution
+        # All the timers are at least one turn of the wheel away
+        tick = min(t[0] for slot in self._slots for t in slot)
+        return tick * self.resolution
+
+# vim: ts=4 sts=4 sw=4 sta et ai
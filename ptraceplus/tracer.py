@@ -24,32 +24,44 @@ Process tracing helper
 
 import os
 import signal
+import select
 import ptraceminus as ptrace
+from time import monotonic
 from collections import OrderedDict
 from gettext import gettext as _
-from .process import TracedProcess, create_process_event, SignalEvent
+from .process import TracedProcess, create_process_event, SignalEvent, WALL
 from .utils import spawn_child
-from .common import debug
+from .common import debug, DEBUG
 
 
 class TracerError(Exception):
     """Error raised when a tracing operation failed"""
 
 
+def _on_sigchld(signum, frame):
+    pass
+
+
 class Tracer(object):
     """Trace a process"""
     def __init__(self):
         self._procs = OrderedDict()
         self._fork_enabled = False
+        self._clone_enabled = False
         self._exec_enabled = False
         self._sysgood_enabled = False
         self._options = 0
+        self._wakeup = None
+        self._statuses = []
 
     def __getitem__(self, key):
         return self._procs[key]
 
+    def __len__(self):
+        return len(self._procs)
+
     def __iter__(self):
-        return self._procs.itervalues()
+        return iter(list(self._procs.values()))
 
     def __contains__(self, key):
         return key in self._procs
@@ -73,6 +85,21 @@ class Tracer(object):
                             None,
                             "Enable fork tracing")
 
+    def _set_clone_enabled(self, value):
+        mask = ptrace.O_TRACECLONE
+        if value:
+            self._options |= mask
+        else:
+            self._options &= ~mask
+        self._clone_enabled = value
+
+    def _get_clone_enabled(self):
+        return self._clone_enabled
+
+    clone_enabled = property(_get_clone_enabled, _set_clone_enabled,
+                             None,
+                             "Enable thread tracing")
+
     def _set_exec_enabled(self, value):
         mask = ptrace.O_TRACEEXEC | ptrace.O_TRACEEXIT
         if value:
@@ -106,58 +133,226 @@ class Tracer(object):
                                from kernel space. It is unset if it comes
                                from user space""")
 
-    def spawn_process(self, args, env=None, quiet=True):
+    def spawn_process(self, args, env=None, quiet=True, resume=True):
+        """Execute a program and trace it.
+
+        :param args: arguments of the program.
+        :type args: list of str.
+
+        :param env: environment variables for the process.
+        :type env: mapping between strings.
+
+        :param quiet: if True, the output of the program will not be printed.
+        :type quiet: bool.
+
+        :param resume: if False, leave the process stopped.
+        :type resume: bool.
+
+        :returns: the traced process.
+        :rtype: :class:`ptraceplus.process.TracedProcess`.
+        """
         flags = 0
         pid = spawn_child(args, env, quiet)
         pid, status = os.waitpid(pid, flags)
         proc = self.add_process(pid)
-        proc.syscall()
+        if resume:
+            proc.syscall()
         return proc
 
+    def spawn_processes(self, commands, env=None, quiet=True, resume=True):
+        """Execute several programs and trace them.
+
+        All the children are forked before waiting for the first one to be
+        ready, so their startups overlap.
+
+        :param commands: arguments of the programs.
+        :type commands: list of list of str.
+
+        :param env: environment variables for the processes.
+        :type env: mapping between strings.
+
+        :param quiet: if True, the output of the programs will not be
+                      printed.
+        :type quiet: bool.
+
+        :param resume: if False, leave the processes stopped.
+        :type resume: bool.
+
+        :returns: the traced processes, in the order of the commands.
+        :rtype: list of :class:`ptraceplus.process.TracedProcess`.
+        """
+        pids = [spawn_child(args, env, quiet) for args in commands]
+        procs = []
+        for pid in pids:
+            os.waitpid(pid, 0)
+            proc = self.add_process(pid)
+            if resume:
+                proc.syscall()
+            procs.append(proc)
+        return procs
+
     def add_process(self, pid, is_attached=True, parent=None):
         if pid in self._procs:
             raise TracerError(_('Process {} already registered').format(pid))
-        debug(_("Adding process {}").format(pid))
+        debug(_("Adding process {}"), pid)
         proc = self.keep_process(pid, parent)
         if not is_attached:
-            proc.attach()
+            try:
+                proc.attach()
+            except OSError as e:
+                del self._procs[pid]
+                msg = _("Can not attach process {} ({})")
+                raise TracerError(msg.format(pid, e.strerror))
+            self._wait_for_attach(pid)
         proc.options = self._options
         return proc
 
+    def _wait_for_attach(self, pid):
+        while True:
+            pid, status = os.waitpid(pid, WALL)
+            if not os.WIFSTOPPED(status):
+                del self._procs[pid]
+                raise TracerError(_("Process {} has exited").format(pid))
+            signum = os.WSTOPSIG(status)
+            if signum == signal.SIGSTOP:
+                return
+            ptrace.cont(pid, signum)
+
+    def attach_process(self, pid, resume=True):
+        """Attach a running process and resume it.
+
+        :param pid: PID of the process (or of a thread).
+        :type pid: int.
+
+        :param resume: if False, leave the process stopped.
+        :type resume: bool.
+
+        :returns: the traced process.
+        :rtype: :class:`ptraceplus.process.TracedProcess`.
+        """
+        proc = self.add_process(pid, is_attached=False)
+        if resume:
+            proc.syscall()
+        return proc
+
     def keep_process(self, pid, parent=None):
         if pid in self._procs:
-            debug(_("Remembering process {}").format(pid))
+            if DEBUG:
+                debug(_("Remembering process {}"), pid)
             return self._procs[pid]
 
-        if parent:
-            details = "({})".format(parent.pid)
-        else:
-            details = ''
-        debug(_("Keeping process {} {}").format(pid, details))
+        if DEBUG:
+            if parent:
+                details = "({})".format(parent.pid)
+            else:
+                details = ''
+            debug(_("Keeping process {} {}"), pid, details)
         proc = TracedProcess(pid, parent)
         self._procs[pid] = proc
         return proc
 
     def remove_process(self, pid):
-        debug(_("Removing process {}").format(pid))
+        if DEBUG:
+            debug(_("Removing process {}"), pid)
         try:
             proc = self._procs.pop(pid)
         except KeyError:
             raise TracerError(_('Process not found'))
         proc.terminate()
         proc.detach()
-        debug(_("{} processes still traced").format(len(self._procs)))
+        if DEBUG:
+            debug(_("{} processes still traced"), len(self._procs))
+
+    def wait_for_event(self, wanted_pid=None, blocking=True, timeout=None):
+        """Wait for an event of the traced processes.
+
+        :param wanted_pid: PID of the process to wait for (or None for any).
+        :type wanted_pid: int.
 
-    def wait_for_event(self, wanted_pid=None, blocking=True):
+        :param blocking: if False, return immediately.
+        :type blocking: bool.
+
+        :param timeout: maximum time to wait, in seconds (or None).
+        :type timeout: float.
+
+        :returns: the event, or None if no event occurred.
+        :rtype: :class:`ptraceplus.process.ProcessEvent`.
+        """
         flags = 0
-        if not blocking:
+        if not blocking or timeout is not None:
             flags |= os.WNOHANG
+        if self._clone_enabled:
+            flags |= WALL
         if wanted_pid and wanted_pid not in self._procs:
             raise TracerError(_("Unknown PID ({})").format(wanted_pid))
         pid = wanted_pid or -1
+        if timeout is None:
+            return self._wait(pid, flags)
+
+        deadline = monotonic() + timeout
+        fd = self._get_wakeup_fd()
+        while True:
+            event = self._wait(pid, flags)
+            if event is not None:
+                return event
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return None
+            if fd is None:
+                select.select([], [], [], min(remaining, 0.001))
+            elif select.select([fd], [], [], remaining)[0]:
+                os.read(fd, 512)
+
+    def push_status(self, pid, status):
+        """Report the status of a process which was already waited for.
+
+        The status is returned as an event by the next wait.
+
+        :param pid: PID of the process.
+        :type pid: int.
+
+        :param status: status of the process.
+        :type status: int.
+        """
+        self._statuses.append((pid, status))
+
+    def _wait(self, pid, flags):
+        for i, (p, status) in enumerate(self._statuses):
+            if pid == -1 or p == pid:
+                del self._statuses[i]
+                return create_process_event(p, status)
         pid, status = os.waitpid(pid, flags)
+        if pid == 0:
+            return None
         return create_process_event(pid, status)
 
+    def _get_wakeup_fd(self):
+        # Wake up on SIGCHLD when waiting with a timeout. Only the main
+        # thread can handle signals: other threads poll.
+        if self._wakeup is None:
+            rfd, wfd = os.pipe()
+            os.set_blocking(rfd, False)
+            os.set_blocking(wfd, False)
+            try:
+                handler = signal.signal(signal.SIGCHLD, _on_sigchld)
+                previous = signal.set_wakeup_fd(wfd)
+            except ValueError:
+                os.close(rfd)
+                os.close(wfd)
+                self._wakeup = (None, None, None, None)
+            else:
+                self._wakeup = (rfd, wfd, handler, previous)
+        return self._wakeup[0]
+
+    def _release_wakeup_fd(self):
+        rfd, wfd, handler, previous = self._wakeup
+        self._wakeup = None
+        if rfd is not None:
+            signal.set_wakeup_fd(previous)
+            signal.signal(signal.SIGCHLD, handler)
+            os.close(rfd)
+            os.close(wfd)
+
     def wait_for_signal(self, *signals, **kwargs):
         pid = kwargs.get('pid', None)
         while True:
@@ -169,11 +364,27 @@ class Tracer(object):
     def wait_for_syscall(self, pid=None):
         return self.wait_for_signal(signal.SIGTRAP, pid)
 
+    def detach_all(self):
+        """Detach from all the processes, leaving them running"""
+        stopped = []
+        while self._procs:
+            pid, proc = self._procs.popitem()
+            if proc.release():
+                stopped.append(pid)
+        for pid in stopped:
+            try:
+                os.kill(pid, signal.SIGCONT)
+            except OSError:
+                pass
+
     def quit(self):
         while self._procs:
             pid, proc = self._procs.popitem()
-            debug(_("Removing process {}").format(pid))
+            if DEBUG:
+                debug(_("Removing process {}"), pid)
             proc.terminate()
             proc.detach()
+        if self._wakeup is not None:
+            self._release_wakeup_fd()
 
 # vim: ts=4 sts=4 sw=4 sta et ai
@@ -18,10 +18,16 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import os
 import signal
+from time import monotonic
+from gettext import gettext as _
+from ptraceplus.common import debug, DEBUG
 from ptraceplus.tracer import Tracer
-from ptraceplus.process import (SignalEvent, ForkEvent, ExecutionEvent,
-                                ExitingEvent, ExitedEvent, KilledEvent)
+from ptraceplus.timerwheel import TimerWheel
+from ptraceplus.process import (SignalEvent, ForkEvent, CloneEvent,
+                                ExecutionEvent, ExitingEvent, ExitedEvent,
+                                KilledEvent)
 
 
 class TracerPlus(object):
@@ -35,33 +41,355 @@ class TracerPlus(object):
 
     :param quiet: if True, the output of the program will not be printed.
     :type quiet: bool
+
+    If PIDs are added to `attach_pids`, the tracer attaches to these
+    running processes instead of executing the program. On SIGINT, the
+    tracer detaches from all the processes and returns.
+
+    If `profiler` is set to a :class:`ptraceplus.profiling.PhaseProfiler`,
+    the time spent in each phase of the tracer is measured.
+
+    If `sampler` is set to a :class:`ptraceplus.sampling.Sampler`, only the
+    system calls it samples are passed to the callbacks. Outside of its
+    tracing windows, the processes are resumed with PTRACE_CONT and only
+    stop on fork, exec and exit.
+
+    If `follow_threads` is set, the threads created by the processes are
+    traced too, and reported as forks.
+
+    If `fd_tracker` is set to a :class:`ptraceplus.fdtable.FdTracker`, the
+    file descriptor table of each process is kept in its `fds` attribute.
+    The threads share the table of their process.
+    It is read from /proc when the tracing starts, and when the system calls
+    of the process were not traced for a while.
+
+    Likewise, if `mem_tracker` is set to a
+    :class:`ptraceplus.memmap.MemoryTracker`, the memory map of each process
+    is kept in its `maps` attribute. The threads share the map of their
+    process.
+
+    The breakpoints set in a process (see
+    :meth:`ptraceplus.process.TracedProcess.insert_breakpoint`) are kept by
+    its children and its threads, and dropped on exec. The hits of the
+    stopping breakpoints are reported to :meth:`_on_breakpoint`.
+
+    A callback can keep a process stopped for a while with :meth:`hold`:
+    the tracer keeps handling the other processes meanwhile.
     """
     def __init__(self, arguments, env=None, quiet=True):
         self._args = arguments
         self._env = env
         self._quiet = quiet
         self._n_procs = 0
+        self._n_events = 0
+        self._start_time = None
+        self._end_time = None
+        self._busy_time = 0.0
+        self._interrupted = False
+        self._stop_time = None
+        self.control_path = None
+        self.attach_pids = []
+        self.profiler = None
+        self.sampler = None
+        self.fd_tracker = None
+        self.mem_tracker = None
+        self.follow_threads = False
+        self._tracer = None
+        self._n_detached = 0
+        self._paused = set()
+        self._skipped = set()
+        self._detaching = set()
+        # Delay requested for the current stop of each process, and the
+        # timer of each held process
+        self._holds = {}
+        self._held = {}
+        self._timers = None
 
     @property
     def n_procs(self):
         return self._n_procs
 
+    @property
+    def n_detached(self):
+        return self._n_detached
+
+    @property
+    def interrupted(self):
+        return self._interrupted
+
+    @property
+    def n_events(self):
+        return self._n_events
+
+    @property
+    def sampling_ratio(self):
+        """Estimated fraction of the system calls passed to the callbacks"""
+        if self.sampler is None:
+            return 1.0
+        return self.sampler.ratio
+
+    @property
+    def elapsed(self):
+        """Time elapsed since the tracer was started, in seconds"""
+        if self._start_time is None:
+            return 0.0
+        end = self._end_time or monotonic()
+        return end - self._start_time
+
+    def live_stats(self):
+        """Return the counters of the tracer.
+
+        The counters can be read while the tracer is running.
+
+        :returns: the counters.
+        :rtype: dict.
+        """
+        elapsed = self.elapsed
+        if elapsed > 0:
+            rate = self._n_events / elapsed
+            overhead = self._busy_time / elapsed
+        else:
+            rate = 0.0
+            overhead = 0.0
+        stats = {
+            'n_procs': self._n_procs,
+            'n_detached': self._n_detached,
+            'n_events': self._n_events,
+            'elapsed': elapsed,
+            'events_per_second': rate,
+            'overhead': overhead,
+        }
+        if self.sampler:
+            stats['sampling_ratio'] = self.sampler.ratio
+        if self._held:
+            stats['n_held'] = len(self._held)
+        if self.profiler:
+            stats['profile'] = dict((p, {'calls': c, 'time': t})
+                                    for p, c, t in self.profiler.results)
+        return stats
+
+    def _get_profiled_phases(self):
+        callbacks = ('_on_event', '_on_syscall_enter', '_on_syscall_exit',
+                     '_on_fork', '_on_exec', '_on_exiting', '_on_exit',
+                     '_on_killed', '_on_breakpoint')
+        return dict((c, 'callbacks') for c in callbacks)
+
     def run(self):
         """Run the tracer"""
 
+        if self.control_path:
+            from ptraceplus.control import ControlServer
+            server = ControlServer(self.control_path, self._on_control)
+            server.start()
+        else:
+            server = None
+        if self.profiler:
+            self.profiler.install()
+            self.profiler.instrument(self, self._get_profiled_phases())
+        try:
+            self._run()
+        finally:
+            if self.profiler:
+                self.profiler.uninstall()
+            if server:
+                server.stop()
+
+    def _run(self):
         tracer = Tracer()
         tracer.fork_enabled = True
+        tracer.clone_enabled = self.follow_threads
         tracer.exec_enabled = True
         tracer.sysgood_enabled = True
+        if self.profiler:
+            self.profiler.instrument(tracer, {'wait_for_event': 'wait'})
+        self._tracer = tracer
+
+        self._start_time = monotonic()
+        self._end_time = None
+        self._interrupted = False
+        self._stop_time = None
+        self._timers = TimerWheel(now=self._start_time)
+        if self.sampler:
+            self.sampler.start(self._start_time)
+        try:
+            if self.attach_pids:
+                for pid in self.attach_pids:
+                    proc = tracer.attach_process(pid, resume=False)
+                    self._n_procs += 1
+                    self._read_fds(proc)
+                    self._read_maps(proc)
+                    self._on_tracing_started(proc)
+                    self._resume(proc)
+            else:
+                proc = tracer.spawn_process(self._args, self._env,
+                                            self._quiet, resume=False)
+                self._n_procs += 1
+                self._read_fds(proc)
+                self._read_maps(proc)
+                self._on_tracing_started(proc)
+                self._resume(proc)
+            self._loop(tracer)
+            if not self.attach_pids and self._n_detached:
+                self._wait_for_child(proc.pid)
+        except KeyboardInterrupt:
+            self._interrupted = True
+            tracer.detach_all()
+
+        self._end_time = monotonic()
+        if self.sampler:
+            self.sampler.stop(self._end_time)
+        tracer.quit()
+        self._tracer = None
+
+    def _wait_for_child(self, pid):
+        # The program may have been detached: wait for it to finish.
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+    def detach_process(self, pid):
+        """Stop tracing a process, leaving it running.
 
-        proc = tracer.spawn_process(self._args, self._env, self._quiet)
-        self._n_procs += 1
-        self._on_tracing_started(proc)
+        The process is detached at its next stop, so this can be called from
+        the callbacks. Its future children will not be traced.
 
+        :param pid: PID of the process.
+        :type pid: int.
+        """
+        self._detaching.add(pid)
+
+    def stop_tracing(self, delay=0.0):
+        """Stop tracing all the processes, leaving them running.
+
+        The processes are detached once the current event is handled, so
+        this can be called from the callbacks. As for the detached
+        processes, the tracer still waits for the program to finish.
+
+        :param delay: time to wait before detaching, in seconds.
+        :type delay: float.
+        """
+        stop_time = monotonic() + delay
+        if self._stop_time is None or stop_time < self._stop_time:
+            self._stop_time = stop_time
+
+    def hold(self, pid, delay):
+        """Keep a process stopped for a while.
+
+        The process is resumed once the current event is handled and the
+        delay has expired, so this can be called from the callbacks. The
+        other processes are traced meanwhile.
+
+        :param pid: PID of the process.
+        :type pid: int.
+
+        :param delay: time to keep the process stopped, in seconds.
+        :type delay: float.
+        """
+        self._holds[pid] = delay
+
+    def _detach_all(self, tracer):
+        n_procs = len(list(tracer))
+        tracer.detach_all()
+        self._n_detached += n_procs
+        self._paused.clear()
+        self._skipped.clear()
+        self._detaching.clear()
+        self._holds.clear()
+        for timer in self._held.values():
+            self._timers.cancel(timer)
+        self._held.clear()
+
+    def _trace_syscalls(self, proc):
+        """Check if a process must stop on each system call.
+
+        Otherwise, it is resumed with PTRACE_CONT and only stops on fork,
+        exec and exit.
+
+        :param proc: the process.
+        :type proc: :class:`ptraceplus.process.TracedProcess`.
+
+        :returns: True if the system calls of the process are traced.
+        :rtype: bool.
+        """
+        return self.sampler is None or self.sampler.is_tracing
+
+    def _resume(self, proc, signum=0):
+        if self._holds and proc.pid in self._holds:
+            when = monotonic() + self._holds.pop(proc.pid)
+            self._held[proc.pid] = self._timers.schedule(when, (proc, signum))
+            return
+        if self._detaching and proc.pid in self._detaching:
+            if signum in (0, signal.SIGTRAP):
+                if DEBUG:
+                    debug(_("Detaching unwanted process {}"), proc.pid)
+                self._detaching.discard(proc.pid)
+                self._forget(proc.pid)
+                proc.release()
+                self._tracer.remove_process(proc.pid)
+                self._n_detached += 1
+                return
+        if proc.system_call is None and not self._trace_syscalls(proc):
+            self._paused.add(proc.pid)
+            if proc.fds is not None:
+                proc.fds.stale = True
+            if proc.maps is not None:
+                proc.maps.stale = True
+            proc.cont(signum)
+        else:
+            if proc.pid in self._paused:
+                self._paused.discard(proc.pid)
+                if proc.fds is not None and proc.fds.stale:
+                    proc.fds.resync(proc.pid)
+                if proc.maps is not None and proc.maps.stale:
+                    proc.maps.resync(proc.pid)
+            proc.syscall(signum)
+
+    def _update_sampling(self, tracer):
+        was_tracing = self.sampler.is_tracing
+        if self.sampler.update(monotonic(), self._busy_time) == was_tracing:
+            return
+        if was_tracing:
+            debug(_("Sampling: tracing paused"))
+            return
+        debug(_("Sampling: tracing resumed"))
+        for pid in self._paused:
+            try:
+                tracer[pid].interrupt()
+            except (KeyError, OSError):
+                pass
+
+    def _loop(self, tracer):
         while True:
             if not tracer.has_processes:
                 break
-            event = tracer.wait_for_event()
+            deadline = self._stop_time
+            if deadline is not None and monotonic() >= deadline:
+                debug(_("Stopping the tracing"))
+                self._detach_all(tracer)
+                break
+            if self.sampler and self.sampler.deadline is not None:
+                if deadline is None or self.sampler.deadline < deadline:
+                    deadline = self.sampler.deadline
+            if self._held:
+                self._release_held()
+                if self._held:
+                    release = self._timers.next_deadline()
+                    if deadline is None or release < deadline:
+                        deadline = release
+            if deadline is not None:
+                timeout = max(0.0, deadline - monotonic())
+                event = tracer.wait_for_event(timeout=timeout)
+                if event is None:
+                    if self.sampler:
+                        self._update_sampling(tracer)
+                    continue
+            else:
+                event = tracer.wait_for_event()
+            started = monotonic()
+            self._n_events += 1
+            if DEBUG:
+                debug(_("Event: {}"), event)
             self._on_event(event)
             if isinstance(event, SignalEvent):
                 # The tracer can be notified of a child receiving a SIGSTOP
@@ -71,38 +399,136 @@ class TracerPlus(object):
                         proc = tracer.keep_process(event.pid)
                     else:
                         proc = tracer[event.pid]
-                    proc.syscall()
+                    self._resume(proc)
                 else:
                     proc = tracer[event.pid]
                     if event.is_syscall:
                         if proc.system_call is None:
                             syscall = proc.prepare_syscall_enter()
-                            self._on_syscall_enter(syscall)
+                            if self.sampler is None or \
+                               self.sampler.sample(proc.pid):
+                                self._on_syscall_enter(syscall)
+                            else:
+                                self._skipped.add(proc.pid)
                         else:
                             syscall = proc.prepare_syscall_exit()
-                            self._on_syscall_exit(syscall)
-                    proc.syscall(event.signum)
+                            if self.fd_tracker and proc.fds is not None:
+                                self.fd_tracker.update(proc.fds, syscall)
+                            if self.mem_tracker and proc.maps is not None:
+                                self.mem_tracker.update(proc.maps, syscall,
+                                                        proc.fds)
+                            if proc.pid in self._skipped:
+                                self._skipped.discard(proc.pid)
+                            else:
+                                self._on_syscall_exit(syscall)
+                    elif event.signum == signal.SIGTRAP and \
+                            proc.breakpoints is not None:
+                        address = proc.hit_breakpoint()
+                        if address is not None and \
+                           not proc.breakpoints.is_counting(address):
+                            self._on_breakpoint(proc, address)
+                    self._resume(proc, event.signum)
             elif isinstance(event, ForkEvent):
                 self._on_fork(event)
                 self._n_procs += 1
                 parent = tracer[event.pid]
+                known = event.child_pid in tracer
                 proc = tracer.keep_process(event.child_pid, parent)
-                parent.syscall()
+                if parent.fds is not None and proc.fds is None:
+                    if isinstance(event, CloneEvent):
+                        proc.fds = parent.fds
+                    elif known:
+                        # The child may already have changed its table
+                        self._read_fds(proc)
+                    else:
+                        proc.fds = parent.fds.copy()
+                if parent.maps is not None and proc.maps is None:
+                    if isinstance(event, CloneEvent):
+                        proc.maps = parent.maps
+                    elif known:
+                        self._read_maps(proc)
+                    else:
+                        proc.maps = parent.maps.copy()
+                if parent.breakpoints is not None and \
+                   proc.breakpoints is None:
+                    if isinstance(event, CloneEvent):
+                        proc.breakpoints = parent.breakpoints
+                    else:
+                        proc.breakpoints = parent.breakpoints.copy()
+                self._resume_in_syscall(parent)
             elif isinstance(event, ExitingEvent):
                 self._on_exiting(event)
                 proc = tracer[event.pid]
-                proc.syscall()
+                self._resume(proc)
+            elif event.pid not in tracer:
+                # A child of the tracer which was detached
+                pass
             elif isinstance(event, KilledEvent):
                 self._on_killed(event)
+                self._forget(event.pid)
                 tracer.remove_process(event.pid)
             elif isinstance(event, ExitedEvent):
                 self._on_exit(event)
+                self._forget(event.pid)
                 tracer.remove_process(event.pid)
             elif isinstance(event, ExecutionEvent):
                 proc = tracer[event.pid]
-                proc.syscall()
+                if proc.fds is not None:
+                    proc.fds.execute()
+                if proc.maps is not None:
+                    proc.maps.resync(proc.pid)
+                proc.drop_breakpoints()
+                self._on_exec(event)
+                self._resume_in_syscall(proc)
+            self._busy_time += monotonic() - started
+            if self.sampler:
+                self._update_sampling(tracer)
 
-        tracer.quit()
+    def _release_held(self):
+        for proc, signum in self._timers.advance(monotonic()):
+            del self._held[proc.pid]
+            try:
+                self._resume(proc, signum)
+            except ProcessLookupError:
+                # Killed while held: its exit is still to be waited for
+                pass
+
+    def _resume_in_syscall(self, proc):
+        # The process stopped inside fork or exec. If it did not stop on the
+        # entry of the system call, the next stop will be its exit.
+        if proc.pid in self._paused and proc.system_call is None:
+            if self._trace_syscalls(proc) and proc.pid not in self._detaching:
+                proc.prepare_syscall_enter()
+                self._skipped.add(proc.pid)
+        self._resume(proc)
+
+    def _read_fds(self, proc):
+        if self.fd_tracker:
+            from ptraceplus.fdtable import FdTable
+            proc.fds = FdTable()
+            proc.fds.resync(proc.pid)
+
+    def _read_maps(self, proc):
+        if self.mem_tracker:
+            from ptraceplus.memmap import MemoryMap
+            proc.maps = MemoryMap()
+            proc.maps.resync(proc.pid)
+
+    def _forget(self, pid):
+        self._paused.discard(pid)
+        self._skipped.discard(pid)
+        self._detaching.discard(pid)
+        self._holds.pop(pid, None)
+        timer = self._held.pop(pid, None)
+        if timer is not None:
+            self._timers.cancel(timer)
+
+    def _on_control(self, request):
+        from ptraceplus.control import ControlError
+        if request['command'] == 'stats':
+            return self.live_stats()
+        msg = _("Unknown command '{}'").format(request['command'])
+        raise ControlError(msg)
 
     def _on_tracing_started(self, proc):
         pass
@@ -128,4 +554,10 @@ class TracerPlus(object):
     def _on_fork(self, event):
         pass
 
+    def _on_exec(self, event):
+        pass
+
+    def _on_breakpoint(self, proc, address):
+        pass
+
 # vim: ts=4 sts=4 sw=4 sta et ai
@@ -25,6 +25,8 @@ Utilities
 import sys
 import os
 import signal
+import struct
+import functools
 import ptraceminus as ptrace
 from gettext import gettext as _
 from .common import debug
@@ -34,6 +36,10 @@ try:
 except:
     __MAXFD = 256
 
+# Entry of the auxiliary vector pointing to the path passed to execve()
+AT_EXECFN = 31
+_AUXV_ENTRY = struct.Struct('LL')
+
 
 class SpawnError(Exception):
     """Error raised when child can not be spawned"""
@@ -52,13 +58,44 @@ def find_program(program):
         return program
     if os.path.dirname(program):
         return os.path.normpath(os.path.join(os.getcwd(), program))
-    for path in os.environ['PATH'].split(':'):
+    return _search_path(program, os.environ.get('PATH', os.defpath))
+
+
+@functools.lru_cache(maxsize=256)
+def _search_path(program, paths):
+    for path in paths.split(':'):
         filename = os.path.join(path, program)
         if os.access(filename, os.X_OK):
             return filename
     raise SpawnError(_('Program not found'))
 
 
+def close_fds(low=3):
+    """Close all the file descriptors from `low`.
+
+    Since Python 3.10, os.closerange() uses the close_range() system call.
+    Otherwise, only the descriptors listed in /proc/self/fd are closed,
+    instead of trying all of them up to the limit of open files.
+
+    :param low: first file descriptor to close.
+    :type low: int.
+    """
+    if sys.version_info >= (3, 10):
+        os.closerange(low, __MAXFD)
+        return
+    try:
+        fds = [int(fd) for fd in os.listdir('/proc/self/fd')]
+    except OSError:
+        os.closerange(low, __MAXFD)
+        return
+    for fd in fds:
+        if fd >= low:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
 def spawn_child(arguments, env=None, quiet=True):
     """Spawn a child process.
 
@@ -75,19 +112,17 @@ def spawn_child(arguments, env=None, quiet=True):
     arguments[0] = program
     pid = os.fork()
     if pid:
-        debug(_("Spawned process {}").format(pid))
+        debug(_("Spawned process {}"), pid)
         return pid
     else:
         try:
             ptrace.traceme()
         except ptrace.PtraceError as e:
-            raise SpawnError(_("Failed to trace child process {}").format(e))
+            msg = _("Failed to trace child process {}").format(e)
+            os.write(2, (msg + '\n').encode())
+            os._exit(255)
 
-        for fd in range(3, __MAXFD):
-            try:
-                os.close(fd)
-            except OSError:
-                pass
+        close_fds(3)
 
         if quiet:
             try:
@@ -106,7 +141,137 @@ def spawn_child(arguments, env=None, quiet=True):
                 os.execve(arguments[0], arguments, env)
             else:
                 os.execv(arguments[0], arguments)
-        except:
-            sys.exit(255)
+        finally:
+            os._exit(255)
+
+
+def _read_exec_filename(pid):
+    # The path is copied by the kernel at the top of the stack
+    try:
+        with open('/proc/{}/auxv'.format(pid), 'rb') as f:
+            auxv = f.read()
+        size = len(auxv) - len(auxv) % _AUXV_ENTRY.size
+        address = dict(_AUXV_ENTRY.iter_unpack(auxv[:size])).get(AT_EXECFN)
+        if not address:
+            return None
+        fd = os.open('/proc/{}/mem'.format(pid), os.O_RDONLY)
+        try:
+            data = os.pread(fd, 4096, address)
+        finally:
+            os.close(fd)
+    except OSError:
+        return None
+    end = data.find(b'\0')
+    if end <= 0:
+        return None
+    return data[:end].decode('utf-8', 'replace')
+
+
+def get_process_command(pid):
+    """Get the program executed by a process and its arguments.
+
+    The program is the path passed to execve(). For a script, the kernel
+    executes its interpreter, with the path of the script and the original
+    arguments: the script is reported with these arguments.
+
+    :param pid: PID of the process.
+    :type pid: int.
+
+    :returns: the path of the program and the arguments (starting with
+              argv[0]), or None if the process has vanished.
+    :rtype: tuple.
+    """
+    try:
+        with open('/proc/{}/cmdline'.format(pid), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    args = [a.decode('utf-8', 'replace') for a in data.split(b'\0')]
+    if args and not args[-1]:
+        args.pop()
+    program = _read_exec_filename(pid)
+    if program is None:
+        if args:
+            program = args[0]
+        else:
+            try:
+                program = os.readlink('/proc/{}/exe'.format(pid))
+            except OSError:
+                return None
+    elif args and program != args[0] and program in args[1:3]:
+        # The interpreter, its optional argument and the script
+        args = [program] + args[args.index(program, 1) + 1:]
+    return program, args
+
+
+def list_threads(pid):
+    """List the threads of a process.
+
+    :param pid: PID of the process.
+    :type pid: int.
+
+    :returns: the thread identifiers, starting with the PID.
+    :rtype: list of int.
+    """
+    try:
+        tids = [int(t) for t in os.listdir('/proc/{}/task'.format(pid))]
+    except OSError:
+        return []
+    return [pid] + sorted(t for t in tids if t != pid)
+
+
+def _read_children(pid, tids):
+    children = []
+    for tid in tids:
+        path = '/proc/{}/task/{}/children'.format(pid, tid)
+        with open(path) as f:
+            children += [int(c) for c in f.read().split()]
+    return children
+
+
+def _scan_children():
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/{}/stat'.format(entry)) as f:
+                data = f.read()
+        except IOError:
+            continue
+        ppid = int(data.rsplit(')', 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def list_process_tree(pid):
+    """List the threads of a process and of all its descendants.
+
+    The children are read from '/proc/<pid>/task/<tid>/children' when the
+    kernel provides it, otherwise '/proc' is scanned once.
+
+    :param pid: PID of the root process.
+    :type pid: int.
+
+    :returns: the thread identifiers, parents first.
+    :rtype: list of int.
+    """
+    result = []
+    pending = [pid]
+    table = None
+    while pending:
+        current = pending.pop(0)
+        tids = list_threads(current)
+        if not tids:
+            continue
+        result += tids
+        if table is None:
+            try:
+                pending += _read_children(current, tids)
+                continue
+            except IOError:
+                table = _scan_children()
+        pending += table.get(current, [])
+    return result
 
 # vim: ts=4 sts=4 sw=4 sta et ai
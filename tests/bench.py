@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Tracing overhead benchmarks
+
+Each workload of tests/data is run untraced, then under each tracer mode.
+Every traced run happens in a fresh worker process, so the resident set
+size reported is the one of the tracer alone.
+
+The results are written as JSON, and can be compared with the results of
+another run (e.g. of another commit) using --compare.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+_TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+_ROOT_DIR = os.path.dirname(_TEST_DIR)
+DATA_DIR = os.path.join(_TEST_DIR, 'data')
+
+WORKLOADS = {
+    'syscalls': ('bench_syscalls', 20000),
+    'fork': ('bench_fork', 200),
+    'exec': ('bench_exec', 100),
+    'threads': ('bench_threads', 2000),
+    'paths': ('bench_paths', 5000),
+}
+
+MODES = (
+    'tracer',
+    'syscall',
+    'syscall-full',
+    'syscall-summary',
+    'execution',
+    'execution-files',
+)
+
+
+def get_command(workload, scale):
+    program, count = WORKLOADS[workload]
+    args = [os.path.join(DATA_DIR, program)]
+    if workload == 'threads':
+        args.append('4')
+    args.append(str(max(1, int(count * scale))))
+    return args
+
+
+def create_tracer(mode, args, stream):
+    from ptraceplus.tracerplus import TracerPlus
+    from ptraceplus.extra import SyscallTracer, ExecutionTracer
+    if mode == 'tracer':
+        tracer = TracerPlus(args)
+    elif mode.startswith('syscall'):
+        tracer = SyscallTracer(args, full=(mode == 'syscall-full'),
+                               stream=stream)
+        tracer.summary_only = (mode == 'syscall-summary')
+    elif mode.startswith('execution'):
+        tracer = ExecutionTracer(args, stream=stream)
+        tracer.with_files = (mode == 'execution-files')
+    else:
+        raise ValueError("Unknown mode '{}'".format(mode))
+    return tracer
+
+
+def run_worker(mode, args):
+    import resource
+    with open(os.devnull, 'w') as stream:
+        tracer = create_tracer(mode, args, stream)
+        start = time.monotonic()
+        tracer.run()
+        elapsed = time.monotonic() - start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    result = {
+        'elapsed': elapsed,
+        'events': tracer.n_events,
+        'rss_kb': usage.ru_maxrss,
+    }
+    print(json.dumps(result))
+
+
+def run_untraced(args):
+    start = time.monotonic()
+    with open(os.devnull, 'w') as f:
+        subprocess.check_call(args, stdout=f, stderr=f)
+    return {'elapsed': time.monotonic() - start, 'events': 0, 'rss_kb': 0}
+
+
+def run_traced(mode, args, env=None):
+    cmd = [sys.executable, os.path.abspath(__file__), '--worker', mode,
+           '--'] + args
+    output = subprocess.check_output(cmd, env=env, universal_newlines=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def get_revision():
+    try:
+        cmd = ['git', '-C', _ROOT_DIR, 'rev-parse', '--short', 'HEAD']
+        with open(os.devnull, 'w') as f:
+            return subprocess.check_output(cmd, stderr=f,
+                                           universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_env(log_level=None):
+    env = dict(os.environ)
+    path = [_ROOT_DIR] + sys.path
+    env['PYTHONPATH'] = os.pathsep.join(p for p in path if p)
+    if log_level:
+        env['PTRACEPLUS_LOG'] = log_level
+    else:
+        env.pop('PTRACEPLUS_LOG', None)
+    return env
+
+
+def run_benchmarks(workloads, modes, scale=1.0, repeat=3, env=None):
+    """Run the benchmarks.
+
+    :param workloads: names of the workloads.
+    :type workloads: list of str.
+
+    :param modes: names of the tracer modes.
+    :type modes: list of str.
+
+    :param scale: factor applied to the size of the workloads.
+    :type scale: float.
+
+    :param repeat: number of runs, the fastest being kept.
+    :type repeat: int.
+
+    :returns: the results.
+    :rtype: list of dict.
+    """
+    results = []
+    for workload in workloads:
+        args = get_command(workload, scale)
+        base = min((run_untraced(args) for i in range(repeat)),
+                   key=lambda r: r['elapsed'])
+        base.update(workload=workload, mode='untraced', slowdown=1.0,
+                    events_per_second=0.0)
+        results.append(base)
+        for mode in modes:
+            result = min((run_traced(mode, args, env) for i in range(repeat)),
+                         key=lambda r: r['elapsed'])
+            elapsed = result['elapsed']
+            result.update(workload=workload, mode=mode,
+                          slowdown=elapsed / base['elapsed'],
+                          events_per_second=result['events'] / elapsed)
+            results.append(result)
+    return results
+
+
+def format_results(results, previous=None):
+    ref = {}
+    for r in previous or []:
+        ref[(r['workload'], r['mode'])] = r
+    lines = ["{:<10} {:<16} {:>10} {:>9} {:>10} {:>12} {:>9}".format(
+        'workload', 'mode', 'elapsed', 'slowdown', 'events', 'events/s',
+        'rss (kB)')]
+    for r in results:
+        line = "{:<10} {:<16} {:>10.4f} {:>9.1f} {:>10} {:>12.0f} {:>9}"
+        line = line.format(r['workload'], r['mode'], r['elapsed'],
+                           r['slowdown'], r['events'],
+                           r['events_per_second'], r['rss_kb'])
+        old = ref.get((r['workload'], r['mode']))
+        if old and old['elapsed'] > 0:
+            line += " {:>+7.1f}%".format(100.0 *
+                                         (r['elapsed'] / old['elapsed'] - 1))
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tracing overhead benchmarks')
+    parser.add_argument('--workload', '-w',
+                        action='append',
+                        dest='workloads',
+                        choices=sorted(WORKLOADS.keys()),
+                        help='workload to run (default: all)')
+    parser.add_argument('--mode', '-m',
+                        action='append',
+                        dest='modes',
+                        choices=MODES,
+                        help='tracer mode (default: all)')
+    parser.add_argument('--scale', '-s',
+                        type=float,
+                        default=1.0,
+                        help='factor applied to the size of the workloads')
+    parser.add_argument('--repeat', '-r',
+                        type=int,
+                        default=3,
+                        help='number of runs, the fastest being kept')
+    parser.add_argument('--log', '-l',
+                        metavar='LEVEL',
+                        choices=('debug', 'info', 'warning', 'error'),
+                        help='value of PTRACEPLUS_LOG for the tracers')
+    parser.add_argument('--output', '-o',
+                        metavar='FILE',
+                        help='write the results as JSON to file')
+    parser.add_argument('--compare', '-c',
+                        metavar='FILE',
+                        help='compare with results written by a previous run')
+    parser.add_argument('--worker',
+                        metavar='MODE',
+                        help=argparse.SUPPRESS)
+    parser.add_argument('arguments',
+                        nargs=argparse.REMAINDER,
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        sys.path.insert(0, _ROOT_DIR)
+        arguments = args.arguments
+        if arguments and arguments[0] == '--':
+            arguments = arguments[1:]
+        run_worker(args.worker, arguments)
+        return
+
+    subprocess.check_call(['make', '-s', '-C', DATA_DIR])
+    workloads = args.workloads or sorted(WORKLOADS.keys())
+    modes = args.modes or list(MODES)
+    results = run_benchmarks(workloads, modes, args.scale, args.repeat,
+                             make_env(args.log))
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['results']
+    print(format_results(results, previous))
+
+    if args.output:
+        report = {
+            'revision': get_revision(),
+            'python': sys.version.split()[0],
+            'scale': args.scale,
+            'log': args.log,
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -0,0 +1,19 @@
+#include <stdlib.h>
+#include <stdio.h>
+#include <unistd.h>
+
+/* Exec chain: the program executes itself until the counter reaches 0 */
+int main(int argc, char *argv[])
+{
+	long count = (argc > 1) ? atol(argv[1]) : 10;
+	char buffer[32];
+	char *args[] = { argv[0], buffer, NULL };
+
+	if (count <= 0)
+		return 0;
+
+	snprintf(buffer, sizeof(buffer), "%ld", count - 1);
+	execv("/proc/self/exe", args);
+	perror("Failed to execute program");
+	return 1;
+}
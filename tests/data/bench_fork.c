@@ -0,0 +1,29 @@
+#include <stdlib.h>
+#include <stdio.h>
+#include <unistd.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+
+/* Fork storm: children exit immediately */
+int main(int argc, char *argv[])
+{
+	long count = (argc > 1) ? atol(argv[1]) : 100;
+	long i;
+	pid_t pid;
+
+	for (i = 0; i < count; i++) {
+		pid = fork();
+		if (pid == 0)
+			_exit(0);
+		if (pid == -1) {
+			perror("Error trying to fork");
+			return 1;
+		}
+		if (waitpid(pid, NULL, 0) == -1) {
+			perror("Error waiting for child");
+			return 2;
+		}
+	}
+
+	return 0;
+}
@@ -0,0 +1,27 @@
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <sys/stat.h>
+
+/* Long path strings: probe deep, non-existent paths */
+int main(int argc, char *argv[])
+{
+	long count = (argc > 1) ? atol(argv[1]) : 1000;
+	char path[4096];
+	struct stat st;
+	size_t len = 0;
+	long i;
+
+	while (len + 16 < sizeof(path) / 2) {
+		memcpy(path + len, "/some-directory", 15);
+		len += 15;
+	}
+	path[len] = '\0';
+
+	for (i = 0; i < count; i++) {
+		path[len - 1] = 'a' + (i % 26);
+		stat(path, &st);
+	}
+
+	return 0;
+}
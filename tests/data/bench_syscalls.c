@@ -0,0 +1,14 @@
+#include <stdlib.h>
+#include <unistd.h>
+
+/* Syscall-heavy loop: cheap system calls, back to back */
+int main(int argc, char *argv[])
+{
+	long count = (argc > 1) ? atol(argv[1]) : 10000;
+	long i;
+
+	for (i = 0; i < count; i++)
+		getppid();
+
+	return 0;
+}
@@ -0,0 +1,58 @@
+#include <stdlib.h>
+#include <stdio.h>
+#include <string.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <pthread.h>
+
+/* Multi-threaded I/O: each thread writes and reads blocks on its own fds */
+static long count = 1000;
+
+static void *worker(void *arg)
+{
+	char block[4096];
+	int out, in;
+	long i;
+
+	memset(block, 'x', sizeof(block));
+	out = open("/dev/null", O_WRONLY);
+	in = open("/dev/zero", O_RDONLY);
+	if (out == -1 || in == -1) {
+		perror("Failed to open device");
+		return NULL;
+	}
+
+	for (i = 0; i < count; i++) {
+		if (write(out, block, sizeof(block)) == -1)
+			break;
+		if (read(in, block, sizeof(block)) == -1)
+			break;
+	}
+
+	close(in);
+	close(out);
+	return NULL;
+}
+
+int main(int argc, char *argv[])
+{
+	long n_threads = (argc > 1) ? atol(argv[1]) : 4;
+	pthread_t *threads;
+	long i;
+
+	if (argc > 2)
+		count = atol(argv[2]);
+
+	threads = calloc(n_threads, sizeof(pthread_t));
+	if (threads == NULL)
+		return 1;
+
+	for (i = 0; i < n_threads; i++)
+		pthread_create(&threads[i], NULL, worker, NULL);
+
+	for (i = 0; i < n_threads; i++)
+		pthread_join(threads[i], NULL);
+
+	free(threads);
+	return 0;
+}
@@ -0,0 +1,38 @@
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/wait.h>
+
+/*
+ * Write from two functions, to attribute the system calls to them. With an
+ * argument, the writes are done by two processes.
+ */
+static void log_line(int fd)
+{
+	write(fd, "log\n", 4);
+}
+
+static void flush_all(int fd)
+{
+	write(fd, "flush\n", 6);
+}
+
+int main(int argc, char *argv[])
+{
+	pid_t pid = 0;
+	int fd, i;
+
+	fd = open("/dev/null", O_WRONLY);
+	if (fd < 0)
+		return 1;
+	if (argc > 1)
+		pid = fork();
+	for (i = 0; i < 100; i++)
+		log_line(fd);
+	for (i = 0; i < 10; i++)
+		flush_all(fd);
+	close(fd);
+	if (pid > 0)
+		waitpid(pid, NULL, 0);
+
+	return 0;
+}
@@ -0,0 +1,45 @@
+#define _GNU_SOURCE
+#include <stddef.h>
+#include <stdlib.h>
+#include <stdio.h>
+#include <string.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <sys/socket.h>
+#include <sys/un.h>
+
+/* Create, duplicate and close file descriptors, then fork and exec */
+int main(int argc, char *argv[])
+{
+	struct sockaddr_un addr;
+	int fds[2];
+	int fd, sock;
+	pid_t pid;
+
+	if (argc > 1)
+		return 0;
+
+	fd = open("/dev/null", O_RDONLY);
+	dup2(fd, 10);
+	fcntl(fd, F_DUPFD_CLOEXEC, 20);
+	pipe2(fds, O_CLOEXEC);
+	close(fd);
+
+	sock = socket(AF_UNIX, SOCK_STREAM, 0);
+	memset(&addr, 0, sizeof(addr));
+	addr.sun_family = AF_UNIX;
+	strcpy(addr.sun_path + 1, "ptraceplus-fds");
+	bind(sock, (struct sockaddr *)&addr,
+	     offsetof(struct sockaddr_un, sun_path) + 15);
+	dup3(sock, 30, O_CLOEXEC);
+
+	pid = fork();
+	if (pid == 0)
+		return 0;
+	waitpid(pid, NULL, 0);
+
+	execl(argv[0], argv[0], "exec", NULL);
+	return 255;
+}
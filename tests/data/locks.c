@@ -0,0 +1,43 @@
+#include <stdlib.h>
+#include <stdio.h>
+#include <unistd.h>
+#include <pthread.h>
+
+/* Lock contention: the threads hold a single mutex while sleeping */
+static pthread_mutex_t lock = PTHREAD_MUTEX_INITIALIZER;
+static long count = 10;
+
+static void *worker(void *arg)
+{
+	long i;
+
+	for (i = 0; i < count; i++) {
+		pthread_mutex_lock(&lock);
+		usleep(1000);
+		pthread_mutex_unlock(&lock);
+	}
+	return NULL;
+}
+
+int main(int argc, char *argv[])
+{
+	long n_threads = (argc > 1) ? atol(argv[1]) : 4;
+	pthread_t *threads;
+	long i;
+
+	if (argc > 2)
+		count = atol(argv[2]);
+
+	threads = calloc(n_threads, sizeof(pthread_t));
+	if (threads == NULL)
+		return 1;
+
+	for (i = 0; i < n_threads; i++)
+		pthread_create(&threads[i], NULL, worker, NULL);
+
+	for (i = 0; i < n_threads; i++)
+		pthread_join(threads[i], NULL);
+
+	free(threads);
+	return 0;
+}
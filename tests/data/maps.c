@@ -0,0 +1,25 @@
+#define _GNU_SOURCE
+#include <stddef.h>
+#include <unistd.h>
+#include <sys/mman.h>
+
+/* Map, unmap, protect and move memory, then grow and shrink the heap */
+int main(int argc, char *argv[])
+{
+	long page = sysconf(_SC_PAGESIZE);
+	char *p, *q;
+
+	p = mmap(NULL, 4 * page, PROT_READ | PROT_WRITE,
+		 MAP_PRIVATE | MAP_ANONYMOUS, -1, 0);
+	if (p == MAP_FAILED)
+		return 1;
+	munmap(p + page, page);
+	mprotect(p + 2 * page, page, PROT_READ);
+	q = mremap(p + 3 * page, page, 8 * page, MREMAP_MAYMOVE);
+	if (q == MAP_FAILED)
+		return 1;
+	sbrk(16 * page);
+	sbrk(-4 * page);
+
+	return 0;
+}
@@ -0,0 +1,20 @@
+#include <unistd.h>
+
+static volatile int sink;
+
+/* Run a loop of a known number of iterations, to count its instructions */
+static void spin(int n)
+{
+	int i;
+
+	for (i = 0; i < n; i++)
+		sink += i;
+}
+
+int main(int argc, char *argv[])
+{
+	spin(1000);
+	getpid();
+
+	return 0;
+}
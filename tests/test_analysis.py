@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import io
+import json
+import unittest
+from ptraceplus.extra import ProcessInfo
+from ptraceplus.analysis import (analyze_processes, build_process_tree,
+                                 format_process_analysis,
+                                 write_process_analysis_json)
+
+
+def make_info(pid, ppid, name, start, end):
+    info = ProcessInfo(pid, ppid)
+    info.args = [name] if name else []
+    info.start_time = start
+    info.exec_time = start if name else None
+    info.exit_time = end
+    return info
+
+
+class TestProcessAnalysis(unittest.TestCase):
+    """Process analysis tests"""
+
+    def setUp(self):
+        # make runs cc and as in parallel, then ld
+        self._infos = [
+            make_info(10, -1, '/usr/bin/make', 100.0, 110.0),
+            make_info(11, 10, '/usr/bin/cc', 101.0, 105.0),
+            make_info(12, 10, '/usr/bin/as', 101.0, 103.0),
+            make_info(13, 10, None, 106.0, 109.0),
+            make_info(14, 13, '/usr/bin/ld', 106.5, 109.0),
+        ]
+
+    def test_tree(self):
+        """Test if the processes are named and linked to their parent"""
+        nodes = build_process_tree(self._infos, 120.0)
+        self.assertEqual([n.name for n in nodes],
+                         ['make', 'cc', 'as', 'make', 'ld'])
+        self.assertEqual(len(nodes[0].children), 3)
+        self.assertEqual(nodes[3].children, [nodes[4]])
+        self.assertEqual(nodes[1].start, 1.0)
+
+    def test_reused_pid(self):
+        """Test if a reused process identifier is not a parent before"""
+        infos = self._infos + [make_info(11, 10, '/bin/true', 107.0, 108.0),
+                               make_info(15, 11, '/bin/cat', 102.0, 104.0)]
+        nodes = build_process_tree(infos, 120.0)
+        cc = [n for n in nodes if n.name == 'cc'][0]
+        self.assertEqual([n.name for n in cc.children], ['cat'])
+
+    def test_critical_path(self):
+        """Test if the critical path goes through the longest children"""
+        analysis = analyze_processes(self._infos, 120.0)
+        path = [(n.name, s, e) for n, s, e in analysis.critical_path]
+        self.assertEqual(path, [('make', 0.0, 1.0), ('cc', 1.0, 5.0),
+                                ('make', 5.0, 6.0), ('make', 6.0, 6.5),
+                                ('ld', 6.5, 9.0), ('make', 9.0, 10.0)])
+        self.assertEqual(sum(e - s for n, s, e in analysis.critical_path),
+                         analysis.wall_time)
+        top = analysis.critical_processes(1)
+        self.assertEqual((top[0][0].name, top[0][1]), ('cc', 4.0))
+
+    def test_parallelism(self):
+        """Test if the exclusive time and the parallelism are computed"""
+        analysis = analyze_processes(self._infos, 120.0)
+        self.assertEqual([(n.pid, n.exclusive) for n in analysis.processes],
+                         [(10, 3.0), (11, 4.0), (12, 2.0), (13, 0.5),
+                          (14, 2.5)])
+        self.assertEqual(analysis.levels, {1: 8.0, 2: 2.0})
+        self.assertEqual(analysis.parallelism,
+                         [(0.0, 1), (1.0, 2), (3.0, 1), (10.0, 0)])
+        self.assertAlmostEqual(analysis.average_parallelism, 1.2)
+
+    def test_output(self):
+        """Test if the analysis is written as a report and as JSON"""
+        # The trace was interrupted during the link
+        for info in self._infos[3:]:
+            info.exit_time = None
+        infos = [make_info(10, -1, 'make', 100.0, None)] + self._infos[1:]
+        analysis = analyze_processes(infos, 112.0)
+        self.assertEqual(analysis.wall_time, 12.0)
+        report = format_process_analysis(analysis, top=2)
+        self.assertIn('Critical path:', report)
+        stream = io.StringIO()
+        write_process_analysis_json(analysis, stream)
+        data = json.loads(stream.getvalue())
+        self.assertEqual(len(data['processes']), 5)
+        self.assertEqual(data['critical_path'][-1]['name'], 'ld')
+        self.assertEqual(data['levels'], {'1': 10.0, '2': 2.0})
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import unittest
+import bench
+from common import gen_test_progs
+
+
+class TestBenchmarks(unittest.TestCase):
+    """Benchmark suite tests"""
+
+    def setUp(self):
+        gen_test_progs()
+
+    def test_run(self):
+        """Test if a workload can be benchmarked"""
+        results = bench.run_benchmarks(['syscalls'], ['syscall-summary'],
+                                       scale=0.01, repeat=1,
+                                       env=bench.make_env())
+        modes = [r['mode'] for r in results]
+        self.assertEqual(modes, ['untraced', 'syscall-summary'])
+        self.assertGreater(results[1]['events'], 200)
+        self.assertIn('syscall-summary', bench.format_results(results))
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import signal
+import unittest
+import ptraceminus as ptrace
+from ptraceplus.tracer import Tracer
+from ptraceplus.tracerplus import TracerPlus
+from ptraceplus.memmap import MemoryMap
+from ptraceplus.elf import get_symbol_index
+from ptraceplus.breakpoints import BreakpointError, INT3
+from common import gen_test_progs, DATA_DIR
+
+PROGRAM = os.path.join(DATA_DIR, 'callsites')
+
+
+def get_function(pid, name):
+    # The address of a function of the program in the memory of the process
+    maps = MemoryMap()
+    maps.resync(pid)
+    index = get_symbol_index(PROGRAM)
+    return maps.find_file_offset(PROGRAM, index.to_offset(index.find(name)))
+
+
+class BreakpointRecorder(TracerPlus):
+    def __init__(self, arguments, functions):
+        TracerPlus.__init__(self, arguments)
+        self.functions = functions
+        self.hits = {}
+
+    def _trace_syscalls(self, proc):
+        return False
+
+    def _on_exec(self, event):
+        proc = self._tracer[event.pid]
+        for name in self.functions:
+            proc.insert_breakpoint(get_function(proc.pid, name))
+
+    def _on_breakpoint(self, proc, address):
+        self.hits[address] = self.hits.get(address, 0) + 1
+
+
+class TestBreakpoints(unittest.TestCase):
+    """Breakpoint tests"""
+
+    def setUp(self):
+        gen_test_progs()
+        self._tracer = Tracer()
+        self._tracer.exec_enabled = True
+        self._proc = self._tracer.spawn_process([PROGRAM], resume=False)
+        # Stop on the exec event, with the program loaded
+        self._proc.cont()
+        os.waitpid(self._proc.pid, 0)
+
+    def test_insert(self):
+        """Test if the breakpoints replace a single byte"""
+        proc = self._proc
+        address = get_function(proc.pid, 'log_line')
+        word = ptrace.peektext(proc.pid, address)
+        self.assertGreater(word, 0xffff)
+        proc.insert_breakpoint(address)
+        self.assertEqual(ptrace.peektext(proc.pid, address),
+                         (word & ~0xff) | INT3)
+        self.assertRaises(BreakpointError, proc.insert_breakpoint, address)
+        proc.remove_breakpoint(address)
+        self.assertEqual(ptrace.peektext(proc.pid, address), word)
+        self.assertEqual(len(proc.breakpoints), 0)
+
+    def test_stop_and_count(self):
+        """Test if the stopping and counting breakpoints are hit"""
+        proc = self._proc
+        log_line = get_function(proc.pid, 'log_line')
+        flush_all = get_function(proc.pid, 'flush_all')
+        proc.insert_breakpoint(log_line)
+        proc.insert_breakpoint(flush_all, counting=True)
+        status = proc.run_counting()
+        self.assertTrue(os.WIFSTOPPED(status))
+        self.assertEqual(os.WSTOPSIG(status), signal.SIGTRAP)
+        self.assertEqual(proc.hit_breakpoint(), log_line)
+        proc.remove_breakpoint(log_line)
+        status = proc.run_counting()
+        self.assertTrue(os.WIFEXITED(status) or
+                        status >> 16 == ptrace.EVENT_EXIT)
+        self.assertEqual(proc.breakpoints.hits, {flush_all: 10})
+
+    def test_tracer(self):
+        """Test if the tracer steps over the breakpoints of the children"""
+        tracer = BreakpointRecorder([PROGRAM, 'fork'], ['main', 'flush_all'])
+        tracer.run()
+        self.assertEqual(sorted(tracer.hits.values()), [1, 20])
+
+    def tearDown(self):
+        self._tracer.quit()
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import unittest
+from ptraceplus import common
+
+
+class Unformattable(object):
+    def __format__(self, spec):
+        raise AssertionError('formatted')
+
+
+class TestDebug(unittest.TestCase):
+    """Debug messages tests"""
+
+    @unittest.skipIf(os.environ.get('PTRACEPLUS_LOG') == 'debug',
+                     'debug messages enabled')
+    def test_deferred_formatting(self):
+        """Test if debug messages are not formatted when disabled"""
+        self.assertFalse(common.DEBUG)
+        common.debug("{}", Unformattable())
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sts=4 sw=4 sta et ai
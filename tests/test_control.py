@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import socket
+import tempfile
+import unittest
+from ptraceplus.control import ControlServer, ControlError, send_command
+from ptraceplus.extra import SyscallTracer
+
+
+class TestControlServer(unittest.TestCase):
+    """Control socket tests"""
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'control.sock')
+        self._tracer = SyscallTracer(['true'])
+        self._server = ControlServer(self._path, self._tracer._on_control)
+        self._server.start()
+
+    def test_stats(self):
+        """Test if live statistics can be retrieved"""
+        response = send_command(self._path, 'stats')
+        self.assertEqual(response['n_procs'], 0)
+        self.assertEqual(response['syscalls'], {})
+
+    def test_filter(self):
+        """Test if filters can be changed at runtime"""
+        response = send_command(self._path, 'filter', syscalls=['open'],
+                                programs=['gcc'])
+        self.assertEqual(response['programs'], ['gcc'])
+        self.assertEqual(len(response['syscalls']), 1)
+
+    def test_invalid_filter(self):
+        """Test if filters of other types than names are rejected"""
+        response = send_command(self._path, 'filter', programs=[1])
+        self.assertIn('error', response)
+        response = send_command(self._path, 'filter', syscalls='open')
+        self.assertIn('error', response)
+        self.assertEqual(self._tracer._progs, [])
+
+    def test_invalid_command(self):
+        """Test if an unknown command is reported as an error"""
+        response = send_command(self._path, 'frob')
+        self.assertIn('error', response)
+
+    def test_failing_handler(self):
+        """Test if the server survives an error of the handler"""
+        def handler(request):
+            if request['command'] == 'fail':
+                raise KeyError('fail')
+            return {}
+        path = os.path.join(self._dir, 'failing.sock')
+        server = ControlServer(path, handler)
+        server.start()
+        try:
+            self.assertIn('error', send_command(path, 'fail'))
+            self.assertEqual(send_command(path, 'stats'), {})
+        finally:
+            server.stop()
+
+    def test_stale_socket(self):
+        """Test if a socket left behind is replaced, but not a file"""
+        path = os.path.join(self._dir, 'old.sock')
+        # Left behind, as by a killed tracer
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        sock.close()
+        server = ControlServer(path, self._tracer._on_control)
+        server.start()
+        server.stop()
+        path = os.path.join(self._dir, 'trace.log')
+        with open(path, 'w') as f:
+            f.write('log\n')
+        server = ControlServer(path, self._tracer._on_control)
+        self.assertRaises(ControlError, server.start)
+        self.assertTrue(os.path.isfile(path))
+        os.unlink(path)
+
+    def tearDown(self):
+        self._server.stop()
+        os.rmdir(self._dir)
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import unittest
+from ptraceplus.elf import SymbolIndex, ElfError
+from ptraceplus.elf import get_symbol_index, symbolize
+from common import gen_test_progs, DATA_DIR
+
+
+class TestSymbolIndex(unittest.TestCase):
+    """ELF symbol index tests"""
+
+    def setUp(self):
+        gen_test_progs()
+        self._path = os.path.join(DATA_DIR, 'callsites')
+
+    def test_lookup(self):
+        """Test if the functions of a program are found"""
+        index = SymbolIndex(self._path)
+        try:
+            self.assertGreater(len(index), 0)
+            names = [index.lookup(index._addresses[i])
+                     for i in range(len(index))]
+            self.assertIn(('main', 0), names)
+            self.assertIn(('log_line', 0), names)
+            self.assertIsNone(index.lookup(0))
+            address = index.find('log_line')
+            self.assertGreater(index.get_size(address), 0)
+            self.assertIsNone(index.get_size(address + 1))
+        finally:
+            index.close()
+
+    def test_not_elf(self):
+        """Test if the files which are not ELF are rejected"""
+        path = os.path.join(DATA_DIR, 'callsites.c')
+        self.assertRaises(ElfError, SymbolIndex, path)
+        self.assertIsNone(get_symbol_index(path))
+
+    def test_cache(self):
+        """Test if the indexes are cached by file identity"""
+        index = get_symbol_index(self._path)
+        self.assertIsNotNone(index)
+        link = os.path.join(DATA_DIR, '.', 'callsites')
+        self.assertIs(get_symbol_index(link), index)
+
+    def test_symbolize(self):
+        """Test if the file offsets are converted to functions"""
+        index = get_symbol_index(self._path)
+        address = index._addresses[0]
+        offset = None
+        for start, vaddr, size in index._segments:
+            if vaddr <= address < vaddr + size:
+                offset = address - vaddr + start
+        name = index.lookup(address)[0]
+        self.assertEqual(symbolize(self._path, offset + 1),
+                         '{}+0x1 (callsites)'.format(name))
+        self.assertEqual(symbolize('[vdso]', 0x10), '[vdso]+0x10')
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sts=4 sw=4 sta et ai
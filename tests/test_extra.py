@@ -0,0 +1,481 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import io
+import csv
+import json
+import shutil
+import tempfile
+import unittest
+import ptraceminus
+import ptraceplus.tracer
+import ptraceplus.fdtable
+from ptraceplus.extra import SyscallTracer, ExecutionTracer
+from ptraceplus.extra import CriticalPathTracer, StartupTracer
+from ptraceplus.extra import CallSiteTracer, format_callsite_report
+from ptraceplus.extra import CallCountTracer, format_call_counts
+from ptraceplus.extra import LatencyTracer, format_latency_report
+from ptraceplus.extra import IOProfileTracer, format_syscall_summary
+from ptraceplus.extra import RedundancyTracer, format_redundancy_report
+from ptraceplus.extra import FutexTracer, decode_futex_op
+from ptraceplus.extra import TimelineTracer
+from ptraceplus.extra import FlameGraphTracer, write_folded_stacks
+from ptraceplus.extra import write_io_profile_csv, write_io_profile_json
+from ptraceplus.injection import DelayRule, Delay
+from ptraceplus.profiling import PhaseProfiler
+from common import gen_test_progs, DATA_DIR
+
+
+class TestSyscallTracer(unittest.TestCase):
+    """System call tracer tests"""
+
+    def setUp(self):
+        gen_test_progs()
+        self._args = [os.path.join(DATA_DIR, p) for p in ('father', 'child')]
+
+    def test_summary_only(self):
+        """Test if system calls are counted without being printed"""
+        stream = io.StringIO()
+        tracer = SyscallTracer(self._args, stream=stream)
+        tracer.summary_only = True
+        tracer.run()
+        stats = tracer.stats
+        results = dict(stats.results)
+        self.assertEqual(stream.getvalue(), '')
+        self.assertEqual(stats.n_traced, 2)
+        self.assertEqual(results['execve'], 2)
+        self.assertIn('execve', format_syscall_summary(stats))
+
+    def test_filter_programs(self):
+        """Test if only the system calls of the filtered programs stop"""
+        tracer = SyscallTracer(self._args, stream=io.StringIO())
+        tracer.filter_programs(['child'])
+        tracer.run()
+        unfiltered = SyscallTracer(self._args, stream=io.StringIO())
+        unfiltered.run()
+        self.assertEqual(tracer.stats.n_traced, 2)
+        self.assertLess(tracer.n_events, unfiltered.n_events)
+        self.assertEqual(tracer.n_detached, 0)
+
+    def test_no_children(self):
+        """Test if the children of the filtered programs are detached"""
+        tracer = SyscallTracer(self._args, stream=io.StringIO())
+        tracer.filter_programs(['father'])
+        tracer.follow_children = False
+        tracer.run()
+        self.assertEqual(tracer.n_detached, 1)
+        self.assertIn('wait4', dict(tracer.stats.results))
+
+    def test_profile(self):
+        """Test if the time spent by the tracer is profiled by phase"""
+        tracer = SyscallTracer(self._args, stream=io.StringIO())
+        tracer.profiler = PhaseProfiler()
+        tracer.run()
+        phases = dict((p, c) for p, c, t in tracer.profiler.results)
+        for phase in ('wait', 'decode', 'output', 'ptrace.syscall'):
+            self.assertIn(phase, phases)
+        self.assertIs(ptraceplus.tracer.ptrace, ptraceminus)
+        self.assertNotIn('_log', tracer.__dict__)
+
+
+class TestExecutionTracer(unittest.TestCase):
+    """Execution tracer tests"""
+
+    def setUp(self):
+        gen_test_progs()
+        self._args = [os.path.join(DATA_DIR, p) for p in ('father', 'child')]
+        self._dir = tempfile.mkdtemp()
+        self._script = os.path.join(self._dir, 'script.sh')
+        with open(self._script, 'w') as f:
+            f.write('#!/bin/sh\nexit 0\n')
+        os.chmod(self._script, 0o755)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _run_tracer(self, with_files):
+        tracer = ExecutionTracer(list(self._args), stream=io.StringIO())
+        tracer.with_args = True
+        tracer.with_files = with_files
+        tracer.with_history = True
+        tracer.run()
+        return tracer
+
+    def test_exec_events_only(self):
+        """Test if commands are reported without tracing system calls"""
+        tracer = self._run_tracer(False)
+        cmds = sorted(p.args for p in tracer.processes)
+        self.assertEqual(cmds, [[self._args[1]], self._args])
+        self.assertLess(tracer.n_events, self._run_tracer(True).n_events)
+
+    def test_script(self):
+        """Test if a script is reported instead of its interpreter"""
+        command = '{} x y; /bin/sh -c true'.format(self._script)
+        tracer = ExecutionTracer(['/bin/sh', '-c', command],
+                                 stream=io.StringIO())
+        tracer.with_args = True
+        tracer.with_history = True
+        tracer.run()
+        cmds = [p.args for p in tracer.processes]
+        self.assertIn([self._script, 'x', 'y'], cmds)
+        self.assertIn(['/bin/sh', '-c', 'true'], cmds)
+
+    def test_detach_unmatched(self):
+        """Test if processes running other programs are detached"""
+        tracer = ExecutionTracer(list(self._args), stream=io.StringIO())
+        tracer.with_history = True
+        tracer.filter_programs(['child'])
+        tracer.detach_unmatched = True
+        tracer.run()
+        self.assertEqual(tracer.n_detached, 1)
+        self.assertEqual(tracer.processes, [])
+
+    def test_filter_script(self):
+        """Test if a script is matched by its name"""
+        tracer = ExecutionTracer([self._script], stream=io.StringIO())
+        tracer.with_history = True
+        tracer.filter_programs(['script.sh'])
+        tracer.detach_unmatched = True
+        tracer.run()
+        self.assertEqual(tracer.n_detached, 0)
+        self.assertEqual([p.args for p in tracer.processes], [[self._script]])
+
+        stream = io.StringIO()
+        tracer = SyscallTracer([self._script], stream=stream)
+        tracer.filter_programs(['script.sh'])
+        tracer.detach_unmatched = True
+        tracer.run()
+        self.assertEqual(tracer.n_detached, 0)
+        self.assertIn('script.sh', stream.getvalue())
+
+
+class TestIOProfileTracer(unittest.TestCase):
+    """I/O profiler tests"""
+
+    def setUp(self):
+        gen_test_progs()
+        self._args = [os.path.join(DATA_DIR, p) for p in ('father', 'child')]
+
+    def test_io_by_file(self):
+        """Test if the I/O volume is aggregated by file"""
+        tracer = IOProfileTracer(self._args)
+        tracer.run()
+        stats = dict((s.target, s) for s in tracer.stats)
+        output = stats[os.devnull]
+        self.assertGreaterEqual(output.bytes_written,
+                                len("I am the child\n"))
+        self.assertEqual(output.n_reads, 0)
+        self.assertEqual(sum(output.sizes), output.n_writes)
+        self.assertEqual(tracer.stats[0].n_bytes,
+                         max(s.n_bytes for s in stats.values()))
+
+        stream = io.StringIO()
+        write_io_profile_csv(tracer.stats, stream)
+        rows = list(csv.DictReader(io.StringIO(stream.getvalue())))
+        self.assertEqual(len(rows), len(stats))
+        stream = io.StringIO()
+        write_io_profile_json(tracer.stats, stream)
+        self.assertEqual(json.loads(stream.getvalue())[0]['target'],
+                         tracer.stats[0].target)
+
+    def test_profile(self):
+        """Test if the lookups of the descriptor table are profiled"""
+        tracer = IOProfileTracer(self._args)
+        tracer.profiler = PhaseProfiler()
+        tracer.run()
+        phases = dict((p, c) for p, c, t in tracer.profiler.results)
+        self.assertIn('ptrace.getstr', phases)
+        self.assertIs(ptraceplus.fdtable.ptrace, ptraceminus)
+
+
+class TestRedundancyTracer(unittest.TestCase):
+    """Redundant system call detector tests"""
+
+    def setUp(self):
+        gen_test_progs()
+
+    def test_failing_lookups(self):
+        """Test if the repeated failing lookups are reported"""
+        tracer = RedundancyTracer([os.path.join(DATA_DIR, 'bench_paths'),
+                                   '104'])
+        tracer.run()
+        stats = tracer.stats
+        name, path, error, count, time = stats.failures[0]
+        self.assertEqual(error, 'ENOENT')
+        self.assertEqual(count, 4)
+        self.assertTrue(path.startswith('/some-directory'))
+        self.assertIn((name, path, count, time), stats.repeated)
+        self.assertGreaterEqual(stats.n_failures, 104)
+        self.assertGreater(stats.wasted_time, 0.0)
+        self.assertIn('ENOENT', format_redundancy_report(stats))
+
+
+class TestFutexTracer(unittest.TestCase):
+    """Lock contention tracer tests"""
+
+    def setUp(self):
+        gen_test_progs()
+
+    def test_decode_op(self):
+        """Test if the futex operations are decoded"""
+        self.assertEqual(decode_futex_op(128), 'FUTEX_WAIT_PRIVATE')
+        self.assertEqual(decode_futex_op(9 | 256),
+                         'FUTEX_WAIT_BITSET|FUTEX_CLOCK_REALTIME')
+
+    def test_contention(self):
+        """Test if the waits on a contended mutex are measured"""
+        tracer = FutexTracer([os.path.join(DATA_DIR, 'locks'), '4', '10'])
+        tracer.run()
+        self.assertEqual(tracer.n_procs, 5)
+        stats = tracer.stats
+        pid, uaddr, time, waits, wakes, woken, waiters = stats.addresses[0]
+        self.assertGreater(waits, 0)
+        self.assertGreater(time, 0.0)
+        self.assertGreater(waiters, 1)
+        self.assertEqual(sum(t[2] for t in stats.threads),
+                         sum(a[3] for a in stats.addresses))
+
+
+class TestTimelineTracer(unittest.TestCase):
+    """Timeline tracer tests"""
+
+    def setUp(self):
+        gen_test_progs()
+        self._args = [os.path.join(DATA_DIR, p) for p in ('father', 'child')]
+
+    def test_trace_events(self):
+        """Test if the processes and system calls are written as events"""
+        stream = io.StringIO()
+        tracer = TimelineTracer(self._args, stream=stream)
+        tracer.run()
+        events = json.loads(stream.getvalue())
+        pids = set(e['pid'] for e in events)
+        self.assertEqual(len(pids), 2)
+        phases = [e['ph'] for e in events]
+        self.assertEqual(phases.count('B'), phases.count('E'))
+        names = [e['name'] for e in events if e['ph'] == 'i']
+        self.assertEqual(names.count('exec'), 2)
+        self.assertEqual(names.count('fork'), 1)
+        self.assertEqual(names.count('exit'), 2)
+        spans = [e['name'] for e in events if e['ph'] == 'B']
+        self.assertIn('child', spans)
+        slices = [e for e in events if e['ph'] == 'X']
+        self.assertIn('wait4', [e['name'] for e in slices])
+        self.assertTrue(all(e['dur'] >= 0 for e in slices))
+
+
+class TestFlameGraphTracer(unittest.TestCase):
+    """Flame graph tracer tests"""
+
+    def setUp(self):
+        gen_test_progs()
+        self._args = [os.path.join(DATA_DIR, p) for p in ('father', 'child')]
+
+    def test_folded_stacks(self):
+        """Test if the system calls are folded by process lineage"""
+        tracer = FlameGraphTracer(self._args)
+        tracer.run()
+        frames = set(s[0] for s in tracer.stacks)
+        self.assertIn(('father',), frames)
+        self.assertIn(('father', 'child'), frames)
+        stream = io.StringIO()
+        write_folded_stacks(tracer.stacks, stream)
+        lines = stream.getvalue().splitlines()
+        self.assertIn('father;wait4 1', lines)
+        self.assertTrue(any(line.startswith('father;child;')
+                            for line in lines))
+        count = sum(int(line.rsplit(' ', 1)[1]) for line in lines)
+        self.assertEqual(count, sum(s[2] for s in tracer.stacks))
+
+
+class TestCriticalPathTracer(unittest.TestCase):
+    """Critical path tracer tests"""
+
+    def setUp(self):
+        gen_test_progs()
+        self._args = [os.path.join(DATA_DIR, p) for p in ('father', 'child')]
+
+    def test_analysis(self):
+        """Test if the timeline of the processes is analyzed"""
+        tracer = CriticalPathTracer(self._args)
+        tracer.run()
+        self.assertEqual(len(tracer.processes), 2)
+        for info in tracer.processes:
+            self.assertLessEqual(info.start_time, info.exec_time)
+            self.assertLessEqual(info.exec_time, info.exit_time)
+        analysis = tracer.analysis
+        names = [n.name for n, s, e in analysis.critical_path]
+        self.assertEqual(names, ['father', 'child', 'father'])
+        self.assertAlmostEqual(sum(n.exclusive for n in analysis.processes),
+                               analysis.wall_time)
+
+
+class TestStartupTracer(unittest.TestCase):
+    """Startup tracer tests"""
+
+    def setUp(self):
+        gen_test_progs()
+        self._args = [os.path.join(DATA_DIR, p) for p in ('father', 'child')]
+
+    def test_profile(self):
+        """Test if the loading of the shared objects is profiled"""
+        tracer = StartupTracer(self._args)
+        tracer.run()
+        profile = tracer.stats
+        self.assertIsNone(profile.marker)
+        self.assertEqual(tracer.n_detached, 0)
+        objects = dict((s.name, s) for s in profile.objects)
+        self.assertIn('libc.so.6', objects)
+        self.assertGreater(objects['libc.so.6'].bytes_mapped, 0)
+        self.assertGreater(objects['libc.so.6'].bytes_read, 0)
+        directories = [s.name for s in profile.directories]
+        self.assertIn(DATA_DIR, directories)
+
+    def test_marker(self):
+        """Test if the tracing stops on the marker"""
+        tracer = StartupTracer(self._args)
+        tracer.markers = ('wait4',)
+        tracer.run()
+        profile = tracer.stats
+        self.assertEqual(profile.marker, 'wait4')
+        self.assertGreater(tracer.n_detached, 0)
+        self.assertLess(profile.duration, tracer.elapsed)
+
+
+class TestCallSiteTracer(unittest.TestCase):
+    """Call site tracer tests"""
+
+    def setUp(self):
+        gen_test_progs()
+        self._args = [os.path.join(DATA_DIR, 'callsites')]
+
+    def test_callsites(self):
+        """Test if the system calls are attributed to their callers"""
+        tracer = CallSiteTracer(self._args)
+        tracer.depth = 2
+        tracer.filter_syscalls(['write'])
+        tracer.run()
+        sites = tracer.stats
+        self.assertEqual([(s.syscall, s.count) for s in sites],
+                         [('write', 100), ('write', 10)])
+        callers = [[f.split('+')[0] for f in s.frames[1:]] for s in sites]
+        self.assertEqual(callers, [['log_line', 'main'],
+                                   ['flush_all', 'main']])
+        report = format_callsite_report(sites)
+        self.assertIn('<- log_line+', report)
+
+    def test_pc_only(self):
+        """Test if only the instruction pointer is captured by default"""
+        tracer = CallSiteTracer(self._args)
+        tracer.top = 1
+        tracer.run()
+        sites = tracer.stats
+        self.assertEqual(len(sites), 1)
+        self.assertEqual(sites[0].count, 110)
+        self.assertEqual(len(sites[0].frames), 1)
+        self.assertIn('(libc.so.6)', sites[0].frames[0])
+
+
+class TestCallCountTracer(unittest.TestCase):
+    """Call count tracer tests"""
+
+    def setUp(self):
+        gen_test_progs()
+        self._path = os.path.join(DATA_DIR, 'callsites')
+
+    def test_count(self):
+        """Test if the calls of a single process are counted"""
+        tracer = CallCountTracer([self._path])
+        tracer.functions = ['log_line', 'flush_all', 'unknown']
+        tracer.run()
+        self.assertEqual(tracer.stats, [(('callsites', 'log_line'), 100),
+                                        (('callsites', 'flush_all'), 10)])
+        self.assertIn('log_line', format_call_counts(tracer.stats))
+
+    def test_count_children(self):
+        """Test if the breakpoints are kept by the children"""
+        tracer = CallCountTracer([self._path, 'fork'])
+        tracer.functions = ['log_line', 'main']
+        tracer.run()
+        self.assertEqual(tracer.stats, [(('callsites', 'log_line'), 200),
+                                        (('callsites', 'main'), 1)])
+
+    def test_count_execs(self):
+        """Test if the calls of successive programs are all counted"""
+        script = 'for i in 1 2 3 4 5 6 7 8 9 10; do {}; done'
+        tracer = CallCountTracer(['sh', '-c', script.format(self._path)])
+        tracer.functions = ['main']
+        tracer.run()
+        self.assertEqual(tracer.stats, [(('callsites', 'main'), 10)])
+
+
+class TestLatencyTracer(unittest.TestCase):
+    """Latency injection tracer tests"""
+
+    def setUp(self):
+        gen_test_progs()
+        self._path = os.path.join(DATA_DIR, 'callsites')
+
+    def test_delay(self):
+        """Test if the selected system calls are delayed"""
+        tracer = LatencyTracer([self._path])
+        tracer.add_rule(DelayRule(Delay(0.002), ['write'], ['/dev/']))
+        tracer.run()
+        stats = tracer.stats
+        self.assertEqual([(s.name, s.n_delayed) for s in stats],
+                         [('write', 110)])
+        self.assertAlmostEqual(stats[0].total, 0.22)
+        self.assertGreaterEqual(tracer.elapsed, 0.22)
+        self.assertIn('write', format_latency_report(stats))
+
+    def test_not_selected(self):
+        """Test if the calls on other kinds of descriptors are not
+        delayed
+        """
+        tracer = LatencyTracer([self._path])
+        tracer.add_rule(DelayRule(Delay(0.1), ['write'],
+                                  fd_kinds=['socket']))
+        tracer.run()
+        self.assertEqual(tracer.stats, [])
+        self.assertLess(tracer.elapsed, 1.0)
+
+    def test_at_entry(self):
+        """Test if the lookups are delayed on entry"""
+        tracer = LatencyTracer([self._path])
+        tracer.add_rule(DelayRule(Delay(0.05), ['open', 'openat'],
+                                  ['/dev/null'], at_entry=True))
+        tracer.run()
+        self.assertEqual([s.n_delayed for s in tracer.stats], [1])
+        self.assertGreaterEqual(tracer.elapsed, 0.05)
+
+    def test_concurrent(self):
+        """Test if the other processes run while a process is held"""
+        tracer = LatencyTracer([self._path, 'fork'])
+        tracer.add_rule(DelayRule(Delay(0.005), ['write'], ['/dev/']))
+        tracer.run()
+        self.assertEqual(tracer.stats[0].n_delayed, 220)
+        # Held one after the other, the processes would take 1.1 seconds
+        self.assertLess(tracer.elapsed, 0.95)
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sts=4 sw=4 sta et ai
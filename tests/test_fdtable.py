@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import socket
+import struct
+import unittest
+from ptraceplus.tracerplus import TracerPlus
+from ptraceplus.fdtable import (FdTable, FdTracker, format_sockaddr,
+                                FD_KIND_FILE, FD_KIND_PIPE, FD_KIND_SOCKET)
+from common import gen_test_progs, DATA_DIR
+
+
+class FdRecorder(TracerPlus):
+    def __init__(self, arguments):
+        TracerPlus.__init__(self, arguments)
+        self.fd_tracker = FdTracker()
+        self.tables = []
+        self.shared = []
+
+    def _on_exiting(self, event):
+        table = self._tracer[event.pid].fds
+        self.shared.append(table)
+        self.tables.append(dict((fd, (table[fd].kind, table[fd].target,
+                                      table[fd].cloexec)) for fd in table))
+
+
+class TestFdTable(unittest.TestCase):
+    """File descriptor table tests"""
+
+    def test_dup_and_exec(self):
+        """Test if duplicated descriptors are closed on exec"""
+        table = FdTable()
+        table.add(3, FD_KIND_FILE, '/etc/hosts')
+        table.dup(3, 4, cloexec=True)
+        self.assertEqual(table.lookup(4), '/etc/hosts')
+        table.close_range(3, 3, cloexec=True)
+        child = table.copy()
+        table.close(3)
+        self.assertEqual(list(table), [4])
+        self.assertEqual(list(child), [3, 4])
+        child.execute()
+        self.assertEqual(len(child), 0)
+        self.assertIsNone(child.lookup(3))
+
+    def test_resync(self):
+        """Test if a table can be read from /proc"""
+        table = FdTable()
+        table.stale = True
+        rfd, wfd = os.pipe()
+        try:
+            self.assertTrue(table.resync(os.getpid()))
+            self.assertFalse(table.stale)
+            self.assertEqual(table[rfd].kind, FD_KIND_PIPE)
+            self.assertTrue(table[wfd].cloexec)
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+
+    def test_format_sockaddr(self):
+        """Test if socket addresses are formatted"""
+        data = struct.pack('=H', socket.AF_INET) + struct.pack('!H', 80) + \
+            socket.inet_aton('127.0.0.1') + b'\0' * 8
+        self.assertEqual(format_sockaddr(data), 'inet:127.0.0.1:80')
+        data = struct.pack('=H', socket.AF_UNIX) + b'/run/sock\0'
+        self.assertEqual(format_sockaddr(data), 'unix:/run/sock')
+
+
+class TestFdTracker(unittest.TestCase):
+    """File descriptor tracking tests"""
+
+    def setUp(self):
+        gen_test_progs()
+
+    def test_track(self):
+        """Test if the tables are updated from the system calls"""
+        tracer = FdRecorder([os.path.join(DATA_DIR, 'fds')])
+        tracer.run()
+        self.assertEqual(len(tracer.tables), 2)
+        child, parent = tracer.tables
+        self.assertEqual(child[10], (FD_KIND_FILE, '/dev/null', False))
+        self.assertEqual(child[20], (FD_KIND_FILE, '/dev/null', True))
+        self.assertEqual(child[4][0], FD_KIND_PIPE)
+        # The socket reuses the descriptor of the closed file
+        self.assertEqual(child[3], (FD_KIND_SOCKET, 'unix:@ptraceplus-fds',
+                                    False))
+        self.assertEqual(child[30][1], 'unix:@ptraceplus-fds')
+        # Only the descriptors without O_CLOEXEC survive the exec
+        self.assertEqual(sorted(parent), [0, 1, 2, 3, 10])
+
+    def test_threads(self):
+        """Test if the threads share the table of their process"""
+        tracer = FdRecorder([os.path.join(DATA_DIR, 'locks'), '3', '1'])
+        tracer.follow_threads = True
+        tracer.run()
+        self.assertEqual(len(tracer.tables), 4)
+        self.assertTrue(all(t is tracer.shared[0] for t in tracer.shared))
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import random
+import unittest
+from ptraceplus.injection import (Delay, UniformDelay, ExponentialDelay,
+                                  DelayRule, InjectionError, create_delay,
+                                  parse_duration)
+
+
+class TestDelays(unittest.TestCase):
+    """Delay distributions tests"""
+
+    def test_parse(self):
+        """Test if the durations and the distributions are parsed"""
+        self.assertAlmostEqual(parse_duration('1.5'), 1.5)
+        self.assertAlmostEqual(parse_duration('20ms'), 0.02)
+        self.assertAlmostEqual(parse_duration('250us'), 0.00025)
+        self.assertEqual(type(create_delay('10ms')), Delay)
+        self.assertEqual(type(create_delay('1ms-5ms')), UniformDelay)
+        self.assertEqual(type(create_delay('exp:2ms')), ExponentialDelay)
+        for spec in ('', 'ms', '-1ms', '5ms-1ms', 'exp:', '10m'):
+            self.assertRaises(InjectionError, create_delay, spec)
+
+    def test_draw(self):
+        """Test if the delays follow their distribution"""
+        rng = random.Random(1)
+        delay = create_delay('1ms-5ms')
+        draws = [delay.draw(rng) for i in range(1000)]
+        self.assertTrue(all(0.001 <= d <= 0.005 for d in draws))
+        delay = create_delay('exp:10ms')
+        draws = [delay.draw(rng) for i in range(10000)]
+        self.assertAlmostEqual(sum(draws) / len(draws), 0.01, places=3)
+
+    def test_rule(self):
+        """Test if the calls are selected by path and descriptor kind"""
+        rule = DelayRule(Delay(0.001), paths=['/var/lib/'],
+                         fd_kinds=['file'])
+        self.assertTrue(rule.needs_target)
+        self.assertTrue(rule.match_target('/var/lib/db', 'file'))
+        self.assertFalse(rule.match_target('/var/log/db', 'file'))
+        self.assertFalse(rule.match_target(None, 'socket'))
+        self.assertFalse(DelayRule(Delay(0.001)).needs_target)
+        self.assertRaises(InjectionError, DelayRule, Delay(0.001),
+                          fd_kinds=['disk'])
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sts=4 sw=4 sta et ai
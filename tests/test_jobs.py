@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import io
+import unittest
+from ptraceplus.jobs import JobRunner, SyscallTracerFactory
+from ptraceplus.jobs import ExecutionTracerFactory
+from common import gen_test_progs, DATA_DIR
+
+
+class TestJobRunner(unittest.TestCase):
+    """Parallel tracing tests"""
+
+    def setUp(self):
+        gen_test_progs()
+        args = [os.path.join(DATA_DIR, p) for p in ('father', 'child')]
+        self._commands = [args, args, args]
+
+    def test_merge_stats(self):
+        """Test if statistics of the jobs are merged"""
+        factory = SyscallTracerFactory(summary_only=True)
+        report = JobRunner(factory, jobs=2).run(self._commands)
+        results = dict(report.stats.results)
+        self.assertEqual(len(report.results), 3)
+        self.assertEqual(report.stats.n_traced, 6)
+        self.assertEqual(results['execve'], 6)
+
+    def test_merge_processes(self):
+        """Test if processes and outputs of the jobs are merged"""
+        stream = io.StringIO()
+        factory = ExecutionTracerFactory(with_args=True)
+        report = JobRunner(factory, jobs=2).run(self._commands, stream)
+        self.assertEqual(len(report.processes), 6)
+        self.assertEqual(stream.getvalue().count(' - pid:'), 6)
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sts=4 sw=4 sta et ai
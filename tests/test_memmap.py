@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import unittest
+from ptraceplus.tracerplus import TracerPlus
+from ptraceplus.memmap import (MemoryMap, MemoryTracker, PAGE_SIZE,
+                               PROT_READ, PROT_WRITE, MAP_KIND_ANON,
+                               MAP_KIND_FILE, MAP_KIND_HEAP, MAP_KIND_STACK)
+from common import gen_test_progs, DATA_DIR
+
+
+def merge_pages(maps):
+    # The mapped ranges, with the adjacent mappings merged
+    ranges = []
+    for m in maps:
+        if m.kind == MAP_KIND_STACK:
+            continue
+        if ranges and ranges[-1][1] == m.start:
+            ranges[-1][1] = m.end
+        else:
+            ranges.append([m.start, m.end])
+    return ranges
+
+
+class MapsRecorder(TracerPlus):
+    def __init__(self, arguments):
+        TracerPlus.__init__(self, arguments)
+        self.mem_tracker = MemoryTracker()
+        self.results = []
+
+    def _on_exiting(self, event):
+        maps = self._tracer[event.pid].maps
+        current = MemoryMap()
+        current.resync(event.pid)
+        self.results.append((merge_pages(maps), merge_pages(current),
+                             maps.growth))
+
+
+class TestMemoryMap(unittest.TestCase):
+    """Memory map tests"""
+
+    def setUp(self):
+        self._maps = MemoryMap()
+        self._base = 0x10000 * PAGE_SIZE
+        self._maps.map(self._base, 4 * PAGE_SIZE, PROT_READ | PROT_WRITE,
+                       MAP_KIND_ANON)
+
+    def test_lookup(self):
+        """Test if the mapping of an address is found"""
+        maps = self._maps
+        maps.map(self._base + 8 * PAGE_SIZE, 100, PROT_READ, MAP_KIND_FILE,
+                 '/etc/hosts')
+        self.assertIsNone(maps.lookup(self._base - 1))
+        self.assertEqual(maps.classify(self._base), MAP_KIND_ANON)
+        self.assertIsNone(maps.lookup(self._base + 4 * PAGE_SIZE))
+        mapping = maps.lookup(self._base + 9 * PAGE_SIZE - 1)
+        self.assertEqual(mapping.name, '/etc/hosts')
+        self.assertEqual(mapping.size, PAGE_SIZE)
+        self.assertTrue(maps.is_valid(self._base, 4 * PAGE_SIZE))
+        self.assertFalse(maps.is_valid(self._base, 5 * PAGE_SIZE))
+        self.assertFalse(maps.is_valid(self._base + 8 * PAGE_SIZE, 8,
+                                       PROT_WRITE))
+
+    def test_unmap_and_protect(self):
+        """Test if the mappings are split"""
+        maps = self._maps
+        maps.unmap(self._base + PAGE_SIZE, PAGE_SIZE)
+        maps.protect(self._base + 3 * PAGE_SIZE, PAGE_SIZE, PROT_READ)
+        self.assertEqual(len(maps), 3)
+        self.assertEqual(maps.size, 3 * PAGE_SIZE)
+        self.assertIsNone(maps.lookup(self._base + PAGE_SIZE))
+        self.assertTrue(maps.is_valid(self._base + 2 * PAGE_SIZE,
+                                      2 * PAGE_SIZE))
+        self.assertFalse(maps.is_valid(self._base + 2 * PAGE_SIZE,
+                                       2 * PAGE_SIZE, PROT_WRITE))
+        self.assertEqual([s for t, s in maps.growth],
+                         [4 * PAGE_SIZE, 3 * PAGE_SIZE])
+
+    def test_remap_and_brk(self):
+        """Test if the mappings are moved and the heap is resized"""
+        maps = self._maps
+        new = self._base + 16 * PAGE_SIZE
+        maps.remap(self._base, 4 * PAGE_SIZE, new, 6 * PAGE_SIZE)
+        self.assertIsNone(maps.lookup(self._base))
+        self.assertEqual(maps.lookup(new).size, 6 * PAGE_SIZE)
+        brk = self._base + 64 * PAGE_SIZE
+        maps.set_brk(brk)
+        maps.set_brk(brk + 10 * PAGE_SIZE + 1)
+        self.assertEqual(maps.lookup(brk).size, 11 * PAGE_SIZE)
+        maps.set_brk(brk + PAGE_SIZE)
+        self.assertEqual(maps.classify(brk), MAP_KIND_HEAP)
+        self.assertIsNone(maps.lookup(brk + PAGE_SIZE))
+        child = maps.copy()
+        maps.execute()
+        self.assertEqual(len(maps), 0)
+        self.assertEqual(child.size, 7 * PAGE_SIZE)
+
+    def test_offsets(self):
+        """Test if the file offsets follow the splits of the mappings"""
+        maps = self._maps
+        start = self._base + 8 * PAGE_SIZE
+        maps.map(start, 4 * PAGE_SIZE, PROT_READ, MAP_KIND_FILE,
+                 '/etc/hosts', 2 * PAGE_SIZE)
+        maps.unmap(start + PAGE_SIZE, PAGE_SIZE)
+        self.assertEqual(maps.lookup(start).offset, 2 * PAGE_SIZE)
+        mapping = maps.lookup(start + 2 * PAGE_SIZE)
+        self.assertEqual(mapping.start, start + 2 * PAGE_SIZE)
+        self.assertEqual(mapping.offset, 4 * PAGE_SIZE)
+        self.assertEqual(maps.lookup(self._base).offset, 0)
+
+    def test_resync(self):
+        """Test if the mappings can be read from /proc"""
+        maps = MemoryMap()
+        maps.stale = True
+        self.assertTrue(maps.resync(os.getpid()))
+        self.assertFalse(maps.stale)
+        kinds = set(m.kind for m in maps)
+        self.assertIn(MAP_KIND_FILE, kinds)
+        self.assertIn(MAP_KIND_STACK, kinds)
+        self.assertIsNone(maps.lookup(0))
+        self.assertEqual(maps.size, sum(m.size for m in maps))
+
+
+class TestMemoryTracker(unittest.TestCase):
+    """Memory map tracking tests"""
+
+    def setUp(self):
+        gen_test_progs()
+
+    def test_track(self):
+        """Test if the maps are updated from the system calls"""
+        tracer = MapsRecorder([os.path.join(DATA_DIR, 'maps')])
+        tracer.run()
+        self.assertEqual(len(tracer.results), 1)
+        tracked, current, growth = tracer.results[0]
+        self.assertEqual(tracked, current)
+        self.assertGreater(len(growth), 5)
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sts=4 sw=4 sta et ai
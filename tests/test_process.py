@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import unittest
+from array import array
+import ptraceminus as ptrace
+from ptraceplus.tracer import Tracer
+from ptraceplus.memmap import MemoryMap
+from ptraceplus.elf import SymbolIndex
+from common import gen_test_progs, DATA_DIR
+
+
+def get_function(pid, path, name):
+    # The address and size of a function in the memory of the process
+    maps = MemoryMap()
+    maps.resync(pid)
+    index = SymbolIndex(path)
+    try:
+        address = index.find(name)
+        size = index.get_size(address)
+        offset = index.to_offset(address)
+    finally:
+        index.close()
+    return maps.find_file_offset(path, offset), size
+
+
+class TestSingleStep(unittest.TestCase):
+    """Single-stepping tests"""
+
+    def setUp(self):
+        gen_test_progs()
+        self._path = os.path.join(DATA_DIR, 'steps')
+        self._tracer = Tracer()
+        self._tracer.exec_enabled = True
+        self._proc = self._tracer.spawn_process([self._path], resume=False)
+        # Stop on the exec event, with the program loaded
+        self._proc.cont()
+        os.waitpid(self._proc.pid, 0)
+
+    def test_singlestep_n(self):
+        """Test if the addresses of the instructions are recorded"""
+        regs = ptrace.getregs(self._proc.pid)
+        try:
+            pc = regs['rip']
+        except KeyError:
+            pc = regs['eip']
+        buf = array('L', [0] * 16)
+        reason, count, status = self._proc.step(100, buf)
+        self.assertEqual((reason, count), (ptrace.STEP_FULL, 16))
+        self.assertEqual(buf[0], pc)
+        self.assertNotIn(0, buf)
+        reason, count, status = self._proc.step(10)
+        self.assertEqual((reason, count), (ptrace.STEP_COUNT, 10))
+
+    def test_profile_instructions(self):
+        """Test if the instructions of a loop are counted"""
+        proc = self._proc
+        main, size = get_function(proc.pid, self._path, 'main')
+        spin, size = get_function(proc.pid, self._path, 'spin')
+        profile = proc.profile_instructions([main])
+        self.assertEqual(profile.reason, ptrace.STEP_ADDRESS)
+        self.assertGreater(profile.count, 1000)
+        self.assertGreater(profile.n_syscalls, 0)
+        self.assertEqual(proc.count_instructions(limit=3), 3)
+
+        profile = proc.profile_instructions(region=(spin, spin + size),
+                                            buffer_size=256)
+        self.assertEqual(profile.reason, ptrace.STEP_SIGNAL)
+        self.assertTrue(os.WIFEXITED(profile.status) or
+                        profile.status >> 16 == ptrace.EVENT_EXIT)
+        self.assertGreater(profile.n_syscalls, 0)
+        address, count = profile.hottest(1)[0]
+        self.assertTrue(spin <= address < spin + size)
+        self.assertIn(count, (1000, 1001))
+        self.assertGreater(sum(profile.histogram.values()), 5000)
+
+    def tearDown(self):
+        self._tracer.quit()
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import io
+import unittest
+from ptraceplus.extra import SyscallTracer, format_syscall_summary
+from ptraceplus.sampling import (EveryNthSampler, WindowSampler,
+                                 BudgetSampler, create_sampler, SamplerError)
+from common import gen_test_progs, DATA_DIR
+
+
+class TestSamplers(unittest.TestCase):
+    """Sampling policies tests"""
+
+    def test_every_nth(self):
+        """Test if one system call out of N is sampled for each process"""
+        sampler = EveryNthSampler(3)
+        sampler.start(0.0)
+        samples = [sampler.sample(pid) for pid in (1, 2) * 6]
+        self.assertEqual(samples.count(True), 4)
+        sampler.stop(1.0)
+        self.assertAlmostEqual(sampler.ratio, 1.0 / 3)
+
+    def test_windows(self):
+        """Test if tracing windows are opened and closed on time"""
+        sampler = WindowSampler(1.0, 3.0)
+        sampler.start(0.0)
+        self.assertTrue(sampler.update(0.5, 0.0))
+        self.assertFalse(sampler.update(1.0, 0.0))
+        self.assertEqual(sampler.deadline, 4.0)
+        self.assertTrue(sampler.update(4.0, 0.0))
+        self.assertFalse(sampler.update(5.0, 0.0))
+        sampler.stop(8.0)
+        self.assertAlmostEqual(sampler.ratio, 0.25)
+
+    def test_budget(self):
+        """Test if tracing is paused to stay within the overhead budget"""
+        sampler = BudgetSampler(0.1, 1.0)
+        sampler.start(0.0)
+        self.assertFalse(sampler.update(1.0, 0.5))
+        self.assertAlmostEqual(sampler.deadline, 5.0)
+        self.assertTrue(sampler.update(5.0, 0.5))
+        self.assertTrue(sampler.update(6.0, 0.55))
+
+    def test_create(self):
+        """Test if sampling policies are created from their description"""
+        self.assertIsInstance(create_sampler('10'), EveryNthSampler)
+        self.assertIsInstance(create_sampler('0.1/0.9'), WindowSampler)
+        self.assertIsInstance(create_sampler('5%'), BudgetSampler)
+        for spec in ('0', 'foo', '1/-1', '0%'):
+            self.assertRaises(SamplerError, create_sampler, spec)
+
+
+class TestSampledTracer(unittest.TestCase):
+    """Sampled system call tracer tests"""
+
+    def setUp(self):
+        gen_test_progs()
+        self._args = [os.path.join(DATA_DIR, p) for p in ('father', 'child')]
+
+    def test_every_nth(self):
+        """Test if the statistics of a sampled trace are estimated"""
+        stream = io.StringIO()
+        tracer = SyscallTracer(self._args, stream=stream)
+        tracer.sampler = EveryNthSampler(2)
+        tracer.run()
+        stats = tracer.stats
+        self.assertTrue(stats.estimated)
+        self.assertEqual(stats.n_traced, 2)
+        self.assertGreater(len(stats.results), 0)
+        self.assertIn('estimated', format_syscall_summary(stats))
+
+    def test_windows(self):
+        """Test if processes run untraced outside of the tracing windows"""
+        tracer = SyscallTracer(self._args, stream=io.StringIO())
+        tracer.summary_only = True
+        tracer.sampler = WindowSampler(0.001, 0.001)
+        tracer.run()
+        self.assertEqual(tracer.stats.n_traced, 2)
+        self.assertLessEqual(tracer.sampling_ratio, 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import unittest
+from ptraceplus.sketch import CountMinSketch, HeavyHitters, SketchError
+
+
+class TestCountMinSketch(unittest.TestCase):
+    """Count-min sketch tests"""
+
+    def test_never_underestimate(self):
+        """Test if the counts are never under-estimated"""
+        sketch = CountMinSketch(64, 4)
+        for i in range(1000):
+            sketch.add(('stat', i % 100))
+        for i in range(100):
+            self.assertGreaterEqual(sketch.estimate(('stat', i)), 10)
+        self.assertEqual(sketch.total, 1000)
+
+    def test_invalid(self):
+        """Test if invalid sizes are rejected"""
+        self.assertRaises(SketchError, CountMinSketch, 0, 4)
+        self.assertRaises(SketchError, HeavyHitters, 0)
+
+
+class TestHeavyHitters(unittest.TestCase):
+    """Heavy hitters tests"""
+
+    def test_bounded(self):
+        """Test if the frequent keys are kept in bounded memory"""
+        hitters = HeavyHitters(capacity=8)
+        for i in range(5000):
+            hitters.add('/etc/hot', 0.001)
+            hitters.add('/tmp/cold-{}'.format(i))
+        self.assertEqual(len(hitters), 8)
+        top = hitters.most_common(1)[0]
+        self.assertEqual(top.key, '/etc/hot')
+        self.assertEqual(top.count, 5000)
+        self.assertAlmostEqual(top.time, 5.0)
+        self.assertEqual(hitters.total, 10000)
+
+# vim: ts=4 sts=4 sw=4 sta et ai
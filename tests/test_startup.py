@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import sys
+import subprocess
+import unittest
+
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LAZY_MODULES = (
+    'logging',
+    'multiprocessing',
+    'socket',
+    'ptraceplus.extra',
+    'ptraceplus.syscalls.linux.prototypes',
+    'ptraceplus.syscalls.linux.x86.names',
+    'ptraceplus.syscalls.linux.x86_64.names',
+)
+
+# Modules only loaded by the tracers using them
+_TRACER_MODULES = (
+    'socket',
+    'ptraceplus.analysis',
+    'ptraceplus.breakpoints',
+    'ptraceplus.elf',
+    'ptraceplus.fdtable',
+    'ptraceplus.memmap',
+    'ptraceplus.sketch',
+    'ptraceplus.timeline',
+)
+
+
+def run_python(code):
+    env = dict(os.environ)
+    path = [_ROOT_DIR] + sys.path
+    env['PYTHONPATH'] = os.pathsep.join(p for p in path if p)
+    env.pop('PTRACEPLUS_LOG', None)
+    args = [sys.executable, '-X', 'importtime', '-c', code]
+    proc = subprocess.run(args, env=env, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+    return proc.stdout, proc.stderr
+
+
+def get_import_time(stderr, module):
+    for line in stderr.splitlines():
+        fields = [f.strip() for f in line.split('|')]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1])
+    return None
+
+
+class TestStartup(unittest.TestCase):
+    """Import time benchmark"""
+
+    def test_lazy_imports(self):
+        """Test if the CLI does not load tables it does not need"""
+        code = "import sys, ptraceplus.cli; print('\\n'.join(sys.modules))"
+        stdout, stderr = run_python(code)
+        modules = stdout.split()
+        for module in _LAZY_MODULES:
+            self.assertNotIn(module, modules)
+
+    def test_lazy_tracer_imports(self):
+        """Test if the tracers do not load the modules of the others"""
+        code = "import sys, ptraceplus.extra; print('\\n'.join(sys.modules))"
+        stdout, stderr = run_python(code)
+        modules = stdout.split()
+        for module in _TRACER_MODULES:
+            self.assertNotIn(module, modules)
+
+    def test_import_time(self):
+        """Test if the CLI is imported faster than the tracers it defers"""
+        lazy, eager = [], []
+        for i in range(5):
+            stdout, stderr = run_python('import ptraceplus.cli')
+            for module in _LAZY_MODULES:
+                self.assertIsNone(get_import_time(stderr, module))
+            lazy.append(get_import_time(stderr, 'ptraceplus.cli'))
+            stdout, stderr = run_python('import ptraceplus.cli, '
+                                        'ptraceplus.extra')
+            eager.append(get_import_time(stderr, 'ptraceplus.cli') +
+                         get_import_time(stderr, 'ptraceplus.extra'))
+        sys.stderr.write("\nptraceplus.cli import time: {} us\n"
+                         .format(min(lazy)))
+        self.assertLess(min(lazy), min(eager))
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+#
+# python-ptraceplus - Ptrace bindings + extra stuff
+#
+# Copyright (c) 2013 Eric Le Bihan <eric.le.bihan.dev@free.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import unittest
+from ptraceplus.timerwheel import TimerWheel
+
+
+class TestTimerWheel(unittest.TestCase):
+    """Timer wheel tests"""
+
+    def test_expire_in_order(self):
+        """Test if the timers expire on time, by expiration time"""
+        wheel = TimerWheel(0.001, 8, 10.0)
+        wheel.schedule(10.0035, 'b')
+        wheel.schedule(10.0015, 'a')
+        wheel.schedule(10.0200, 'c')
+        self.assertEqual(len(wheel), 3)
+        self.assertAlmostEqual(wheel.next_deadline(), 10.002)
+        self.assertEqual(wheel.advance(10.0019), [])
+        self.assertEqual(wheel.advance(10.004), ['a', 'b'])
+        self.assertAlmostEqual(wheel.next_deadline(), 10.020)
+        self.assertEqual(wheel.advance(10.5), ['c'])
+        self.assertEqual(len(wheel), 0)
+        self.assertIsNone(wheel.next_deadline())
+
+    def test_never_early(self):
+        """Test if a timer in the past expires on the next tick"""
+        wheel = TimerWheel(0.001, 8, 1.0)
+        wheel.schedule(0.5, 'late')
+        self.assertEqual(wheel.advance(1.0), [])
+        self.assertEqual(wheel.advance(1.002), ['late'])
+
+    def test_cancel(self):
+        """Test if a cancelled timer does not expire"""
+        wheel = TimerWheel(0.001, 8)
+        timer = wheel.schedule(0.002, 'a')
+        wheel.schedule(0.010, 'b')
+        wheel.cancel(timer)
+        self.assertEqual(len(wheel), 1)
+        self.assertEqual(wheel.advance(1.0), ['b'])
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim: ts=4 sts=4 sw=4 sta et ai
@@ -55,6 +55,14 @@ class TestTracerSpawn(unittest.TestCase):
         args = [os.path.join(DATA_DIR, p) for p in ('father', 'child')]
         self._tracer.spawn_process(args)
 
+    def test_spawn_processes(self):
+        """Test if several processes can be spawned at once"""
+        args = [os.path.join(DATA_DIR, p) for p in ('father', 'child')]
+        procs = self._tracer.spawn_processes([list(args), list(args)])
+        self.assertEqual(len(procs), 2)
+        for proc in procs:
+            self.assertIn(proc.pid, self._tracer)
+
     def tearDown(self):
         self._tracer.quit()
 
@@ -42,6 +42,48 @@ class TestSpawnChild(unittest.TestCase):
         """Test if error is raised when child program can not be found"""
         self.assertRaises(utils.SpawnError, utils.spawn_child, ['frob'])
 
+    def test_find_program_cached(self):
+        """Test if the lookups of programs in path are cached"""
+        path = utils.find_program('ls')
+        hits = utils._search_path.cache_info().hits
+        self.assertEqual(utils.find_program('ls'), path)
+        self.assertEqual(utils._search_path.cache_info().hits, hits + 1)
+
+    def test_close_fds(self):
+        """Test if file descriptors are closed before executing a child"""
+        fd = os.open(os.devnull, os.O_RDONLY)
+        pid = os.fork()
+        if pid == 0:
+            utils.close_fds(3)
+            try:
+                os.fstat(fd)
+            except OSError:
+                os._exit(0)
+            os._exit(1)
+        os.close(fd)
+        pid, status = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+
+
+class TestProcessTree(unittest.TestCase):
+
+    def test_list_threads(self):
+        """Test if the threads of a process can be listed"""
+        tids = utils.list_threads(os.getpid())
+        self.assertEqual(tids[0], os.getpid())
+
+    def test_list_process_tree(self):
+        """Test if the descendants of a process can be listed"""
+        pid = os.fork()
+        if pid == 0:
+            os.execv('/bin/sleep', ['sleep', '1'])
+        try:
+            tids = utils.list_process_tree(os.getpid())
+            self.assertIn(pid, tids)
+        finally:
+            os.kill(pid, 9)
+            os.waitpid(pid, 0)
+
 if __name__ == '__main__':
     unittest.main()
 